@@ -8,14 +8,18 @@ Allows to control a CNC driven by a grblShield
 import sys
 import time
 import pprint
+import asyncio
 
 import src.gc.ui as ui
 import src.gc.menu as menu
 import src.gc.keyboard as keyboard
 import src.gc.joystick as joystick
 import src.gc.grbl.grbl as grbl
+import src.gc.grbl.asyncgrbl as asyncgrbl
 import src.gc.grbl.probe as probe
+import src.gc.grbl.jogger as jogger
 import src.gc.macro as macro
+import src.gc.job as job
 import src.gc.test as test
 from src.gc.config import cfg, loadedCfg
 
@@ -40,13 +44,21 @@ mnu = menu.Menu(kb, ui)
 # grbl machine manager
 mch = grbl.Grbl(cfg, ui)
 
+# asyncio front-end (machine status and idle waits, see waitForMachineIdle())
+loop = asyncio.new_event_loop()
+amch = asyncgrbl.AsyncGrbl(cfg, ui, mch)
+
 # grbl probe manager
 prb = probe.Probe(cfg, ui, mch)
 
 # joystick manager
 joy = joystick.Joystick(cfg, ui)
 
+# continuous jog manager (joystick)
+jgr = jogger.Jogger(cfg, ui, mch)
+
 mcr = macro.Macro(cfg, kb, ui, mch)
+jb = job.Job(cfg, kb, ui, mch)
 tst = test.Test(cfg, kb, ui, mch)
 
 # Jog distance
@@ -77,12 +89,31 @@ def sendCommand(command):
   if mch.stripCommand(command) == mch.GRBL_HOMING_CYCLE:
     homing = True
 
-  mch.sendWait(command)
+  sendWait(command)
 
   if homing:
     sendStartupMacro()
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def sendWait(command):
+  if not command:
+    return
+
+  mch.send(command)
+  waitForMachineIdle()
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def waitForMachineIdle():
+  return amch.run(amch.waitForMachineIdle())
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getMachineStatus():
+  return amch.run(amch.getMachineStatus())
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 def sendStartupMacro():
   ui.logTitle('Sending startup macro')
@@ -96,7 +127,7 @@ def sendStartupMacro():
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 def showMachineStatus():
-  mch.getMachineStatus()
+  getMachineStatus()
 
   statusStr = ''
 
@@ -104,6 +135,7 @@ def showMachineStatus():
   statusStr += '\n'
   statusStr += 'Alarm    [{:s}]\n'.format(ui.color(mch.getAlarmStr(), 'ui.errorMsg'))
   statusStr += 'Msg      [{:s}]\n'.format(ui.color(mch.getLastMessage(), 'ui.msg'))
+  statusStr += 'Polling  [{:s}]\n'.format(mch.getStatusPollRateStr())
   statusStr += '\n'
   statusStr += 'MPos     [{:s}]\n'.format(mch.getMachinePosStr())
   statusStr += 'WCO      [{:s}]\n'.format(mch.getWorkCoordinatesStr())
@@ -156,7 +188,7 @@ def showMachineLongStatus():
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 def showMachineFullStatus():
-  machineStatus=mch.getMachineStatus()
+  machineStatus=getMachineStatus()
 
   ui.logBlock(
   '''
@@ -165,7 +197,7 @@ def showMachineFullStatus():
   {:s}
   '''.format(
       mch.getColoredMachineStateStr(),
-      pprint.pformat(machineStatus, indent=2, width=uiCfg['maxLineLen'])
+      pprint.pformat(machineStatus.asDict(), indent=2, width=uiCfg['maxLineLen'])
     ))
 
 
@@ -191,11 +223,16 @@ def processJoystickInput():
   #   status = joy.status[key]
   #   if status:
   #     print('jog: {:s}'.format(key))
-  ps = mch.status['parserState']
-  unitsDesc = ps['units']['desc']
+
+  # Special actions stop continuous jog
+  if not joy.enabled or joy.status['extraU'] or joy.status['extraD']:
+    jgr.update()
 
   # Special actions with 'extraU' pushed
-  if joy.status['extraU']:
+  if not joy.enabled:
+    processed = False
+
+  elif joy.status['extraU']:
     if joy.status['x+']:
       gXYJog = genericValueChanger(gXYJog, +1, 1, 100, loop=True, valueName='xyJog')
       ui.keyPressMessage('Change jog distance (XY) (+1) ({:})'.format(gXYJog))
@@ -244,49 +281,21 @@ def processJoystickInput():
     else:
       processed = False
 
-  # Normal actions
-  elif joy.status['y-'] and joy.status['x-']:
-    ui.keyPressMessage('JoyJog - [DL] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog*-1,y=gXYJog*-1)
-
-  elif joy.status['y-'] and joy.status['x+']:
-    ui.keyPressMessage('JoyJog - [DR] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog,y=gXYJog*-1)
-
-  elif joy.status['y+'] and joy.status['x-']:
-    ui.keyPressMessage('JoyJog - [UL] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog*-1,y=gXYJog)
-
-  elif joy.status['y+'] and joy.status['x+']:
-    ui.keyPressMessage('JoyJog - [UR] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog,y=gXYJog)
-
-  elif joy.status['y-']:
-    ui.keyPressMessage('JoyJog - [D] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(y=gXYJog*-1)
-
-  elif joy.status['y+']:
-    ui.keyPressMessage('JoyJog - [U] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(y=gXYJog)
-
-  elif joy.status['x-']:
-    ui.keyPressMessage('JoyJog - [L] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog*-1)
-
-  elif joy.status['x+']:
-    ui.keyPressMessage('JoyJog - [R] ({:} {:})'.format(gXYJog, unitsDesc))
-    mch.moveRelative(x=gXYJog)
-
-  elif joy.status['z+']:
-    ui.keyPressMessage('JoyJog (Z) up ({:} {:})'.format(gZJog, unitsDesc))
-    mch.moveRelative(x=0,y=0,z=gZJog)
+  # Normal actions (continuous jog)
+  else:
+    x = 1 if joy.status['x+'] else -1 if joy.status['x-'] else 0
+    y = 1 if joy.status['y+'] else -1 if joy.status['y-'] else 0
+    z = 1 if joy.status['z+'] else -1 if joy.status['z-'] else 0
 
-  elif joy.status['z-']:
-    ui.keyPressMessage('JoyJog (Z) down ({:} {:})'.format(gZJog, unitsDesc))
-    mch.moveRelative(x=0,y=0,z=gZJog*-1)
+    processed = jgr.update(x=x, y=y, z=z)
 
-  else:
-    processed = False
+    if processed and jgr.jogging:
+      dirName = ''
+      dirName += 'U' if y > 0 else 'D' if y < 0 else ''
+      dirName += 'L' if x < 0 else 'R' if x > 0 else ''
+      dirName += 'Z+' if z > 0 else 'Z-' if z < 0 else ''
+      ui.keyPressMessage('JoyJog - [{:}] (F{:.0f})'.format(dirName, jgr.feed))
+      return
 
   if processed:
     readyMsg()
@@ -353,10 +362,48 @@ def showMacro():
   mcr.show(macroName)
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def checkMacro():
+  ui.inputMsg('Enter macro name...')
+  macroName=kb.input()
+  mcr.check(macroName)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def runJob():
+  ui.inputMsg('Enter G-code file name...')
+  fileName=kb.input()
+  jb.run(fileName)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def resumeJob():
+  resumeInfo = jb.resumeInfo or {'fileName': '', 'line': 1}
+
+  ui.inputMsg('Enter G-code file name ({:})...'.format(resumeInfo['fileName']))
+  fileName=kb.input() or resumeInfo['fileName']
+  if fileName != resumeInfo['fileName']:
+    resumeInfo = {'fileName': fileName, 'line': 1}
+
+  lineNumber = ui.getUserInput('line number ({:d})'.format(resumeInfo['line']), int, resumeInfo['line'])
+  jb.resume(fileName, lineNumber)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def checkJob():
+  ui.inputMsg('Enter G-code file name...')
+  fileName=kb.input()
+  jb.check(fileName)
+  if cfg['job']['extents']:
+    jb.checkExtents(fileName, jb.simulator)
+  if cfg['job']['estimate']:
+    jb.estimate(fileName)
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 def goToWCHOHome():
-  mch.sendWait('G0X0Y0')
-  mch.sendWait('G0Z0')
+  sendWait('G0X0Y0')
+  sendWait('G0Z0')
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -596,10 +643,10 @@ def setupMenu():
   ])
 
   wcoHomeSubmenu = mnu.subMenu([
-    {'k':'xX',  'n':'x',   'h':mch.sendWait, 'ha':{'command':'G0X0'}},
-    {'k':'yY',  'n':'y',   'h':mch.sendWait, 'ha':{'command':'G0Y0'}},
-    {'k':'zZ',  'n':'z',   'h':mch.sendWait, 'ha':{'command':'G0Z0'}},
-    {'k':'wW',  'n':'xy',  'h':mch.sendWait, 'ha':{'command':'G0X0Y0'}},
+    {'k':'xX',  'n':'x',   'h':sendWait, 'ha':{'command':'G0X0'}},
+    {'k':'yY',  'n':'y',   'h':sendWait, 'ha':{'command':'G0Y0'}},
+    {'k':'zZ',  'n':'z',   'h':sendWait, 'ha':{'command':'G0Z0'}},
+    {'k':'wW',  'n':'xy',  'h':sendWait, 'ha':{'command':'G0X0Y0'}},
     {'k':'aA',  'n':'xyz', 'h':goToWCHOHome},
   ])
 
@@ -613,7 +660,8 @@ def setupMenu():
     {'k':'lL',  'n':'List macros',   'h':mcr.list},
     {'k':'rR',  'n':'Run macro',     'h':runMacro},
     {'k':'sS',  'n':'Show macro',    'h':showMacro},
-    {'k':'xX',  'n':'Reload macros', 'h':mcr.load},
+    {'k':'cC',  'n':'Check macro',   'h':checkMacro},
+    {'k':'xX',  'n':'Reload macros', 'h':mcr.load, 'ha':{'force':True}},
   ])
 
   testsSubmenu = mnu.subMenu([
@@ -643,6 +691,29 @@ def setupMenu():
     {'k':'gG',   'n':'Get GCode command for current WCO', 'h':getWCOResetCommand},
   ])
 
+  realTimeOptions = [
+    {'S':1, 'n':'Real-time commands (also available while running a job)'},
+    {'k':'!',            'n':'Feed hold',                    'h':mch.feedHold},
+    {'k':'~',            'n':'Cycle start / resume',         'h':mch.cycleStart},
+    {'I':1, 'k':'<CTRL><F1..F5>',  'n':'Feed override (100% / -10% / +10% / -1% / +1%)'},
+    {'I':1, 'k':'<CTRL><F6..F8>',  'n':'Rapid override (100% / 50% / 25%)'},
+    {'I':1, 'k':'<CTRL><F9..F12>', 'n':'Spindle override (100% / -10% / +10% / stop)'},
+    {'H':1, 'k':'CTRL_F1',  'n':'Feed override 100%',    'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_FEED_OVR_RESET}},
+    {'H':1, 'k':'CTRL_F2',  'n':'Feed override -10%',    'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_FEED_OVR_MINUS_10}},
+    {'H':1, 'k':'CTRL_F3',  'n':'Feed override +10%',    'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_FEED_OVR_PLUS_10}},
+    {'H':1, 'k':'CTRL_F4',  'n':'Feed override -1%',     'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_FEED_OVR_MINUS_1}},
+    {'H':1, 'k':'CTRL_F5',  'n':'Feed override +1%',     'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_FEED_OVR_PLUS_1}},
+    {'H':1, 'k':'CTRL_F6',  'n':'Rapid override 100%',   'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_RAPID_OVR_RESET}},
+    {'H':1, 'k':'CTRL_F7',  'n':'Rapid override 50%',    'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_RAPID_OVR_50}},
+    {'H':1, 'k':'CTRL_F8',  'n':'Rapid override 25%',    'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_RAPID_OVR_25}},
+    {'H':1, 'k':'CTRL_F9',  'n':'Spindle override 100%', 'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_SPINDLE_OVR_RESET}},
+    {'H':1, 'k':'CTRL_F10', 'n':'Spindle override -10%', 'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_SPINDLE_OVR_MINUS_10}},
+    {'H':1, 'k':'CTRL_F11', 'n':'Spindle override +10%', 'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_SPINDLE_OVR_PLUS_10}},
+    {'H':1, 'k':'CTRL_F12', 'n':'Spindle stop',          'h':mch.sendRealTime, 'ha':{'command':mch.GRBL_RT_SPINDLE_STOP}},
+  ]
+
+  jb.realTimeMenu = mnu.subMenu(realTimeOptions)
+
   probeSubmenu = mnu.subMenu([
     {'k':'1',   'n':'Basic probe',       'h':prb.basic},
     {'k':'2',   'n':'Two stage probe',   'h':prb.twoStage},
@@ -694,6 +765,13 @@ def setupMenu():
     {'H':1, 'k':'F11', 'n':'Macro ({:})', 'np': [lambda: getHk('F11')], 'h':mcr.runHotKeyMacro, 'xha':{'inName':'hotKey'}},
     {'H':1, 'k':'F12', 'n':'Macro ({:})', 'np': [lambda: getHk('F12')], 'h':mcr.runHotKeyMacro, 'xha':{'inName':'hotKey'}},
 
+    {'S':1, 'n':'Job'},
+    {'k':'oO',           'n':'Run G-code file',                         'h':runJob},
+    {'k':'kK',           'n':'Check G-code file (simulation)',          'h':checkJob},
+    {'k':'uU',           'n':'Resume G-code file (from a line)',        'h':resumeJob},
+
+    *realTimeOptions,
+
     {'S':1, 'n':'Jog'},
     {'I':1, 'k':'<numpad>',             'n':'XY jog ({:}{:}) (including diagonals)', 'np': [lambda: gXYJog, unitsDesc]},
     {'I':1, 'k':'<cursor>',             'n':'XY jog ({:}{:})',                       'np': [lambda: gXYJog, unitsDesc]},
@@ -766,6 +844,7 @@ def main():
   ui.logTitle('Grbl connection')
   mch.onParserStateChanged.append(onParserStateChanged)   # Register parserStateChanged listener
   mch.start()     # Start connection
+  loop.run_until_complete(amch.attach())
 
   ui.logTitle('Joystick connection')
   joy.start()
@@ -812,6 +891,8 @@ if __name__ == '__main__':
     main()
   finally:
     ui.log('Closing grbl connection...')
+    loop.run_until_complete(amch.detach())
+    loop.close()
     mch.stop()
 
     ui.log('Stopping keyboard hook...')
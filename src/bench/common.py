@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - common
+==============================
+Common benchmark helpers
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import copy
+import time
+
+from src.cfg.default import cfg as defaultCfg
+import src.gc.ui as ui
+import src.gc.grbl.grbl as grbl
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getSilentGrbl():
+  ''' Get a Grbl object (not connected) logging nothing '''
+  cfg = copy.deepcopy(defaultCfg)
+  silentUI = ui.UI(cfg, None)
+  silentUI.setVerboseLevel(0)
+  return grbl.Grbl(cfg, silentUI)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def timeIt(function, passes):
+  ''' Run function passes times, return the best time (seconds) '''
+  best = None
+
+  for _ in range(passes):
+    startTime = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - startTime
+    best = elapsed if best is None else min(best, elapsed)
+
+  return best
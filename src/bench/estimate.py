@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - estimate
+================================
+Job time estimator throughput
+
+Writes the same dense toolpath as the simulator benchmark (see simulate.py)
+to a temporary file and estimates it with Estimator.estimateFile(), with
+NumPy (if installed), in pure Python and re-opening it from the toolpath
+cache (no text parsing).
+
+Usage: python3 -m src.bench.estimate [lines] [passes]
+'''
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+
+from src.cfg.default import cfg as defaultCfg
+import src.gc.gcode.estimator as estimator
+import src.gc.gcode.toolpath as toolpath
+
+from . import common
+from . import simulate
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  lineCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+  passes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+  cfg = copy.deepcopy(defaultCfg)
+  cfg['job']['toolpathCacheFolder'] = tempfile.mkdtemp()
+  cache = toolpath.ToolpathCache(cfg)
+
+  with tempfile.NamedTemporaryFile('w', suffix='.nc', delete=False) as file:
+    simulate.writeProgram(file, lineCount)
+    fileName = file.name
+
+  modes = [('numpy', estimator.numpy, None), ('python', None, None)] if estimator.numpy else [('python', None, None)]
+  modes.append(('cached', estimator.numpy, cache))
+
+  try:
+    # Fill the cache
+    estimator.Estimator(cfg, cache=cache).estimateFile(fileName)
+
+    for mode, module, modeCache in modes:
+      saved = estimator.numpy
+      estimator.numpy = module
+      est = estimator.Estimator(cfg, cache=modeCache)
+      result = []
+
+      def estimate():
+        est.reset()
+        result[:] = [est.estimateFile(fileName)]
+
+      try:
+        best = common.timeIt(estimate, passes)
+      finally:
+        estimator.numpy = saved
+
+      print('Estimator.estimateFile() [{:}]: {:d} lines ({:d} bytes), best of {:d}: {:.2f}s - {:.0f} lines/s'.format(
+        mode, result[0].lines, os.path.getsize(fileName), passes, best, result[0].lines / best))
+      print('  ' + result[0].getSummaryStr())
+      print('  ' + result[0].getProfileStr())
+  finally:
+    os.remove(fileName)
+    shutil.rmtree(cfg['job']['toolpathCacheFolder'])
+
+
+if __name__ == '__main__':
+  main()
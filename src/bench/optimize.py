@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - optimize
+================================
+G-code optimizer benchmark
+
+Runs sample dense toolpaths through the optimizer and reports, for each one:
+  - Lines and bytes before/after
+  - Serial transfer time at the configured baud rate (10 bits per byte)
+  - Optimizer throughput (lines/s)
+
+Job time is approximated as max(serial time, path length / feed) plus
+grbl's per-line planner overhead (see PLANNER_LINE_TIME), which is what
+dense toolpaths usually hit first.
+
+Usage: python3 -m src.bench.optimize [passes]
+'''
+
+import copy
+import math
+import sys
+
+from src.cfg.default import cfg as defaultCfg
+import src.gc.gcode.optimizer as optimizer
+import src.gc.grbl.dict as dict
+
+from . import common
+
+# Approximate per-line planner/parser time on an ATmega328p grbl
+PLANNER_LINE_TIME = 0.0015
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def circles():
+  ''' Pocket made of concentric circles, 0.5 degree segments '''
+  lines = ['G21', 'G90', 'G17', 'G0Z5', 'G0X10Y0', 'G1Z-1F300']
+  for ring in range(1, 11):
+    radius = ring * 2.0
+    lines.append('G1X{:.4f}Y0F800'.format(10 + radius))
+    for step in range(1, 721):
+      angle = math.radians(step * 0.5)
+      lines.append('G1X{:.4f}Y{:.4f}'.format(10 + radius * math.cos(angle), radius * math.sin(angle)))
+  lines.append('G0Z5')
+  return lines
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def raster():
+  ''' Raster surfacing, each pass split in 0.1mm segments (typical CAM/image output) '''
+  lines = ['G21', 'G90', 'G0Z5', 'G0X0Y0', 'G1Z-0.5F300', 'F1200']
+  for row in range(40):
+    y = row * 0.5
+    xs = range(0, 501) if row % 2 == 0 else range(500, -1, -1)
+    for x in xs:
+      lines.append('G1X{:.3f}Y{:.3f}'.format(x * 0.1, y))
+  lines.append('G0Z5')
+  return lines
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def sine():
+  ''' Engraved sine wave (curvature changes on every segment) '''
+  lines = ['G21', 'G90', 'G0Z5', 'G0X0Y0', 'G1Z-0.2F300', 'F600']
+  for step in range(1, 4001):
+    x = step * 0.025
+    lines.append('G1X{:.4f}Y{:.4f}'.format(x, 5 * math.sin(x / 4)))
+  lines.append('G0Z5')
+  return lines
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getJobTime(lines, baudRate):
+  ''' Approximate job time (s) for a program '''
+  pos = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}
+  motion = 'G0'
+  feed = 0.0
+  cutTime = 0.0
+  byteCount = 0
+
+  for line in lines:
+    byteCount += len(line) + 1
+    words = {}
+    for letter, number in dict.blockWordRE.findall(line.upper()):
+      if letter == 'G':
+        if float(number) in (0, 1, 2, 3):
+          motion = 'G{:g}'.format(float(number))
+      else:
+        words[letter] = float(number)
+
+    feed = words.get('F', feed)
+    target = {axis: words.get(axis, pos[axis]) for axis in pos}
+    if motion in ('G2', 'G3') and 'I' in words:
+      radius = math.hypot(words['I'], words.get('J', 0))
+      cx, cy = pos['X'] + words['I'], pos['Y'] + words.get('J', 0)
+      start = math.atan2(pos['Y'] - cy, pos['X'] - cx)
+      end = math.atan2(target['Y'] - cy, target['X'] - cx)
+      sweep = (start - end) if motion == 'G2' else (end - start)
+      length = radius * (sweep % (2 * math.pi))
+    else:
+      length = math.sqrt(sum([(target[axis] - pos[axis]) ** 2 for axis in pos]))
+
+    if motion != 'G0' and feed:
+      cutTime += length / feed * 60
+    pos = target
+
+  serialTime = byteCount * 10 / baudRate
+  return max(serialTime, cutTime) + len(lines) * PLANNER_LINE_TIME, serialTime, byteCount
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  passes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+  cfg = copy.deepcopy(defaultCfg)
+  cfg['job']['optimize'] = True
+  baudRate = cfg['serial']['baudRate']
+  opt = optimizer.Optimizer(cfg)
+
+  for name, generator in [('circles', circles), ('raster', raster), ('sine', sine)]:
+    lines = generator()
+
+    optimized = []
+    def optimize():
+      opt.reset()
+      optimized[:] = list(opt.optimizeLines(lines))
+
+    best = common.timeIt(optimize, passes)
+
+    timeIn, serialIn, bytesIn = getJobTime(lines, baudRate)
+    timeOut, serialOut, bytesOut = getJobTime(optimized, baudRate)
+
+    print('{:8s}: lines {:6d} -> {:6d} | bytes {:7d} -> {:7d} | serial {:6.1f}s -> {:6.1f}s | job ~{:6.1f}s -> {:6.1f}s | {:.0f} lines/s'.format(
+      name, len(lines), len(optimized), bytesIn, bytesOut, serialIn, serialOut,
+      timeIn, timeOut, len(lines) / best))
+    print('          {:s}'.format(opt.getStatsStr()))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - parallel
+================================
+Multi-process G-code file analysis speed-up
+
+Writes the same dense toolpath as the simulator benchmark (see simulate.py)
+to a temporary file and estimates it (no cache) in a single process and with
+ParallelEstimator on 2, 4 and 8 processes, checking all of them get the same
+estimate.
+
+Only parsing runs in parallel (the planner model is solved afterwards, in
+the main process), the speed-up depends on the CPUs available
+(os.cpu_count() is shown).
+
+Usage: python3 -m src.bench.parallel [lines] [passes]
+'''
+
+import copy
+import os
+import sys
+import tempfile
+
+from src.cfg.default import cfg as defaultCfg
+import src.gc.gcode.parallel as parallel
+
+from . import common
+from . import simulate
+
+PROCESSES = (1, 2, 4, 8)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  lineCount = int(sys.argv[1]) if len(sys.argv) > 1 else 4000000
+  passes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+  cfg = copy.deepcopy(defaultCfg)
+  cfg['job']['toolpathCacheSize'] = 0
+  cfg['job']['parallelMinSize'] = 0
+
+  with tempfile.NamedTemporaryFile('w', suffix='.nc', delete=False) as file:
+    simulate.writeProgram(file, lineCount)
+    fileName = file.name
+
+  print('{:d} lines ({:d} bytes), {:} CPUs'.format(lineCount, os.path.getsize(fileName), os.cpu_count()))
+
+  try:
+    single = None
+    reference = None
+
+    for processes in PROCESSES:
+      cfg['job']['analysisProcesses'] = processes
+      est = parallel.ParallelEstimator(cfg)
+      result = []
+
+      def estimate():
+        est.reset()
+        result[:] = [est.estimateFile(fileName)]
+
+      best = common.timeIt(estimate, passes)
+      single = single or best
+      summary = result[0].getSummaryStr()
+      reference = reference or summary
+
+      print('ParallelEstimator.estimateFile() [{:d} process{:}]: best of {:d}: {:.2f}s - {:.0f} lines/s - x{:.2f}{:}'.format(
+        processes, '' if processes == 1 else 'es', passes, best, result[0].lines / best, single / best,
+        '' if summary == reference else ' - DIFFERENT RESULT: ' + summary))
+
+    print('  ' + reference)
+  finally:
+    os.remove(fileName)
+
+
+if __name__ == '__main__':
+  main()
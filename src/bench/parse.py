@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - parse
+=============================
+Grbl.parse() microbenchmark
+
+Replays a recorded mix of grbl output lines (streaming a job with
+periodic status/parser state queries, plus a $$ dump) through
+Grbl.parse() and reports lines per second.
+
+Usage: python3 -m src.bench.parse [passes]
+'''
+
+import sys
+
+from . import common
+from src.gc.grbl import ticket
+
+# Recorded while streaming a job (one status query every ~20 lines)
+RECORDING = '''ok
+ok
+ok
+<Run|MPos:12.400,33.100,-1.000|Bf:12,87|FS:800,10000|WCO:0.000,0.000,-20.000>
+ok
+ok
+ok
+ok
+ok
+ok
+ok
+<Run|MPos:12.900,33.550,-1.000|Bf:13,64|FS:800,10000|Ov:100,100,100>
+ok
+ok
+ok
+ok
+[GC:G1 G54 G17 G21 G90 G94 M3 M9 T0 F800 S10000]
+ok
+ok
+ok
+ok
+ok
+<Run|MPos:13.250,34.075,-1.000|Bf:11,92|FS:800,10000>
+ok
+ok
+ok
+ok
+ok
+ok
+<Hold:0|MPos:13.300,34.100,-1.000|Bf:10,40|FS:0,10000|Pn:P>
+ok
+ok
+ok
+ok
+ok
+$0=10
+$1=25
+$2=0
+$3=0
+$4=0
+$5=0
+$6=0
+$10=1
+$11=0.010
+$12=0.002
+$13=0
+$20=0
+$21=0
+$22=1
+$23=3
+$24=25.000
+$25=500.000
+$26=250
+$27=1.000
+$30=1000
+$31=0
+$32=0
+$100=250.000
+$101=250.000
+$102=250.000
+$110=500.000
+$111=500.000
+$112=500.000
+$120=10.000
+$121=10.000
+$122=10.000
+$130=200.000
+$131=200.000
+$132=200.000
+ok'''.split('\n')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  passes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  repeat = 200
+
+  mch = common.getSilentGrbl()
+  # As read from the serial port
+  lines = [line.encode('utf-8') for line in RECORDING] * repeat
+  oks = len([line for line in lines if line == b'ok'])
+
+  def replay():
+    # Every 'ok' acknowledges a streamed line
+    for _ in range(oks):
+      mch.pendingTickets.append(ticket.Ticket('G1X1', streamed=True, showResponse=False))
+    for line in lines:
+      mch.parse(line)
+
+  best = common.timeIt(replay, passes)
+
+  print('Grbl.parse(): {:d} lines, best of {:d}: {:.3f}s - {:.0f} lines/s'.format(
+    len(lines), passes, best, len(lines) / best))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - simulate
+================================
+G-code simulator throughput
+
+Writes a dense toolpath (spiral pocket made of tiny G1 segments, with
+comments and modal changes from time to time) to a temporary file and
+checks it with Simulator.checkFile().
+
+Usage: python3 -m src.bench.simulate [lines] [passes]
+'''
+
+import copy
+import math
+import os
+import sys
+import tempfile
+
+from src.cfg.default import cfg as defaultCfg
+import src.gc.gcode.simulator as simulator
+
+from . import common
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def writeProgram(file, lineCount):
+  ''' Write a sample program '''
+  file.write('(bench program)\nG21 G90 G94 G17\nM3 S10000\nG0 X50 Y50 Z5\nG1 Z-1 F300\nF1200\n')
+
+  for line in range(lineCount):
+    angle = line * 0.002
+    radius = 40 * (line % 100000) / 100000
+    file.write('X{:.3f} Y{:.3f}\n'.format(50 + radius * math.cos(angle), 50 + radius * math.sin(angle)))
+
+    # A pass change every 100000 lines
+    if line % 100000 == 99999:
+      file.write('(next pass)\nG0 Z5\nG0 X50 Y50\nG1 Z-1 F300\nF1200\n')
+
+  file.write('G0 Z5\nM5\nM30\n')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  lineCount = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+  passes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+  sim = simulator.Simulator(copy.deepcopy(defaultCfg))
+
+  with tempfile.NamedTemporaryFile('w', suffix='.nc', delete=False) as file:
+    writeProgram(file, lineCount)
+    fileName = file.name
+
+  try:
+    def check():
+      sim.reset()
+      sim.checkFile(fileName)
+
+    best = common.timeIt(check, passes)
+    print('Simulator.checkFile(): {:d} lines ({:d} bytes), best of {:d}: {:.2f}s - {:.0f} lines/s'.format(
+      sim.lines, os.path.getsize(fileName), passes, best, sim.lines / best))
+    print(sim.getSummaryStr())
+  finally:
+    os.remove(fileName)
+
+
+if __name__ == '__main__':
+  main()
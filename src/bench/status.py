@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+'''
+grblCommander - bench - status
+==============================
+Status report parsing microbenchmark
+
+Replays status reports through Grbl.parse(), both as raw bytes (as read
+from the serial port) and as decoded text, and reports the time per report.
+
+Usage: python3 -m src.bench.status [passes]
+'''
+
+import sys
+
+from . import common
+
+# Recorded while running a job (with a feed hold)
+REPORTS = [
+  '<Run|MPos:12.400,33.100,-1.000|Bf:12,87|FS:800,10000|WCO:0.000,0.000,-20.000>',
+  '<Run|MPos:12.900,33.550,-1.000|Bf:13,64|FS:800,10000|Ov:100,100,100>',
+  '<Run|MPos:13.250,34.075,-1.000|Bf:11,92|FS:800,10000>',
+  '<Hold:0|MPos:13.300,34.100,-1.000|Bf:10,40|FS:0,10000|Pn:P>',
+]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def main():
+  passes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  repeat = 5000
+
+  mch = common.getSilentGrbl()
+  rawReports = [report.encode('utf-8') for report in REPORTS] * repeat
+
+  def replayBytes():
+    for report in rawReports:
+      mch.parse(report)
+
+  def replayText():
+    for report in rawReports:
+      mch.parse(report.decode('utf-8'))
+
+  results = {}
+  for name, replay in [('bytes', replayBytes), ('text', replayText)]:
+    best = common.timeIt(replay, passes)
+    results[name] = best / len(rawReports) * 1000000
+    print('Grbl.parse() [{:5s}]: {:d} reports, best of {:d}: {:.3f}s - {:.0f} reports/s - {:.2f}us/report'.format(
+      name, len(rawReports), passes, best, len(rawReports) / best, results[name]))
+
+  print('Saving per report: {:.2f}us'.format(results['text'] - results['bytes']))
+
+
+if __name__ == '__main__':
+  main()
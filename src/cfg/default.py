@@ -21,6 +21,21 @@ cfg = {
     'portLinux': '/dev/ttyACM0',   # Change to match your Arduino's COM port
     'timeout': 0.1,
     'responseTimeout': 2,
+    'statusPollIntervals': {       # Machine status (?) query interval by machine state (seconds, 0: no polling)
+      'Run': 0.1,
+      'Jog': 0.1,
+      'Home': 0.2,
+      'Hold': 0.25,
+      'Door': 0.5,
+      'Check': 0.5,
+      'Alarm': 1,
+      'Idle': 1,
+      'Sleep': 0,
+      'default': 0.5,
+    },
+    'statusPollMinInterval': 0.05, # Fastest allowed query interval (seconds)
+    'parserStateCheckInterval': 0, # Parser state ($G) check interval (seconds, 0: disabled)
+    'minimizeLines': True,         # Remove comments/spaces/repeated modal words and round coords before sending
   },
 
   # ---[Machine configuration]--------------------------------------
@@ -76,6 +91,11 @@ cfg = {
       3: 'extraU',
       4: 'z+',
     },
+    'jogFeed': {                # Continuous jog max feed (mm/min)
+      'x': 2000,
+      'y': 2000,
+      'z': 500,
+    },
   },
 
   # ---[Macro configuration]--------------------------------------
@@ -101,6 +121,28 @@ cfg = {
     },
   },
 
+  # ---[Job configuration]--------------------------------------
+  'job': {
+    'optimize': False,            # Merge collinear G1 segments and fit arcs (G2/G3) in G-code files
+    'optimizeTolerance': 0.005,   # Max path deviation (mm, never more than grbl's $12)
+    'minArcSegments': 4,          # Min G1 segments replaced by an arc
+    'check': True,                # Simulate G-code files before running them (grbl errors, travel)
+    'checkMaxIssues': 20,         # Max issues shown by the simulator
+    'checkCacheSize': 8,          # Checked G-code files whose results are kept in memory (by content hash and start state)
+    'extents': True,              # Check G-code file and macro extents against machine travel before running them
+    'extentsCacheSize': 32,       # Programs whose extents are kept in memory (by content hash)
+    'estimate': True,             # Estimate job time before running G-code files and showing macros
+    'plannerBlocks': 15,          # grbl's planner lookahead (blocks), used by the estimator
+    'estimateMaxSections': 10,    # Max sections shown by the estimator (longest first)
+    'toolpathCacheFolder': 'cache/toolpaths', # Parsed G-code files (binary, reused while unchanged)
+    'toolpathCacheSize': 256,     # Max toolpath cache size (MB, 0: disabled)
+    'analysisProcesses': 0,       # Processes used to parse big files (0: one per CPU, 1: no pool)
+    'parallelMinSize': 8,         # Min file size parsed in parallel (MB)
+    'lineIndexFolder': 'cache/lines', # Line offset indexes (to resume stopped jobs)
+    'resumeZFeed': 100,           # Feed used to go down to the resume point (mm/min)
+    'resumeSpindleDelay': 3,      # Wait for the spindle to get up to speed when resuming (seconds, 0: don't)
+  },
+
   # ---[Test configuration]--------------------------------------
   'test': {
     'password': 'IAmSure',
@@ -0,0 +1,996 @@
+#!/usr/bin/python3
+'''
+gcode - estimator
+=================
+Job time estimator
+
+Estimates how long grbl takes to run a program (or macro) replaying what
+its planner does with each move:
+  - Arcs are split in segments like grbl does ($12 arc tolerance)
+  - Nominal speeds are limited by the per-axis max rates ($110-$112)
+  - Accelerations are limited by the per-axis accelerations ($120-$122)
+  - Junction speeds come from the junction deviation ($11)
+  - Only plannerBlocks moves are known ahead (the last one has to stop)
+  - Dwells, spindle/coolant changes and program pauses stop the machine
+Each block then follows a trapezoidal (or triangular) velocity profile.
+
+Results are the total time, the time per section (a section starts at each
+comment line, or macro header comment) and the expected feed profile: the
+share of the motion time spent at each fraction of the programmed feed.
+
+Moves are collected in a Toolpath (see toolpath.py, one entry per planner
+block) and solved at once, with NumPy when it's installed (pure Python
+otherwise, slower). With NumPy, blocks of plain absolute G0/G1 lines are
+also parsed at once. With a ToolpathCache, files already parsed (same
+content, modal state, feed and arc tolerance) skip parsing: toolpaths don't
+depend on the start position unless an arc or G93 move needed it (see
+placeStart()), those are only reused from the same one.
+
+Each axis is parsed relative to the start position until it's first moved
+to (or set at) an absolute coordinate, the start is added when solving: an
+unknown start (no machine, not idle, $23 not read) only leaves out that
+first absolute move on each axis (reported in the Estimate). Moves to other
+unknown places (G28, G30, G53, coordinate system changes...) count from the
+first known coordinate after them. Overrides and serial transfer time are
+ignored.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import array
+import bisect
+import hashlib
+import itertools
+import math
+import re
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from ..grbl import dict
+from .simulator import G_COMMANDS, M_COMMANDS, PLANES, DEFAULT_STATE, PROGRAM_END_STATE, OFFSET_COMMANDS, CHUNK_SIZE
+from .simulator import fastLineRE, compactTable, chunkTable, stripComments
+from . import toolpath
+
+# grbl's default settings, used when the machine's are not known
+DEFAULT_SETTINGS = {
+  11: 0.010,                          # Junction deviation (mm)
+  12: 0.002,                          # Arc tolerance (mm)
+  110: 500.0, 111: 500.0, 112: 500.0, # Max rates (mm/min)
+  120: 10.0, 121: 10.0, 122: 10.0,    # Accelerations (mm/s^2)
+}
+
+# Commands waiting for the planner to empty (the machine stops)
+SYNC_BEFORE = ['G4', 'G10', 'G28.1', 'G30.1', 'G92', 'G92.1', 'M3', 'M4', 'M5', 'M7', 'M8', 'M9']
+SYNC_AFTER = ['M0', 'M1', 'M2', 'M30']
+
+# Toolpath columns
+COLUMNS = toolpath.COLUMNS
+MOTIONS = toolpath.MOTIONS
+
+# NumPy types for the toolpath columns
+NUMPY_TYPES = {'d': 'float64', 'I': 'uint32', 'B': 'uint8'}
+
+# Moves shorter than this (mm) don't reach grbl's planner
+MIN_LENGTH = 1e-6
+
+# grbl's minimum feed rate (mm/s)
+MIN_SPEED = 1.0 / 60
+
+# Feed profile buckets (average speed / nominal speed)
+PROFILE_EDGES = [0.0, 0.25, 0.5, 0.75, 0.9, float('inf')]
+PROFILE_LABELS = ['<25%', '25-50%', '50-75%', '75-90%', '>90%']
+
+# Whole lines for the chunk parser (see Estimator.estimateChunk())
+chunkLineRE = re.compile(r'^' + fastLineRE.pattern + r'$', re.M)
+
+
+# ------------------------------------------------------------------
+# Estimate class
+
+class Estimate:
+  ''' Results of an estimation '''
+  __slots__ = ('time', 'motionTime', 'dwellTime', 'distance', 'blocks', 'lines', 'sections', 'profile', 'defaults',
+    'unknownStart')
+
+  def __init__(self):
+    self.time = 0.0         # Total (s)
+    self.motionTime = 0.0   # Moving (s)
+    self.dwellTime = 0.0    # G4 (s)
+    self.distance = 0.0     # Path length (mm)
+    self.blocks = 0         # Planner blocks
+    self.lines = 0          # Lines read
+    self.sections = []      # {'name', 'time', 'distance', 'feed' (mm/min)}
+    self.profile = []       # (label, share of motionTime)
+    self.defaults = []      # Settings not known (grbl's defaults used)
+    self.unknownStart = 0   # Moves from an unknown start position (not counted)
+
+  def getSummaryStr(self):
+    ''' Get a printable summary '''
+    return 'Estimated time: {:} ({:.1f}m path, {:d} blocks{:}){:}{:}'.format(
+      timeStr(self.time),
+      self.distance / 1000,
+      self.blocks,
+      ', {:} dwell'.format(timeStr(self.dwellTime)) if self.dwellTime else '',
+      ' - using grbl defaults for ${:}'.format(',$'.join(map(str, self.defaults))) if self.defaults else '',
+      ' - {:d} move(s) from an unknown start position not counted'.format(self.unknownStart) if self.unknownStart else '')
+
+  def getProfileStr(self):
+    ''' Get a printable feed profile '''
+    return 'Feed profile (time at % of programmed feed): ' + ' | '.join(
+      '{:} {:.0f}%'.format(label, share * 100) for label, share in self.profile)
+
+  def getSectionStrs(self, maxSections):
+    ''' Get printable section lines (longest first, at most maxSections) '''
+    sections = sorted(self.sections, key=lambda section: section['time'], reverse=True)
+    lines = ['{:>9}  {:7.0f}mm  {:6.0f}mm/min  {:}'.format(
+      timeStr(section['time']), section['distance'], section['feed'], section['name'])
+      for section in sections[:maxSections]]
+    if len(sections) > maxSections:
+      lines.append('{:>9}  ({:d} more sections)'.format('...', len(sections) - maxSections))
+    return lines
+
+
+# ------------------------------------------------------------------
+# Estimator class
+
+class Estimator:
+
+  def __init__(self, cfg, mch=None, cache=None):
+    ''' Construct an Estimator object.
+        mch (optional) provides settings, modal state and position.
+        cache (optional) is a ToolpathCache for files.
+    '''
+    self.cfg = cfg
+    self.mch = mch
+    self.cache = cache
+    self.plannerBlocks = cfg['job']['plannerBlocks']
+
+    self.reset()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def reset(self):
+    ''' Reset state (from the machine if available) and collected moves '''
+    self.state = DEFAULT_STATE.copy()
+    self.feed = 0.0
+    self.scale = 1.0
+    self.pos = [0.0, 0.0, 0.0]
+    self.startPos = [None, None, None]
+    self.startRows = [None, None, None]
+    self.startUsed = False
+
+    self.loadSettings()
+    if self.mch:
+      self.loadMachineState()
+
+    self.lines = 0
+    self.moves = 0
+    self.syncNext = True
+    self.dwellTime = 0.0
+    self.offsetsUsed = False
+    self.pieces = {name: [] for name, _ in COLUMNS}
+    self.pending = {name: array.array(typecode) for name, typecode in COLUMNS}
+    self.sections = [{'name': '(start)', 'start': 0, 'dwell': 0.0, 'named': False}]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def loadSettings(self):
+    ''' Get planner settings from the machine (grbl's defaults if not known) '''
+    settings = self.mch.status['settings'] if self.mch else {}
+    self.defaults = []
+    values = {}
+
+    for number, default in DEFAULT_SETTINGS.items():
+      try:
+        values[number] = float(settings[number]['val'])
+      except (KeyError, ValueError):
+        values[number] = default
+        self.defaults.append(number)
+
+    self.junctionDeviation = values[11]
+    self.arcTolerance = values[12]
+    self.maxRates = [values[110] / 60, values[111] / 60, values[112] / 60]
+    self.accelerations = [values[120], values[121], values[122]]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def loadMachineState(self):
+    ''' Get modal state and start position from the machine '''
+    status = self.mch.status
+
+    parserState = status['parserState']
+    for group in self.state:
+      if group in parserState:
+        self.state[group] = parserState[group]['val']
+    if 'feed' in parserState:
+      self.feed = float(parserState['feed']['val'])
+    self.scale = 25.4 if self.state['units'] == 'G20' else 1.0
+
+    settings = status['settings']
+    if 23 in settings and self.mch.getMachineState() == 'Idle':
+      report = 25.4 if settings.get(13, {}).get('val') == '1' else 1.0
+      wPos = status['WPos']
+      self.startPos = [wPos['x'] * report, wPos['y'] * report, wPos['z'] * report]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def estimateFile(self, fileName):
+    ''' Estimate a G-code file, returns an Estimate '''
+    path = self.getFileToolpath(fileName)
+    result = self.solve(path)
+    path.close()
+    return result
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def estimateLines(self, lines):
+    ''' Estimate a sequence of lines (raw, comments allowed), returns an Estimate '''
+    self.addLines(lines)
+    return self.solve(self.getToolpath())
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getCacheKey(self, contentHash):
+    ''' Get the toolpath cache key for a file's content hash (and the modal state) '''
+    return hashlib.sha1(repr((contentHash, self.state, self.feed, self.arcTolerance)).encode('utf-8')).hexdigest()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getCachedToolpath(self, key):
+    ''' Get a cached Toolpath for the current start position (None if not cached) '''
+    path = self.cache.get(key)
+    if path is None:
+      return None
+
+    if path.startUsed and path.start != self.startPos:
+      path.close()
+      return None
+
+    path.start = list(self.startPos)
+    return path
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getFileToolpath(self, fileName, contentHash=None):
+    ''' Get a G-code file's Toolpath (from the cache if available),
+        close() it when done. contentHash (optional) saves hashing the file.
+    '''
+    key = None
+    if self.cache:
+      key = self.getCacheKey(contentHash or toolpath.hashFile(fileName))
+      cached = self.getCachedToolpath(key)
+      if cached is not None:
+        return cached
+
+    self.parseFile(fileName)
+
+    result = self.getToolpath()
+    if key:
+      self.cache.put(key, result)
+    return result
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseFile(self, fileName):
+    ''' Collect the moves in a G-code file '''
+    with open(fileName, 'r', encoding='utf-8', errors='replace') as file:
+      self.parseStream(file)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseStream(self, file):
+    ''' Collect the moves in an open (text) file '''
+    while True:
+      lines = file.readlines(CHUNK_SIZE)
+      if not lines:
+        break
+      if not self.estimateChunk(lines):
+        self.addLines(lines)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getParseState(self):
+    ''' Get the parser state (to continue parsing somewhere else), pos is
+        relative to startPos on the relative axes (see getWorkPos())
+    '''
+    return {
+      'state': self.state.copy(),
+      'feed': self.feed,
+      'scale': self.scale,
+      'pos': list(self.pos),
+      'startPos': list(self.startPos),
+      'relative': [row is None for row in self.startRows],
+      'syncNext': self.syncNext,
+      'lines': self.lines,
+      'arcTolerance': self.arcTolerance,
+    }
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setParseState(self, parseState):
+    ''' Continue parsing from a getParseState() state '''
+    self.state = parseState['state'].copy()
+    self.feed = parseState['feed']
+    self.scale = parseState['scale']
+    self.pos = list(parseState['pos'])
+    self.startPos = list(parseState['startPos'])
+    self.startRows = [None if relative else row or 0 for relative, row in zip(parseState['relative'], self.startRows)]
+    self.syncNext = parseState['syncNext']
+    self.lines = parseState['lines']
+    self.arcTolerance = parseState['arcTolerance']
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def estimateChunk(self, lines):
+    ''' Fast path (NumPy only) for whole blocks of plain absolute G0/G1 lines
+        in G94 with a feed rate set: all moves are parsed at once.
+        Returns False (nothing done) if the block needs addLines().
+    '''
+    state = self.state
+    if numpy is None or not self.feed or state['motion'] not in ('G0', 'G1') \
+      or state['distanceMode'] != 'G90' or state['feedRateMode'] != 'G94':
+      return False
+
+    compact = ''.join(lines).translate(chunkTable).upper()
+    if '(' in compact or ';' in compact:
+      return False
+
+    # One row per line if (and only if) all lines are plain moves
+    rows = chunkLineRE.findall(compact)
+    if len(rows) != compact.count('\n') + 1:
+      return False
+
+    motions, xs, ys, zs, feeds = (numpy.array([float(value) if value else math.nan for value in column])
+      for column in zip(*rows))
+    if (feeds == 0).any():
+      return False
+
+    self.flushPending()
+
+    # Lines with axis words are moves (rows and lines match one to one)
+    moves = ~(numpy.isnan(xs) & numpy.isnan(ys) & numpy.isnan(zs))
+    count = int(moves.sum())
+
+    scale = self.scale
+    columns = {}
+    for index, (name, values) in enumerate(zip('xyz', (xs, ys, zs))):
+      if self.startRows[index] is None:
+        present = ~numpy.isnan(values[moves])
+        if present.any():
+          self.startRows[index] = self.moves + int(present.argmax())
+      first = math.nan if self.pos[index] is None else self.pos[index] / scale
+      values = fillForward(values, first)[1:]
+      columns[name] = values[moves] * scale
+      if not math.isnan(values[-1]):
+        self.pos[index] = values[-1] * scale
+
+    motions = fillForward(motions, 0.0 if state['motion'] == 'G0' else 1.0)[1:]
+    feeds = fillForward(feeds, self.feed)[1:]
+    columns['feed'] = feeds[moves] * scale
+    columns['line'] = numpy.arange(self.lines + 1, self.lines + 1 + len(rows), dtype='uint32')[moves]
+    columns['motion'] = motions[moves].astype('uint8')
+    columns['sync'] = numpy.zeros(count, dtype='uint8')
+    if count and self.syncNext:
+      columns['sync'][0] = 1
+      self.syncNext = False
+
+    for name, _ in COLUMNS:
+      self.pieces[name].append(columns[name])
+
+    state['motion'] = 'G0' if motions[-1] == 0 else 'G1'
+    self.feed = float(feeds[-1])
+    self.moves += count
+    self.lines += len(lines)
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addLines(self, lines):
+    ''' Collect the moves in a sequence of lines '''
+    fastMatch = fastLineRE.fullmatch
+
+    for line in lines:
+      self.lines += 1
+
+      if '(' in line or ';' in line:
+        code = stripComments(line).translate(compactTable)
+        if not code:
+          self.addSection(line.strip())
+          continue
+        line = code
+      compact = line.translate(compactTable).upper()
+
+      if not compact or compact == '%' or compact[0] == '$':
+        if compact[:2] == '$H':
+          self.offsetsUsed = True
+        continue
+
+      match = fastMatch(compact) if self.state['feedRateMode'] == 'G94' else None
+      if match and (match.group(1) or self.state['motion'] in ('G0', 'G1')):
+        self.addPlainMove(match.groups())
+      else:
+        self.addBlock(compact)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addSection(self, comment):
+    ''' Start a new section (empty sections take the first comment's name) '''
+    name = comment.strip('();').strip()
+    section = self.sections[-1]
+
+    if section['start'] == self.moves and not section['dwell']:
+      if not section['named']:
+        section['name'] = name
+        section['named'] = True
+      return
+
+    self.sections.append({'name': name, 'start': self.moves, 'dwell': 0.0, 'named': True})
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addPlainMove(self, groups):
+    ''' Fast path for [G0|G1][X][Y][Z][F] lines in G94 '''
+    motionWord, x, y, z, f = groups
+    motion = 'G' + motionWord if motionWord is not None else self.state['motion']
+    feed = self.feed if f is None else float(f)
+
+    # grbl rejects feed moves without a feed rate
+    if motion == 'G1' and not feed:
+      return
+
+    self.feed = feed
+    self.state['motion'] = motion
+
+    values = {}
+    for axis, value in zip('XYZ', (x, y, z)):
+      if value is not None:
+        values[axis] = float(value)
+    if values:
+      self.addMove(self.getTarget(values), feed * self.scale, MOTIONS[motion])
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addBlock(self, line):
+    ''' Collect the moves in any other block (lines grbl would reject are skipped) '''
+    commands = []
+    values = {}
+    try:
+      for letter, number in dict.blockWordRE.findall(line):
+        if letter in 'GM':
+          commands.append('{:}{:g}'.format(letter, float(number)))
+        else:
+          values[letter] = float(number)
+    except ValueError:
+      return
+
+    state = self.state
+    nonModal = None
+    for command in commands:
+      group = G_COMMANDS.get(command) or M_COMMANDS.get(command)
+      if group == 'nonModal':
+        nonModal = command
+        if command in OFFSET_COMMANDS:
+          self.offsetsUsed = True
+      elif group in state:
+        if group == 'wcs' and command != state['wcs']:
+          self.setPos({0: None, 1: None, 2: None})
+          self.offsetsUsed = True
+        state[group] = command
+      elif group == 'toolLength':
+        self.setPos({2: None})
+        self.offsetsUsed = True
+
+    self.scale = scale = 25.4 if state['units'] == 'G20' else 1.0
+    inverseTime = state['feedRateMode'] == 'G93'
+    feed = values.get('F', 0.0 if inverseTime else self.feed)
+    if not inverseTime:
+      self.feed = feed
+
+    if any(command in SYNC_BEFORE for command in commands):
+      self.syncNext = True
+    if nonModal == 'G4':
+      self.addDwell(values.get('P', 0.0))
+
+    axisWords = {axis: values[axis] for axis in 'XYZ' if axis in values}
+
+    if nonModal in ('G28', 'G30'):
+      if axisWords:
+        self.addMove(self.getTarget(axisWords), self.feed * scale, MOTIONS['G0'])
+      self.setPos({0: None, 1: None, 2: None})
+    elif nonModal == 'G53':
+      self.setPos({index: None for index, axis in enumerate('XYZ') if axis in axisWords})
+    elif nonModal == 'G92' or (nonModal == 'G10' and values.get('L') == 20 and self.isCurrentWcs(values)):
+      self.setPos({index: axisWords[axis] * scale for index, axis in enumerate('XYZ') if axis in axisWords})
+    elif (nonModal == 'G10' and values.get('L') == 2 and self.isCurrentWcs(values)) or nonModal == 'G92.1':
+      self.setPos({0: None, 1: None, 2: None})
+    elif nonModal is None and axisWords and state['motion'] != 'G80':
+      self.addMotion(state['motion'], axisWords, values, feed, inverseTime)
+
+    if any(command in SYNC_AFTER for command in commands):
+      self.syncNext = True
+      if 'M2' in commands or 'M30' in commands:
+        state.update(PROGRAM_END_STATE)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isCurrentWcs(self, values):
+    ''' Check if a G10's P word selects the current coordinate system '''
+    number = int(values.get('P', 0))
+    return number == 0 or 'G{:d}'.format(53 + number) == self.state['wcs']
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addMotion(self, motion, axisWords, values, feed, inverseTime):
+    ''' Collect a G0/G1/G2/G3/G38.x move '''
+    if motion != 'G0' and not feed:
+      return
+
+    # Arcs and G93 lengths need both ends in the same coordinates
+    unknown = []
+    if motion in ('G2', 'G3') or (inverseTime and motion != 'G0'):
+      unknown = self.placeStart(axisWords)
+
+    target = self.getTarget(axisWords)
+
+    if motion in ('G2', 'G3') and not unknown:
+      points = self.getArcPoints(target, values, motion == 'G2')
+      if points is None:
+        return
+    else:
+      points = [target]
+
+    if inverseTime and motion != 'G0':
+      start = self.pos
+      length = 0.0
+      for point in points:
+        length += math.sqrt(sum((0.0 if a is None or b is None or index in unknown else a - b) ** 2
+          for index, (a, b) in enumerate(zip(point, start))))
+        start = point
+      feed = length * feed
+    else:
+      feed = self.feed * self.scale
+
+    code = MOTIONS[motion[:3]]
+    for point in points:
+      self.addMove(point, feed, code)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getTarget(self, axisWords):
+    ''' Get a move's target (mm), axes moved to absolute coordinates leave the start '''
+    target = list(self.pos)
+    incremental = self.state['distanceMode'] == 'G91'
+
+    for index, axis in enumerate('XYZ'):
+      if axis in axisWords:
+        value = axisWords[axis] * self.scale
+        if not incremental:
+          target[index] = value
+          self.leaveStart([index])
+        elif target[index] is not None:
+          target[index] += value
+
+    return target
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def placeStart(self, axisWords):
+    ''' Move the axes still relative to the start that get absolute words to
+        work coordinates (adding the start position).
+        Returns the ones that can't be moved (start position unknown).
+    '''
+    if self.state['distanceMode'] == 'G91':
+      return []
+
+    unknown = []
+    for index, axis in enumerate('XYZ'):
+      if axis in axisWords and self.startRows[index] is None:
+        self.startUsed = True
+        if self.startPos[index] is None:
+          unknown.append(index)
+          continue
+        self.pos[index] += self.startPos[index]
+        self.leaveStart([index])
+
+    return unknown
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def leaveStart(self, indexes):
+    ''' Mark axes as absolute (work coordinates) from the next segment on '''
+    for index in indexes:
+      if self.startRows[index] is None:
+        self.startRows[index] = self.moves
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getArcPoints(self, target, values, clockwise):
+    ''' Get the segment ends grbl splits an arc into (None: invalid or unknown arc) '''
+    axis0, axis1, offset0, offset1 = PLANES[self.state['plane']]
+    linear = 3 - axis0 - axis1
+    start = self.pos
+    if None in (start[axis0], start[axis1], target[axis0], target[axis1]):
+      return None
+
+    scale = self.scale
+    x = target[axis0] - start[axis0]
+    y = target[axis1] - start[axis1]
+
+    if 'R' in values:
+      radius = values['R'] * scale
+      h = 4 * radius * radius - x * x - y * y
+      distance = math.hypot(x, y)
+      if h < 0 or not distance:
+        return None
+      h = -math.sqrt(h) / distance
+      if not clockwise:
+        h = -h
+      if radius < 0:
+        h = -h
+        radius = -radius
+      i = 0.5 * (x - y * h)
+      j = 0.5 * (y + x * h)
+    else:
+      i = values.get(offset0, 0.0) * scale
+      j = values.get(offset1, 0.0) * scale
+      radius = math.hypot(i, j)
+
+    centerX = start[axis0] + i
+    centerY = start[axis1] + j
+    r0, r1 = -i, -j
+    t0, t1 = target[axis0] - centerX, target[axis1] - centerY
+
+    angularTravel = math.atan2(r0 * t1 - r1 * t0, r0 * t0 + r1 * t1)
+    if clockwise:
+      if angularTravel >= -5e-7:
+        angularTravel -= 2 * math.pi
+    elif angularTravel <= 5e-7:
+      angularTravel += 2 * math.pi
+
+    tolerance = self.arcTolerance
+    segments = 0
+    if 2 * radius > tolerance:
+      segments = int(abs(0.5 * angularTravel * radius) / math.sqrt(tolerance * (2 * radius - tolerance)))
+
+    points = []
+    startLinear = start[linear]
+    linearTravel = None if startLinear is None or target[linear] is None else target[linear] - startLinear
+    for segment in range(1, segments):
+      angle = angularTravel * segment / segments
+      cos, sin = math.cos(angle), math.sin(angle)
+      point = list(target)
+      point[axis0] = centerX + r0 * cos - r1 * sin
+      point[axis1] = centerY + r0 * sin + r1 * cos
+      if linearTravel is not None:
+        point[linear] = startLinear + linearTravel * segment / segments
+      points.append(point)
+    points.append(target)
+
+    return points
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addMove(self, target, feed, motion):
+    ''' Store a move (feed in mm/min, motion code) and update position '''
+    pos = self.pos
+    self.pos = [pos[index] if target[index] is None else target[index] for index in range(3)]
+    self.storeSegment(feed, motion)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setPos(self, values):
+    ''' Set axes ({index: mm or None}) without moving (stored as a NONE segment) '''
+    self.leaveStart(values)
+    pos = [values.get(index, value) for index, value in enumerate(self.pos)]
+    if pos == self.pos:
+      return
+
+    self.pos = pos
+    self.storeSegment(0.0, MOTIONS['NONE'])
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def storeSegment(self, feed, motion):
+    ''' Store a segment ending at the current position '''
+    pending = self.pending
+
+    for name, value in zip('xyz', self.pos):
+      pending[name].append(math.nan if value is None else value)
+    pending['feed'].append(feed)
+    pending['line'].append(self.lines)
+    pending['motion'].append(motion)
+    pending['sync'].append(1 if self.syncNext and motion != MOTIONS['NONE'] else 0)
+
+    if motion != MOTIONS['NONE']:
+      self.syncNext = False
+    self.moves += 1
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addDwell(self, seconds):
+    ''' Store a dwell (G4) '''
+    self.dwellTime += seconds
+    self.sections[-1]['dwell'] += seconds
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def flushPending(self):
+    ''' Move the moves stored by addMove() to the piece lists '''
+    if not len(self.pending['x']):
+      return
+
+    for name, typecode in COLUMNS:
+      self.pieces[name].append(self.pending[name])
+      self.pending[name] = array.array(typecode)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getToolpath(self):
+    ''' Get a Toolpath with all the moves stored '''
+    self.flushPending()
+    columns = {}
+
+    for name, typecode in COLUMNS:
+      pieces = self.pieces[name]
+      if numpy is not None:
+        columns[name] = numpy.concatenate([numpy.asarray(piece, dtype=NUMPY_TYPES[typecode]) for piece in pieces]
+          or [numpy.zeros(0, dtype=NUMPY_TYPES[typecode])])
+      else:
+        columns[name] = array.array(typecode)
+        for piece in pieces:
+          columns[name].extend(piece)
+
+    sections = [[section['name'], section['start'], section['dwell']] for section in self.sections]
+    return toolpath.Toolpath(columns, self.startPos, sections, self.dwellTime, self.lines, self.offsetsUsed,
+      self.startRows, self.startUsed)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def solve(self, path):
+    ''' Plan all the moves in a Toolpath, returns an Estimate '''
+    columns = [path.columns[name] for name in ('x', 'y', 'z', 'feed', 'motion', 'sync')]
+
+    # Segments where each axis leaves the start: (axis, segment, start position, NaN: unknown)
+    starts = [(index, row, math.nan if start is None else start)
+      for index, (row, start) in enumerate(zip(path.startRows, path.start)) if row is not None and row < path.count]
+
+    if numpy is not None:
+      lengths, times, ratios, firstBlocks = self.solveNumpy(starts, *[numpy.asarray(column) for column in columns])
+      timeSums = numpy.concatenate(([0.0], numpy.cumsum(times)))
+      lengthSums = numpy.concatenate(([0.0], numpy.cumsum(lengths)))
+      profile = numpy.histogram(ratios, bins=PROFILE_EDGES, weights=times)[0]
+    else:
+      lengths, times, ratios, firstBlocks = self.solvePython(starts, *columns)
+      timeSums = [0.0] + list(itertools.accumulate(times))
+      lengthSums = [0.0] + list(itertools.accumulate(lengths))
+      profile = [0.0] * len(PROFILE_LABELS)
+      for ratio, time in zip(ratios, times):
+        profile[bisect.bisect_right(PROFILE_EDGES, ratio) - 1] += time
+
+    estimate = Estimate()
+    estimate.lines = path.lines
+    estimate.blocks = len(lengths)
+    estimate.motionTime = float(timeSums[-1])
+    estimate.dwellTime = path.dwellTime
+    estimate.time = estimate.motionTime + estimate.dwellTime
+    estimate.distance = float(lengthSums[-1])
+    estimate.defaults = self.defaults
+    estimate.unknownStart = len({row for _, row, start in starts
+      if math.isnan(start) and path.columns['motion'][row] != MOTIONS['NONE']})
+    estimate.profile = [(label, float(share) / estimate.motionTime if estimate.motionTime else 0.0)
+      for label, share in zip(PROFILE_LABELS, profile)]
+
+    ends = [start for _, start, _ in path.sections[1:]] + [path.count]
+    for (name, start, dwell), end in zip(path.sections, ends):
+      first, last = int(firstBlocks[start]), int(firstBlocks[end])
+      motionTime = float(timeSums[last] - timeSums[first])
+      distance = float(lengthSums[last] - lengthSums[first])
+      if not motionTime and not dwell:
+        continue
+      estimate.sections.append({
+        'name': name,
+        'time': motionTime + dwell,
+        'distance': distance,
+        'feed': distance / motionTime * 60 if motionTime else 0.0,
+      })
+
+    return estimate
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def solveNumpy(self, starts, x, y, z, feed, motion, sync):
+    ''' Plan all moves at once (NumPy), starts as in solve().
+        Returns per block lengths, times and average/nominal speed ratios
+        plus, per segment, the index of the first block at or after it.
+    '''
+    # Moves from (or to) unknown coordinates count from the first known one
+    deltas = [numpy.diff(values, prepend=0.0) for values in (x, y, z)]
+    for index, row, start in starts:
+      deltas[index][row] -= start
+    dx, dy, dz = (numpy.nan_to_num(values) for values in deltas)
+    noMotion = motion == MOTIONS['NONE']
+    for values in (dx, dy, dz):
+      values[noMotion] = 0.0
+    speed = numpy.where(motion == MOTIONS['G0'], -1.0, feed / 60)
+
+    lengths = numpy.sqrt(dx * dx + dy * dy + dz * dz)
+    keep = lengths > MIN_LENGTH
+    firstBlocks = numpy.concatenate(([0], numpy.cumsum(keep)))
+
+    # Dropped moves pass their stops on to the next block
+    syncSums = numpy.concatenate(([0.0], numpy.cumsum(sync)))
+    keptIndex = numpy.flatnonzero(keep)
+    previous = numpy.concatenate(([0], keptIndex[:-1] + 1))
+    sync = (syncSums[keptIndex + 1] - syncSums[previous]) > 0
+
+    lengths = lengths[keep]
+    count = len(lengths)
+    if not count:
+      return lengths, lengths, lengths, firstBlocks
+
+    units = numpy.stack((dx[keep], dy[keep], dz[keep])) / lengths
+    maxRates = numpy.array(self.maxRates)
+    accelerations = numpy.array(self.accelerations)
+
+    def limitByAxis(values, vectors):
+      with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.min(values[:, None] / numpy.abs(vectors), axis=0)
+
+    rapid = limitByAxis(maxRates, units)
+    speed = speed[keep]
+    nominal = numpy.maximum(numpy.where(speed < 0, rapid, numpy.minimum(speed, rapid)), MIN_SPEED)
+    nominal2 = nominal * nominal
+    accel = limitByAxis(accelerations, units)
+
+    # Junction speeds (squared), grbl's junction deviation model
+    cosTheta = -numpy.sum(units[:, 1:] * units[:, :-1], axis=0)
+    junction = units[:, 1:] - units[:, :-1]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      junction = junction / numpy.sqrt(numpy.sum(junction * junction, axis=0))
+      sinHalf = numpy.sqrt(numpy.maximum(0.5 * (1 - cosTheta), 0))
+      junction2 = limitByAxis(accelerations, junction) * self.junctionDeviation * sinHalf / (1 - sinHalf)
+    junction2 = numpy.where(cosTheta > 0.999999, 0.0, numpy.where(cosTheta < -0.999999, numpy.inf, junction2))
+
+    entry = numpy.empty(count + 1)
+    entry[0] = 0.0
+    entry[1:count] = numpy.minimum(junction2, numpy.minimum(nominal2[1:], nominal2[:-1]))
+    entry[count] = 0.0
+    entry[:count][sync] = 0.0
+
+    # Speed (squared) gained/lost along each block and lookahead window
+    change = 2 * accel * lengths
+    changeSums = numpy.concatenate(([0.0], numpy.cumsum(change)))
+    window = changeSums[numpy.minimum(numpy.arange(count + 1) + self.plannerBlocks, count)] - changeSums
+    entry = numpy.minimum(entry, window)
+
+    # Backward (deceleration) and forward (acceleration) passes
+    entry = numpy.minimum.accumulate((entry + changeSums)[::-1])[::-1] - changeSums
+    entry = numpy.maximum(changeSums + numpy.minimum.accumulate(entry - changeSums), 0.0)
+
+    # Trapezoid (or triangle) per block
+    entry2, exit2 = entry[:-1], entry[1:]
+    peak2 = numpy.maximum(numpy.minimum(nominal2, (change + entry2 + exit2) / 2), numpy.maximum(entry2, exit2))
+    peak = numpy.sqrt(peak2)
+    cruise = numpy.maximum(lengths - (2 * peak2 - entry2 - exit2) / (2 * accel), 0.0)
+    times = (2 * peak - numpy.sqrt(entry2) - numpy.sqrt(exit2)) / accel + cruise / peak
+
+    return lengths, times, lengths / times / nominal, firstBlocks
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def solvePython(self, starts, x, y, z, feed, motion, sync):
+    ''' Plan all moves (pure Python), same results as solveNumpy() '''
+    firstBlocks = [0]
+    lengths = []
+    units = []
+    nominal2 = []
+    accels = []
+    syncs = []
+    pendingSync = False
+    previous = (0.0, 0.0, 0.0)
+
+    offsets = {}
+    for axis, row, start in starts:
+      offsets.setdefault(row, [0.0, 0.0, 0.0])[axis] = start
+
+    for index in range(len(x)):
+      pendingSync = pendingSync or sync[index] > 0
+      point = (x[index], y[index], z[index])
+      vector = [a - b - offset for a, b, offset in zip(point, previous, offsets.get(index, (0.0, 0.0, 0.0)))]
+      vector = [0.0 if math.isnan(value) or motion[index] == MOTIONS['NONE'] else value for value in vector]
+      previous = point
+      length = math.sqrt(sum(value * value for value in vector))
+
+      if length > MIN_LENGTH:
+        unit = [value / length for value in vector]
+        rapid = self.limitByAxis(self.maxRates, unit)
+        speed = feed[index] / 60
+        nominal = max(rapid if motion[index] == MOTIONS['G0'] else min(speed, rapid), MIN_SPEED)
+        lengths.append(length)
+        units.append(unit)
+        nominal2.append(nominal * nominal)
+        accels.append(self.limitByAxis(self.accelerations, unit))
+        syncs.append(pendingSync)
+        pendingSync = False
+
+      firstBlocks.append(len(lengths))
+
+    count = len(lengths)
+    change = [2 * accels[index] * lengths[index] for index in range(count)]
+
+    # Entry speeds (squared): junctions, lookahead window, backward and forward passes
+    entry = [0.0] * (count + 1)
+    for index in range(1, count):
+      if syncs[index]:
+        continue
+      previous, unit = units[index - 1], units[index]
+      cosTheta = -sum(a * b for a, b in zip(previous, unit))
+      if cosTheta > 0.999999:
+        junction2 = 0.0
+      elif cosTheta < -0.999999:
+        junction2 = math.inf
+      else:
+        junction = [b - a for a, b in zip(previous, unit)]
+        norm = math.sqrt(sum(value * value for value in junction))
+        sinHalf = math.sqrt(max(0.5 * (1 - cosTheta), 0))
+        junction2 = self.limitByAxis(self.accelerations, [value / norm for value in junction]) \
+          * self.junctionDeviation * sinHalf / (1 - sinHalf)
+      entry[index] = min(junction2, nominal2[index], nominal2[index - 1])
+
+    changeSums = [0.0] + list(itertools.accumulate(change))
+    for index in range(count + 1):
+      entry[index] = min(entry[index], changeSums[min(index + self.plannerBlocks, count)] - changeSums[index])
+
+    for index in range(count - 1, -1, -1):
+      entry[index] = min(entry[index], entry[index + 1] + change[index])
+    for index in range(count):
+      entry[index + 1] = max(min(entry[index + 1], entry[index] + change[index]), 0.0)
+
+    times = []
+    ratios = []
+    for index in range(count):
+      entry2, exit2 = entry[index], entry[index + 1]
+      peak2 = max(min(nominal2[index], (change[index] + entry2 + exit2) / 2), entry2, exit2)
+      peak = math.sqrt(peak2)
+      cruise = max(lengths[index] - (2 * peak2 - entry2 - exit2) / (2 * accels[index]), 0.0)
+      time = (2 * peak - math.sqrt(entry2) - math.sqrt(exit2)) / accels[index] + cruise / peak
+      times.append(time)
+      ratios.append(lengths[index] / time / math.sqrt(nominal2[index]))
+
+    return lengths, times, ratios, firstBlocks
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def limitByAxis(self, values, unit):
+    ''' Limit a per-axis value (max rate, acceleration) along a direction '''
+    return min(value / abs(component) for value, component in zip(values, unit) if component)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getWorkPos(parseState):
+  ''' Get a parser state's position in work coordinates (None: unknown) '''
+  return [None if value is None or (relative and start is None) else value + start if relative else value
+    for value, start, relative in zip(parseState['pos'], parseState['startPos'], parseState['relative'])]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def fillForward(values, first):
+  ''' Replace NaNs with the last value before them (first: value before the array).
+      Returns the filled array, first included.
+  '''
+  values = numpy.concatenate(([first], values))
+  index = numpy.where(numpy.isnan(values), 0, numpy.arange(len(values)))
+  numpy.maximum.accumulate(index, out=index)
+  return values[index]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def timeStr(seconds):
+  ''' Format a time as [h:]mm:ss '''
+  minutes, seconds = divmod(int(round(seconds)), 60)
+  hours, minutes = divmod(minutes, 60)
+  return '{:d}:{:02d}:{:02d}'.format(hours, minutes, seconds) if hours else '{:02d}:{:02d}'.format(minutes, seconds)
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+'''
+gcode - extents
+===============
+Toolpath extents and soft limit pre-check
+
+Gets the bounding box of a program (or macro) in work and machine
+coordinates and checks it against the machine's travel before it runs:
+  - Connected (settings and offsets known): the machine bounding box has to
+    fit in Grbl.getMin()/getMax() (maxTravel minus softLimitsMargin)
+  - Offline: each axis span has to fit in maxTravel minus both margins
+
+Programs are streamed through the simulator (see simulator.py), or taken
+from a simulator that just checked them, and results are cached by content
+hash and start modal state. Files in the estimator's toolpath cache (see
+toolpath.py), or big enough to be parsed in parallel (see parallel.py),
+that don't touch the work offsets get their box from the toolpath instead
+(not simulated). Parsed toolpaths go to the cache, for the estimate.
+
+The start position is added to the boxes when building the result, so a
+cached result is still good after jogging, unless the program moves from
+it (incremental moves or arcs before its first absolute position, see
+Simulator.relativeStart): those are cached for the position they were
+analyzed at.
+
+Most programs never touch the work offsets (no G10, G28, G30, G53, G92,
+coordinate system or tool length changes): their machine bounding box is
+the work one moved by the current offset, so a cached result is still good
+after zeroing an axis. Other programs are cached for the offsets they were
+analyzed with.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import collections
+import hashlib
+
+from . import parallel
+from . import simulator
+from . import toolpath
+
+AXES = simulator.AXES
+
+
+# ------------------------------------------------------------------
+# Extents class
+
+class Extents:
+  ''' Results of an extents analysis (boxes: [[low, high]] per axis, None: unknown) '''
+  __slots__ = ('work', 'machine', 'relative', 'lines', 'problems', 'cached')
+
+  def __init__(self, work, machine, relative, lines, cached):
+    self.work = work
+    self.machine = machine
+    self.relative = relative
+    self.lines = lines
+    self.problems = []
+    self.cached = cached
+
+  def getSummaryStr(self):
+    ''' Get a printable summary '''
+    return 'Extents (mm) - work: {:} - machine: {:}{:}'.format(
+      boxStr(self.work),
+      boxStr(self.machine),
+      ' (cached)' if self.cached else '')
+
+
+# ------------------------------------------------------------------
+# ExtentsAnalyzer class
+
+class ExtentsAnalyzer:
+
+  def __init__(self, cfg, mch=None, estimator=None):
+    ''' Construct an ExtentsAnalyzer object.
+        mch (optional) provides modal state, offsets, position and limits.
+        estimator (optional) provides cached toolpaths (see Estimator.cache).
+    '''
+    self.cfg = cfg
+    self.mch = mch
+    self.estimator = estimator
+    self.margin = cfg['machine']['softLimitsMargin']
+    self.maxTravel = [cfg['machine']['maxTravel'][axis.lower()] for axis in AXES]
+    self.cacheSize = cfg['job']['extentsCacheSize']
+
+    self.simulator = simulator.Simulator(cfg, mch)
+    self.cache = collections.OrderedDict()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def analyzeFile(self, fileName, checked=None):
+    ''' Analyze a G-code file, returns an Extents.
+        checked (optional) is a Simulator that just checked the file (from
+        its reset() state), used instead of simulating it again.
+    '''
+    contentHash = toolpath.hashFile(fileName)
+    return self.analyze(contentHash, lambda sim: sim.checkFile(fileName), checked,
+      lambda: self.getToolpath(fileName, contentHash))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getToolpath(self, fileName, contentHash):
+    ''' Get (Toolpath, cached) for a file from the estimator's cache, or
+        parsed in parallel (None if neither)
+    '''
+    est = self.estimator
+    if est is None:
+      return None, False
+
+    est.reset()
+    cached = est.getCachedToolpath(est.getCacheKey(contentHash)) if est.cache else None
+    if cached is not None:
+      return cached, True
+    if isinstance(est, parallel.ParallelEstimator) and est.isParallel(fileName):
+      return est.getFileToolpath(fileName, contentHash), False
+    return None, False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def analyzeLines(self, lines):
+    ''' Analyze a sequence of lines (raw, comments allowed), returns an Extents '''
+    lines = list(lines)
+    contentHash = hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()
+    return self.analyze(contentHash, lambda sim: sim.checkLines(lines))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def analyze(self, contentHash, simulate, checked=None, getToolpath=None):
+    ''' Get a program's extents from the cache, checked, getToolpath() or simulate(sim) '''
+    sim = self.simulator
+    sim.reset()
+
+    # Limits are checked on the whole box (keeps the simulator's fast path)
+    limits = sim.limits
+    sim.limits = None
+
+    key = (contentHash, repr((sim.state, sim.feed)))
+    offsets = repr((sim.wcsOffsets, sim.g92Offset, sim.toolLengthOffset, sim.storedPositions))
+    startPos = list(sim.pos)
+    startOffset = list(sim.offset)
+    startMachinePos = sim.getMachinePos(startPos)
+
+    entry = self.cache.get(key)
+    cached = entry is not None and (entry['relative'] or entry['offsets'] == offsets) \
+      and (entry['pos'] is None or entry['pos'] == startPos)
+
+    # Toolpaths are for the current start position, they are not kept here
+    if not cached and checked is None and getToolpath is not None:
+      path, pathCached = getToolpath()
+      result = self.analyzeToolpath(path, pathCached, startOffset, limits)
+      if result is not None:
+        return result
+
+    if cached:
+      self.cache.move_to_end(key)
+    else:
+      if checked is None:
+        simulate(sim)
+        checked = sim
+      entry = {
+        'work': [list(extents) for extents in checked.extents],
+        'machine': [list(extents) for extents in checked.machineExtents],
+        'relative': not checked.offsetsUsed,
+        'offsets': offsets,
+        'pos': startPos if checked.relativeStart else None,
+        'lines': checked.lines,
+      }
+      self.cache[key] = entry
+      while len(self.cache) > self.cacheSize:
+        self.cache.popitem(last=False)
+
+    work = addPoint(entry['work'], startPos)
+    if entry['relative']:
+      machine = moveBox(work, startOffset)
+    else:
+      machine = addPoint(entry['machine'], startMachinePos)
+
+    result = Extents(work, machine, entry['relative'], entry['lines'], cached)
+    result.problems = self.getProblems(result, limits)
+    return result
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def analyzeToolpath(self, path, cached, startOffset, limits):
+    ''' Get the extents of a Toolpath (closed when done), None if there's
+        no toolpath or it touches the work offsets
+    '''
+    if path is None:
+      return None
+
+    work = None if path.offsetsUsed else path.getBox()
+    path.close()
+    if work is None:
+      return None
+
+    result = Extents(work, moveBox(work, startOffset), True, path.lines, cached)
+    result.problems = self.getProblems(result, limits)
+    return result
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getProblems(self, result, limits):
+    ''' Check extents against machine limits (span against maxTravel when unknown) '''
+    problems = []
+
+    for index, axis in enumerate(AXES):
+      low, high = result.machine[index]
+      if limits and low is not None:
+        limitLow, limitHigh = limits[index]
+        if low < limitLow:
+          problems.append('{:} machine min {:.3f}mm < {:.3f}mm'.format(axis, low, limitLow))
+        if high > limitHigh:
+          problems.append('{:} machine max {:.3f}mm > {:.3f}mm'.format(axis, high, limitHigh))
+        continue
+
+      low, high = result.work[index]
+      travel = self.maxTravel[index] - 2 * self.margin
+      if low is not None and high - low > travel:
+        problems.append('{:} span {:.3f}mm > {:.3f}mm (maxTravel - 2 x softLimitsMargin)'.format(axis, high - low, travel))
+
+    return problems
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def addPoint(box, point):
+  ''' Get a bounding box grown to hold a point (unknown coordinates are skipped) '''
+  result = []
+  for (low, high), value in zip(box, point):
+    if value is None:
+      result.append([low, high])
+    elif low is None:
+      result.append([value, value])
+    else:
+      result.append([min(low, value), max(high, value)])
+  return result
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def moveBox(box, offset):
+  ''' Get a bounding box moved by an offset (unknown if the offset is) '''
+  return [[None, None] if low is None or value is None else [low + value, high + value]
+    for (low, high), value in zip(box, offset)]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def boxStr(box):
+  ''' Format a bounding box (unknown axes are skipped) '''
+  axes = ['{:}[{:.3f}..{:.3f}]'.format(axis, low, high) for axis, (low, high) in zip(AXES, box) if low is not None]
+  return ' '.join(axes) if axes else 'unknown'
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+'''
+gcode - lineindex
+=================
+Line offset index for G-code files
+
+A LineIndex maps line numbers to byte offsets, so a file can be read from any
+line without going through the lines before it (e.g. to resume a job).
+
+Indexes are written next to the toolpath cache (see toolpath.py) keyed by
+file path, size and modification time:
+  'GCLI' version(u16) lineCount(u32) offset(u64)... offset(u64)
+with one offset per line start, and memory-mapped when read back.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+MAGIC = b'GCLI'
+VERSION = 1
+PREFIX = struct.Struct('<4sHxxQ')
+FILE_EXTENSION = '.gcli'
+
+# Bytes read at once when building an index
+BLOCK_SIZE = 1 << 20
+
+
+# ------------------------------------------------------------------
+# LineIndex class
+
+class LineIndex:
+
+  def __init__(self, cfg, fileName):
+    ''' Construct a LineIndex object for a G-code file (built if needed).
+    '''
+    self.cfg = cfg
+    self.fileName = fileName
+    self.folder = cfg['job']['lineIndexFolder']
+    self.map = None
+    self.offsets = None
+    self.count = 0
+
+    self.indexFileName = os.path.join(self.folder, getKey(fileName) + FILE_EXTENSION)
+    if not self.load():
+      self.build()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def load(self):
+    ''' Map the index file, returns False if missing or not valid '''
+    try:
+      with open(self.indexFileName, 'rb') as file:
+        fileMap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+      return False
+
+    try:
+      magic, version, count = PREFIX.unpack_from(fileMap)
+      if magic != MAGIC or version != VERSION or len(fileMap) != PREFIX.size + count * 8:
+        raise ValueError('Unsupported line index file')
+    except (ValueError, struct.error):
+      fileMap.close()
+      return False
+
+    self.map = fileMap
+    self.offsets = memoryview(fileMap)[PREFIX.size:].cast('Q')
+    self.count = count
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def build(self):
+    ''' Scan the file for line starts and write (then map) the index '''
+    offsets = getLineOffsets(self.fileName)
+    tempName = self.indexFileName + '.tmp'
+
+    try:
+      os.makedirs(self.folder, exist_ok=True)
+      with open(tempName, 'wb') as file:
+        file.write(PREFIX.pack(MAGIC, VERSION, len(offsets)))
+        file.write(memoryview(offsets))
+      os.replace(tempName, self.indexFileName)
+    except OSError:
+      pass
+
+    # Kept in memory if it could not be written (or mapped)
+    if not self.load():
+      self.offsets = memoryview(offsets)
+      self.count = len(offsets)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getOffset(self, lineNumber):
+    ''' Get the byte offset where a line (1..count) starts '''
+    if not 1 <= lineNumber <= self.count:
+      raise IndexError('Line {:d} out of range (1..{:d})'.format(lineNumber, self.count))
+
+    return self.offsets[lineNumber - 1]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getLine(self, lineNumber):
+    ''' Read a single line (decoded, line end removed) '''
+    with open(self.fileName, 'rb') as file:
+      file.seek(self.getOffset(lineNumber))
+      return file.readline().decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def close(self):
+    ''' Release the file mapping '''
+    if self.map is None:
+      return
+
+    self.offsets.release()
+    self.offsets = None
+    self.map.close()
+    self.map = None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getKey(fileName):
+  ''' Get the index key for a file (path, size and modification time) '''
+  fileStat = os.stat(fileName)
+  key = repr((os.path.abspath(fileName), fileStat.st_size, fileStat.st_mtime_ns))
+  return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getLineOffsets(fileName):
+  ''' Get the byte offsets of every line start in a file (array of 'Q') '''
+  offsets = array.array('Q')
+  position = 0
+  lastByte = b'\n'
+
+  with open(fileName, 'rb') as file:
+    offsets.append(0)
+    while True:
+      block = file.read(BLOCK_SIZE)
+      if not block:
+        break
+
+      if numpy is not None:
+        ends = numpy.flatnonzero(numpy.frombuffer(block, dtype=numpy.uint8) == 10)
+        offsets.frombytes((ends + (position + 1)).astype(numpy.uint64).tobytes())
+      else:
+        end = block.find(b'\n')
+        while end != -1:
+          offsets.append(position + end + 1)
+          end = block.find(b'\n', end + 1)
+
+      position += len(block)
+      lastByte = block[-1:]
+
+  # The last line start is the file end when the file ends with a line end
+  if lastByte == b'\n' and len(offsets) > 1 or position == 0:
+    offsets.pop()
+
+  return offsets
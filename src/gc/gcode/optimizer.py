@@ -0,0 +1,546 @@
+#!/usr/bin/python3
+'''
+gcode - optimizer
+=================
+Streaming G-code toolpath optimizer
+
+Dense toolpaths (thousands of tiny G1 segments) are rewritten with fewer
+lines:
+  - Runs of collinear G1 segments are merged into a single G1
+  - Runs of short G1 segments following a circle are fitted into G2/G3 arcs
+
+Only absolute (G90), units/min (G94) G1 moves with known start position
+are touched, everything else goes through unchanged. The rewritten path
+never deviates from the original more than the configured tolerance
+(nor grbl's own arc tolerance, $12).
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import math
+
+from ..grbl import dict
+
+# ------------------------------------------------------------------
+# Optimizer class
+
+class Optimizer:
+
+  AXES = ['X', 'Y', 'Z']
+
+  # Commands after which the current position is unknown
+  # (machine coords, homing, coordinate system changes, tool length offset)
+  POSITION_RESET_WORDS = ['G28', 'G28.1', 'G30', 'G30.1', 'G53', 'G10', 'G92', 'G92.1', 'G43.1', 'G49']
+
+  # Runs are checked point by point, keep them bounded
+  MAX_RUN_SEGMENTS = 500
+
+  # Arcs close to a full circle are left alone (endpoint precision)
+  MAX_ARC_SWEEP = math.pi * 1.9
+
+  def __init__(self, cfg, mch=None):
+    ''' Construct an Optimizer object.
+        mch (optional) provides grbl settings ($12) and the parser state.
+    '''
+    self.cfg = cfg
+    self.mch = mch
+    self.jobCfg = cfg['job']
+    self.enabled = self.jobCfg['optimize']
+    self.minArcSegments = self.jobCfg['minArcSegments']
+
+    self.reset()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def reset(self):
+    ''' Reset modal state, position and statistics (call before each program) '''
+    self.state = {
+      'motion': None,
+      'distanceMode': None,
+      'units': 'G21',
+      'plane': 'G17',
+      'feedRateMode': 'G94',
+    }
+
+    # Seed modal state from grbl (tracked) parser state
+    if self.mch:
+      parserState = self.mch.status['parserState']
+      for group in self.state:
+        if group in parserState:
+          self.state[group] = parserState[group]['val']
+
+    self.emittedMotion = self.state['motion']
+    self.pos = self.getStartPosition()
+    self.feed = None
+    self.run = None
+
+    self.linesIn = 0
+    self.linesOut = 0
+    self.mergedLines = 0
+    self.arcs = 0
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStartPosition(self):
+    ''' Get the work position the program starts from (None: unknown).
+        Only trusted with the machine stopped and everything in millimeters.
+    '''
+    unknown = {axis: None for axis in self.AXES}
+
+    if not self.mch or self.mch.getMachineState() != 'Idle' or self.state['units'] != 'G21':
+      return unknown
+
+    try:
+      if int(self.mch.status['settings'][13]['val']):
+        return unknown
+    except (KeyError, ValueError):
+      return unknown
+
+    wPos = self.mch.status['WPos']
+    return {'X': wPos['x'], 'Y': wPos['y'], 'Z': wPos['z']}
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getTolerance(self):
+    ''' Get fitting tolerance in current units '''
+    tolerance = self.jobCfg['optimizeTolerance']
+
+    if self.mch:
+      try:
+        tolerance = min(tolerance, float(self.mch.status['settings'][12]['val']))
+      except (KeyError, ValueError):
+        pass
+
+    if self.state['units'] == 'G20':
+      tolerance /= 25.4
+
+    return tolerance
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStatsStr(self):
+    ''' Get a printable version of the optimizer statistics '''
+    percent = ((self.linesIn - self.linesOut) * 100 / self.linesIn) if self.linesIn else 0
+    return 'Optimized {:d} -> {:d} lines ({:.1f}% less): {:d} lines merged, {:d} arcs fitted'.format(
+      self.linesIn, self.linesOut, percent, self.mergedLines, self.arcs)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def optimizeLines(self, lines):
+    ''' Optimize a sequence of clean lines (no comments, see Job.cleanLines()) '''
+    if not self.enabled:
+      yield from lines
+      return
+
+    for line in lines:
+      self.linesIn += 1
+      for outLine in self.processLine(line):
+        self.linesOut += 1
+        yield outLine
+
+    for outLine in self.flushRun():
+      self.linesOut += 1
+      yield outLine
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseWords(self, line):
+    ''' Split a line in (letter, value) words, None if it can't be parsed '''
+    compact = ''.join(line.split()).upper()
+    words = dict.blockWordRE.findall(compact)
+
+    if sum([len(letter) + len(number) for letter, number in words]) != len(compact):
+      return None
+
+    try:
+      return [(letter, float(number)) for letter, number in words]
+    except ValueError:
+      return None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getGWord(self, value):
+    ''' Get a normalized G word from its value (1.0 => 'G1', 38.2 => 'G38.2') '''
+    return 'G{:g}'.format(value)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def processLine(self, line):
+    ''' Process a line, returns the lines to send (if any) '''
+    words = self.parseWords(line)
+
+    if words is None:
+      # Unknown syntax, play safe
+      output = self.flushRun()
+      output.append(line)
+      self.forgetPosition()
+      self.state['motion'] = None
+      self.emittedMotion = None
+      return output
+
+    point = self.getRunPoint(words)
+    if point is not None:
+      return self.addToRun(line, words, point)
+
+    output = self.flushRun()
+    output.append(self.getPassThroughLine(line, words))
+    self.updateState(words)
+    return output
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getRunPoint(self, words):
+    ''' Get a G1 line's end point if it can be optimized (None otherwise) '''
+    state = self.state
+    if state['distanceMode'] != 'G90' or state['feedRateMode'] != 'G94':
+      return None
+
+    motion = state['motion']
+    hasAxes = False
+
+    for letter, value in words:
+      if letter == 'G':
+        if value != 1:
+          return None
+        motion = 'G1'
+      elif letter in 'XYZ':
+        hasAxes = True
+      elif letter != 'F':
+        return None
+
+    if motion != 'G1' or not hasAxes:
+      return None
+
+    point = [self.pos['X'], self.pos['Y'], self.pos['Z']]
+    if None in point:
+      return None
+
+    for letter, value in words:
+      if letter in 'XYZ':
+        point[self.AXES.index(letter)] = value
+
+    return point
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addToRun(self, line, words, point):
+    ''' Add a G1 move to the current run (flushing it if it doesn't fit) '''
+    output = []
+
+    feed = self.feed
+    for letter, value in words:
+      if letter == 'F':
+        feed = value
+
+    if self.run and (self.run['feed'] != feed or len(self.run['lines']) >= self.MAX_RUN_SEGMENTS):
+      output = self.flushRun()
+
+    if not self.run:
+      self.run = self.newRun(feed)
+
+    run = self.run
+    points = run['points'] + [point]
+    fits = len(points) <= 2
+
+    if not fits and run['mode'] in (None, 'line') and self.isLine(points):
+      run['mode'] = 'line'
+      fits = True
+
+    # A curve can look straight for a few segments, try an arc before giving up
+    if not fits:
+      arc = self.extendArc(points) if run['mode'] == 'arc' else None
+      arc = arc or self.fitArc(points)
+      if arc:
+        run['mode'] = 'arc'
+        run['arc'] = arc
+        fits = True
+
+    if not fits:
+      output += self.flushRun()
+      run = self.run = self.newRun(feed)
+
+    letters = [letter for letter, value in words]
+    run['points'].append(point)
+    run['lines'].append((line, 'G' in letters))
+    run['hasF'] = run['hasF'] or 'F' in letters
+
+    self.state['motion'] = 'G1'
+    self.feed = feed
+    self.pos = {axis: point[index] for index, axis in enumerate(self.AXES)}
+
+    return output
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def newRun(self, feed):
+    ''' Start a run at the current position '''
+    return {
+      'points': [[self.pos[axis] for axis in self.AXES]],
+      'lines': [],
+      'feed': feed,
+      'hasF': False,
+      'mode': None,
+      'arc': None,
+    }
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isLine(self, points):
+    ''' Check if a polyline can be replaced by its first-to-last segment '''
+    start = points[0]
+    end = points[-1]
+    direction = [end[i] - start[i] for i in range(3)]
+    length = math.sqrt(sum([d*d for d in direction]))
+    if length < 1e-9:
+      return False
+
+    # Fast path: extending an already straight run on the very same line
+    # (the other points keep their distances, no need to check them again)
+    if self.run['mode'] == 'line' and self.isOnLine(start, points[-2], end):
+      return True
+
+    direction = [d / length for d in direction]
+    tolerance = self.getTolerance()
+    lastProjection = 0
+
+    for point in points[1:-1]:
+      offset = [point[i] - start[i] for i in range(3)]
+      projection = sum([offset[i] * direction[i] for i in range(3)])
+
+      # Going back and forth is not a straight line
+      if projection < lastProjection or projection > length:
+        return False
+      lastProjection = projection
+
+      distanceSq = sum([o*o for o in offset]) - projection * projection
+      if distanceSq > tolerance * tolerance:
+        return False
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isOnLine(self, start, middle, end):
+    ''' Check if middle is (exactly, not within tolerance) between start and end '''
+    first = [middle[i] - start[i] for i in range(3)]
+    second = [end[i] - middle[i] for i in range(3)]
+    if sum([first[i] * second[i] for i in range(3)]) <= 0:
+      return False
+
+    cross = [
+      first[1] * second[2] - first[2] * second[1],
+      first[2] * second[0] - first[0] * second[2],
+      first[0] * second[1] - first[1] * second[0],
+    ]
+    return sum([c*c for c in cross]) < 1e-18
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def extendArc(self, points):
+    ''' Fast path: check if the last point continues the current run's arc
+        (same center, the rest of the points have already been checked).
+        Returns the updated arc or None if it doesn't fit.
+    '''
+    centerX, centerY, clockwise, radius, sweep = self.run['arc']
+    (lastX, lastY, lastZ), (x, y, z) = points[-2], points[-1]
+    if z != lastZ:
+      return None
+
+    # Stricter than fitArc() on the end point, it's grbl's arc radius check
+    tolerance = self.getTolerance()
+    if abs(math.hypot(x - centerX, y - centerY) - radius) > tolerance / 2:
+      return None
+    if radius - math.hypot((x + lastX) / 2 - centerX, (y + lastY) / 2 - centerY) > tolerance:
+      return None
+
+    lastAngle = math.atan2(lastY - centerY, lastX - centerX)
+    step = (math.atan2(y - centerY, x - centerX) - lastAngle + math.pi) % (2 * math.pi) - math.pi
+    if step == 0 or (step < 0) != clockwise or abs(sweep + step) > self.MAX_ARC_SWEEP:
+      return None
+
+    return (centerX, centerY, clockwise, radius, sweep + step)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def fitArc(self, points):
+    ''' Fit a polyline into an XY arc.
+        Returns (centerX, centerY, clockwise, radius, sweep) or None if it doesn't fit.
+    '''
+    if self.state['plane'] != 'G17':
+      return None
+
+    z = points[0][2]
+    for point in points:
+      if abs(point[2] - z) > 1e-9:
+        return None
+
+    # Circle through first, middle and last points
+    (ax, ay), (bx, by), (cx, cy) = [(p[0], p[1]) for p in (points[0], points[len(points) // 2], points[-1])]
+    det = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(det) < 1e-12:
+      return None
+
+    aSq = ax*ax + ay*ay
+    bSq = bx*bx + by*by
+    cSq = cx*cx + cy*cy
+    centerX = (aSq * (by - cy) + bSq * (cy - ay) + cSq * (ay - by)) / det
+    centerY = (aSq * (cx - bx) + bSq * (ax - cx) + cSq * (bx - ax)) / det
+    radius = math.hypot(ax - centerX, ay - centerY)
+
+    tolerance = self.getTolerance()
+    sweep = 0
+    lastAngle = math.atan2(ay - centerY, ax - centerX)
+    lastX, lastY = ax, ay
+
+    for point in points[1:]:
+      x, y = point[0], point[1]
+
+      # Vertices on the circle, chords (sagitta) close to it
+      if abs(math.hypot(x - centerX, y - centerY) - radius) > tolerance:
+        return None
+      midX, midY = (x + lastX) / 2, (y + lastY) / 2
+      if radius - math.hypot(midX - centerX, midY - centerY) > tolerance:
+        return None
+
+      angle = math.atan2(y - centerY, x - centerX)
+      step = (angle - lastAngle + math.pi) % (2 * math.pi) - math.pi
+
+      # Always turning the same way
+      if step == 0 or (sweep and (step > 0) != (sweep > 0)):
+        return None
+
+      sweep += step
+      lastAngle = angle
+      lastX, lastY = x, y
+
+    if abs(sweep) > self.MAX_ARC_SWEEP:
+      return None
+
+    return (centerX, centerY, sweep < 0, radius, sweep)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def formatNumber(self, number):
+    ''' Format a coordinate (4 decimals, no trailing zeros) '''
+    number = '{:.4f}'.format(number).rstrip('0').rstrip('.')
+    return '0' if number in ('', '-0') else number
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def flushRun(self):
+    ''' Get the lines for the current run (and close it) '''
+    run = self.run
+    self.run = None
+
+    if not run or not run['lines']:
+      return []
+
+    segments = len(run['lines'])
+    start = run['points'][0]
+    end = run['points'][-1]
+    feedStr = 'F' + self.formatNumber(run['feed']) if run['hasF'] else ''
+
+    if run['mode'] == 'line' and segments >= 2:
+      line = 'G1'
+      for index, axis in enumerate(self.AXES):
+        if abs(end[index] - start[index]) > 1e-9:
+          line += axis + self.formatNumber(end[index])
+      self.emittedMotion = 'G1'
+      self.mergedLines += segments - 1
+      return [line + feedStr]
+
+    if run['mode'] == 'arc' and segments >= self.minArcSegments:
+      centerX, centerY, clockwise = run['arc'][:3]
+      motion = 'G2' if clockwise else 'G3'
+      line = '{:}X{:}Y{:}I{:}J{:}'.format(
+        motion,
+        self.formatNumber(end[0]),
+        self.formatNumber(end[1]),
+        self.formatNumber(centerX - start[0]),
+        self.formatNumber(centerY - start[1]))
+      self.emittedMotion = motion
+      self.arcs += 1
+      self.mergedLines += segments - 1
+      return [line + feedStr]
+
+    # Not worth it, send the original lines
+    # (after an arc, the G1 they rely on must be explicit)
+    output = []
+    for line, hasMotion in run['lines']:
+      if self.emittedMotion != 'G1' and not hasMotion:
+        line = 'G1' + line
+      self.emittedMotion = 'G1'
+      output.append(line)
+
+    return output
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getPassThroughLine(self, line, words):
+    ''' Get a line that is not optimized, making the motion mode it
+        relies on explicit if it's not the one grbl is in.
+    '''
+    hasMotion = False
+    hasAxes = False
+
+    for letter, value in words:
+      if letter == 'G' and self.getGWord(value) in dict.modalGroups['motion']:
+        hasMotion = True
+      elif letter in 'XYZ':
+        hasAxes = True
+
+    if hasAxes and not hasMotion and self.state['motion'] and self.emittedMotion != self.state['motion']:
+      line = self.state['motion'] + line
+      self.emittedMotion = self.state['motion']
+
+    return line
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def forgetPosition(self):
+    self.pos = {axis: None for axis in self.AXES}
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def updateState(self, words):
+    ''' Update modal state and position from a non-optimized line '''
+    state = self.state
+    positionReset = False
+    axes = {}
+
+    for letter, value in words:
+      if letter == 'G':
+        word = self.getGWord(value)
+        entry = dict.modalIndex.get(word)
+        if entry and entry[0] in state:
+          state[entry[0]] = word
+          if entry[0] == 'motion':
+            self.emittedMotion = word
+        elif word in self.POSITION_RESET_WORDS:
+          positionReset = True
+      elif letter == 'M' and value in (2, 30):
+        # Program end (modes back to defaults)
+        state['motion'] = None
+        state['distanceMode'] = None
+        positionReset = True
+      elif letter == 'F':
+        self.feed = value
+      elif letter in 'XYZ':
+        axes[letter] = value
+
+    # Probing stops anywhere
+    if state['motion'] and state['motion'].startswith('G38'):
+      positionReset = True
+
+    if positionReset:
+      self.forgetPosition()
+      return
+
+    for axis, value in axes.items():
+      if state['distanceMode'] == 'G90':
+        self.pos[axis] = value
+      elif state['distanceMode'] == 'G91' and self.pos[axis] is not None:
+        self.pos[axis] += value
+      else:
+        self.pos[axis] = None
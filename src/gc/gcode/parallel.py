@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+'''
+gcode - parallel
+================
+Multi-process G-code file analysis
+
+ParallelEstimator builds a file's toolpath (tokenizing, modal state, arcs,
+positions: everything the estimator and extents need) using a process pool
+when the file is big enough:
+  - The file is split in byte ranges (at line ends)
+  - Pass 1 (pool): each range is scanned with a few regexes, getting what
+    it does to the modal state (last motion, plane and feed, last value
+    and sum of each axis word, pending planner syncs)
+  - Reconciliation: the start state of each range is the previous one's
+    end state. Ranges changing units, distance mode, offsets or coordinate
+    systems can't be summarized, they're parsed right there (in order)
+  - Pass 2 (pool): each range is parsed from its start state
+  - Results are merged in order, checking that each range ended in the
+    next one's start state (ranges that didn't are parsed again)
+The result is the same toolpath the single-process parser gets.
+
+Validation (see simulator.py) stays in a single process: its issues depend
+on everything before them (span checks on the box so far, axes reported
+once until back in range, only the first checkMaxIssues kept), so ranges
+would have to be checked again in order anyway. Its results are cached by
+content hash and start state instead.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import concurrent.futures
+import io
+import os
+import re
+
+from . import estimator
+
+# Ranges per process (smaller ranges balance the load better)
+RANGES_PER_PROCESS = 4
+
+# Blocks that can't be summarized by scanChunk(): units, distance and feed
+# rate modes, offsets, coordinate systems, tool length, program end/pause,
+# canned cycle cancel and system commands
+COMPLEX_RE = re.compile(r'G0*(?:20|21|90|91|93|94|10|28|30|53|5[4-9]|43|49|92|80)(?![0-9])|M0*(?:0|1|2|30)(?![0-9])|\$')
+
+commentRE = re.compile(r';.*|\([^)\n]*(?:\)|$)', re.M)
+motionRE = re.compile(r'G0*([0-3]|38\.[2-5])(?![0-9])')
+planeRE = re.compile(r'G0*(1[789])(?![0-9.])')
+feedRE = re.compile(r'F([0-9.]+)')
+axisRE = {axis: re.compile(axis + r'([-+0-9.]+)') for axis in 'XYZ'}
+syncRE = re.compile(r'M0*[345789](?![0-9])|G0*4(?![0-9.])')
+
+# Max difference between a range's end position and the next one's start (mm)
+POSITION_TOLERANCE = 1e-6
+
+
+# ------------------------------------------------------------------
+# ParallelEstimator class
+
+class ParallelEstimator(estimator.Estimator):
+
+  def __init__(self, cfg, mch=None, cache=None):
+    ''' Construct a ParallelEstimator object (see Estimator).
+    '''
+    self.processes = cfg['job']['analysisProcesses'] or os.cpu_count() or 1
+    self.minSize = cfg['job']['parallelMinSize'] * 1024 * 1024
+
+    super().__init__(cfg, mch, cache)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isParallel(self, fileName):
+    ''' Check if a G-code file is parsed in parallel (big enough, more than one process) '''
+    return self.processes >= 2 and os.path.getsize(fileName) >= self.minSize
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseFile(self, fileName):
+    ''' Collect the moves in a G-code file (in parallel if it's big enough) '''
+    if not self.isParallel(fileName):
+      return super().parseFile(fileName)
+
+    ranges = getRanges(fileName, self.processes * RANGES_PER_PROCESS)
+
+    with concurrent.futures.ProcessPoolExecutor(self.processes) as pool:
+      scans = pool.map(scanChunk, [fileName] * len(ranges), *zip(*ranges))
+
+      # Start states, parsing ranges that can't be summarized right away
+      parseState = self.getParseState()
+      startStates = []
+      results = []
+      for (start, end), scan in zip(ranges, scans):
+        startStates.append(parseState)
+        nextState = reconcile(parseState, scan)
+        if nextState is None:
+          results.append(parseChunk(self.cfg, fileName, start, end, parseState))
+          parseState = results[-1]['end']
+        else:
+          results.append(pool.submit(parseChunk, self.cfg, fileName, start, end, parseState))
+          parseState = nextState
+
+      results = [result.result() if isinstance(result, concurrent.futures.Future) else result for result in results]
+
+    for index, ((start, end), result) in enumerate(zip(ranges, results)):
+      if index and not sameState(startStates[index], results[index - 1]['end']):
+        result = results[index] = parseChunk(self.cfg, fileName, start, end, results[index - 1]['end'])
+      self.addChunkResult(result)
+
+    self.setParseState(results[-1]['end'])
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addChunkResult(self, result):
+    ''' Append a parseChunk() result to the moves collected '''
+    self.flushPending()
+    for name, _ in estimator.COLUMNS:
+      self.pieces[name].append(result['columns'][name])
+
+    # The first section continues the previous one unless a comment named it
+    # (same rules as Estimator.addSection())
+    sections = result['sections']
+    first = sections[0]
+    last = self.sections[-1]
+    if first['named'] and (last['start'] != self.moves or last['dwell']):
+      self.sections.append(dict(first, start=self.moves))
+    else:
+      if first['named'] and not last['named']:
+        last['name'] = first['name']
+        last['named'] = True
+      last['dwell'] += first['dwell']
+
+    for section in sections[1:]:
+      self.sections.append(dict(section, start=section['start'] + self.moves))
+
+    for index, row in enumerate(result['startRows']):
+      if self.startRows[index] is None and row is not None:
+        self.startRows[index] = row + self.moves
+
+    self.moves += result['moves']
+    self.dwellTime += result['dwellTime']
+    self.offsetsUsed = self.offsetsUsed or result['offsetsUsed']
+    self.startUsed = self.startUsed or result['startUsed']
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getRanges(fileName, count):
+  ''' Split a file in (about) count byte ranges ending at line ends '''
+  size = os.path.getsize(fileName)
+  ranges = []
+  start = 0
+
+  with open(fileName, 'rb') as file:
+    for index in range(1, count + 1):
+      end = size if index == count else max(size * index // count, start)
+      if end < size:
+        file.seek(end)
+        file.readline()
+        end = file.tell()
+      if end > start:
+        ranges.append((start, end))
+        start = end
+      if start >= size:
+        break
+
+  return ranges
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def readChunk(fileName, start, end):
+  ''' Open a byte range of a file as a text file (same decoding as the whole file) '''
+  with open(fileName, 'rb') as file:
+    file.seek(start)
+    data = file.read(end - start)
+
+  return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def scanChunk(fileName, start, end):
+  ''' Pass 1: summarize what a byte range does to the modal state '''
+  lines = readChunk(fileName, start, end).readlines()
+  text = ''.join(lines)
+  if '(' in text or ';' in text:
+    text = commentRE.sub('', text)
+  text = text.translate(estimator.chunkTable).upper()
+
+  scan = {'lines': len(lines), 'complex': COMPLEX_RE.search(text) is not None}
+  if scan['complex']:
+    return scan
+
+  # Malformed numbers and feed moves without a feed rate are rejected by grbl
+  # (the scan can't follow them)
+  try:
+    feeds = [float(feed) for feed in feedRE.findall(text)]
+    axes = {axis: [float(value) for value in axisWordRE.findall(text)] for axis, axisWordRE in axisRE.items()}
+  except ValueError:
+    feeds = [0.0]
+  if not all(feeds):
+    scan['complex'] = True
+    return scan
+
+  motions = motionRE.findall(text)
+  planes = planeRE.findall(text)
+  scan['motion'] = 'G{:g}'.format(float(motions[-1])) if motions else None
+  scan['plane'] = 'G' + planes[-1] if planes else None
+  scan['feed'] = feeds[-1] if feeds else None
+
+  scan['axes'] = {axis: (values[-1], sum(values)) for axis, values in axes.items() if values}
+
+  # Planner syncs after the last move (or anywhere if there are no moves)
+  lastMove = max(text.rfind(axis) for axis in 'XYZ')
+  scan['moves'] = lastMove != -1
+  syncStart = 0
+  if scan['moves']:
+    syncStart = text.find('\n', lastMove)
+    if syncStart == -1:
+      syncStart = len(text)
+  scan['sync'] = syncRE.search(text, syncStart) is not None
+
+  return scan
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def reconcile(parseState, scan):
+  ''' Get a range's end state from its start state and scan (None: can't) '''
+  state = parseState['state']
+  if scan['complex'] or not parseState['feed'] or state['feedRateMode'] != 'G94' or state['motion'] == 'G80':
+    return None
+
+  endState = dict(parseState, state=state.copy(), pos=list(parseState['pos']), relative=list(parseState['relative']))
+  if scan['motion']:
+    endState['state']['motion'] = scan['motion']
+  if scan['plane']:
+    endState['state']['plane'] = scan['plane']
+  if scan['feed'] is not None:
+    endState['feed'] = scan['feed']
+
+  scale = parseState['scale']
+  incremental = state['distanceMode'] == 'G91'
+  for index, axis in enumerate('XYZ'):
+    if axis in scan['axes']:
+      last, total = scan['axes'][axis]
+      pos = endState['pos'][index]
+      if not incremental:
+        endState['pos'][index] = last * scale
+        endState['relative'][index] = False
+      elif pos is not None:
+        endState['pos'][index] = pos + total * scale
+
+  if scan['moves']:
+    endState['syncNext'] = scan['sync']
+  else:
+    endState['syncNext'] = parseState['syncNext'] or scan['sync']
+  endState['lines'] = parseState['lines'] + scan['lines']
+  return endState
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def parseChunk(cfg, fileName, start, end, parseState):
+  ''' Pass 2: parse a byte range from its start state '''
+  est = estimator.Estimator(cfg)
+  est.setParseState(parseState)
+  est.parseStream(readChunk(fileName, start, end))
+  est.flushPending()
+
+  columns = est.getToolpath().columns
+  return {
+    'columns': columns,
+    'sections': est.sections,
+    'moves': est.moves,
+    'dwellTime': est.dwellTime,
+    'offsetsUsed': est.offsetsUsed,
+    'startRows': est.startRows,
+    'startUsed': est.startUsed,
+    'end': est.getParseState(),
+  }
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def sameState(a, b):
+  ''' Check if two parser states match (positions within POSITION_TOLERANCE) '''
+  for key in ('state', 'feed', 'scale', 'relative', 'syncNext', 'lines'):
+    if a[key] != b[key]:
+      return False
+
+  for valueA, valueB in zip(a['pos'], b['pos']):
+    if (valueA is None) != (valueB is None):
+      return False
+    if valueA is not None and abs(valueA - valueB) > POSITION_TOLERANCE:
+      return False
+
+  return True
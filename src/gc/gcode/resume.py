@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+'''
+gcode - resume
+==============
+Modal state at any line of a G-code file (to resume a stopped job)
+
+ResumeParser goes through the lines before the resume line (read by byte
+ranges from a LineIndex, see lineindex.py) with the estimator's parser and
+also follows the spindle (M3/M4/M5 and S), coolant (M7/M8/M9) and program
+end (M2/M30 stop both).
+
+getPreamble() gets the lines that take the machine back to that state from
+a safe Z: modes, spindle, coolant, XY position and a Z plunge, then the
+distance, feed rate and motion modes the program had.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import re
+
+from . import estimator
+from . import parallel
+
+# Lines parsed at once
+CHUNK_LINES = 100000
+
+spindleSpeedRE = re.compile(r'S([0-9.]+)')
+programEndRE = re.compile(r'M0*(?:2|30)(?![0-9])')
+motionWordRE = re.compile(r'G0*(?:[0-3]|38\.[2-5]|80)(?![0-9.])')
+
+# State groups followed on top of the estimator's
+EXTRA_STATE = {
+  'spindle': 'M5',
+  'coolant': 'M9',
+}
+
+
+# ------------------------------------------------------------------
+# ResumeParser class
+
+class ResumeParser(estimator.Estimator):
+
+  def __init__(self, cfg, startState=None):
+    ''' Construct a ResumeParser object.
+        startState (optional, see Estimator.getParseState()) is the state
+        the job started with (grbl's defaults if not given).
+    '''
+    self.startState = startState
+    super().__init__(cfg)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def reset(self):
+    ''' Reset state (to the job's start state) and collected moves '''
+    super().reset()
+    self.state.update(EXTRA_STATE)
+    self.spindleSpeed = 0.0
+    if self.startState:
+      self.setParseState(dict(self.startState, lines=0))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setParseState(self, parseState):
+    ''' Continue parsing from a getParseState() state '''
+    super().setParseState(parseState)
+    for group, value in EXTRA_STATE.items():
+      self.state.setdefault(group, value)
+    self.spindleSpeed = parseState.get('spindleSpeed', 0.0)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getParseState(self):
+    ''' Get the parser state (with the spindle speed) '''
+    parseState = super().getParseState()
+    parseState['spindleSpeed'] = self.spindleSpeed
+    return parseState
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addBlock(self, line):
+    ''' Collect the moves in a block, following spindle speed and program end '''
+    super().addBlock(line)
+
+    match = spindleSpeedRE.search(line)
+    if match:
+      try:
+        self.spindleSpeed = float(match.group(1))
+      except ValueError:
+        pass
+
+    if programEndRE.search(line):
+      self.state.update(EXTRA_STATE)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseUntil(self, index, lineNumber):
+    ''' Get the parser state before lineNumber (parsing from the start of the file) '''
+    self.reset()
+
+    for first in range(1, lineNumber, CHUNK_LINES):
+      last = min(first + CHUNK_LINES, lineNumber)
+      self.parseStream(parallel.readChunk(index.fileName, index.getOffset(first), index.getOffset(last)))
+
+      # Only the state is needed, moves are dropped as they come
+      self.flushPending()
+      self.pieces = {name: [] for name, _ in estimator.COLUMNS}
+
+    return self.getParseState()
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getPreamble(parseState, zFeed, spindleDelay):
+  ''' Get the lines taking the machine to a parser state (see ResumeParser),
+      starting from a safe Z. zFeed (mm/min) is used for the Z plunge,
+      spindleDelay (seconds) waits for the spindle to get up to speed.
+      Raises ValueError if the position is unknown.
+  '''
+  state = parseState['state']
+  scale = parseState['scale']
+  pos = estimator.getWorkPos(parseState)
+
+  if None in pos:
+    raise ValueError('Position unknown ({:} after homing, G53, offset changes or from an unknown start)'.format(
+      ''.join(axis for axis, value in zip('XYZ', pos) if value is None)))
+
+  def number(value):
+    return '{:.4f}'.format(value / scale).rstrip('0').rstrip('.')
+
+  lines = ['{:} {:} {:} G90 G94'.format(state['units'], state['plane'], state['wcs'])]
+
+  if state['spindle'] != 'M5':
+    lines.append('{:} S{:g}'.format(state['spindle'], parseState['spindleSpeed']))
+    if spindleDelay:
+      lines.append('G4 P{:g}'.format(spindleDelay))
+  if state['coolant'] != 'M9':
+    lines.append(state['coolant'])
+
+  lines.append('G0 X{:} Y{:}'.format(number(pos[0]), number(pos[1])))
+  lines.append('G1 Z{:} F{:}'.format(number(pos[2]), number(zFeed)))
+
+  # Modes the program was in (G2/G3 can't be set without axis words, see
+  # prependMotion(), G1 needs a feed rate)
+  feed = parseState['feed'] if state['feedRateMode'] == 'G94' else 0.0
+  modes = [state['distanceMode'], state['feedRateMode']]
+  if state['motion'] in ('G0', 'G80') or (state['motion'] == 'G1' and feed):
+    modes.append(state['motion'])
+  if feed:
+    modes.append('F{:g}'.format(feed))
+  lines.append(' '.join(modes))
+
+  return lines
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def prependMotion(lines, motion):
+  ''' Add the program's motion mode to the first resumed line that relies on it '''
+  for line in lines:
+    if motion:
+      compact = line.replace(' ', '').upper()
+      if motionWordRE.search(compact):
+        motion = None
+      elif any(axis in compact for axis in 'XYZ'):
+        line = motion + line
+        motion = None
+    yield line
@@ -0,0 +1,1030 @@
+#!/usr/bin/python3
+'''
+gcode - simulator
+=================
+Offline G-code simulator/validator
+
+Runs a program (or macro) through grbl 1.1's block rules without a machine
+and reports the lines grbl would reject (error:N) and the moves that would
+end in a soft limit alarm (ALARM:2), using the texts in grbl's dictionary.
+
+Positions are tracked in millimeters, both in work coordinates and (when
+the work coordinate offsets are known) in machine coordinates:
+  - Connected: machine limits come from Grbl.getMin()/getMax(), offsets
+    from the G-code parameters ($#) and the start position from WPos
+  - Offline: only the program span is checked against maxTravel
+
+Plain G0/G1 lines (the bulk of any CAM output) go through a single regex
+match, everything else goes through the full block rules. File results are
+cached by content hash and start state (checking an unchanged file again
+from the same place skips the simulation).
+
+Extents only hold the positions the program goes to: axes still at the
+start position are left out (the caller adds it, see extents.py), and
+relativeStart tells if they depend on it (incremental moves, arcs, G92...
+before the first absolute position).
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import collections
+import copy
+import math
+import re
+
+from ..grbl import dict
+from . import toolpath
+
+# ------------------------------------------------------------------
+# Supported commands (grbl 1.1)
+
+# G commands by group ('nonModal' commands can't share a block)
+G_COMMANDS = {
+  'G0': 'motion', 'G1': 'motion', 'G2': 'motion', 'G3': 'motion',
+  'G38.2': 'motion', 'G38.3': 'motion', 'G38.4': 'motion', 'G38.5': 'motion', 'G80': 'motion',
+  'G4': 'nonModal', 'G10': 'nonModal', 'G28': 'nonModal', 'G28.1': 'nonModal',
+  'G30': 'nonModal', 'G30.1': 'nonModal', 'G53': 'nonModal', 'G92': 'nonModal', 'G92.1': 'nonModal',
+  'G17': 'plane', 'G18': 'plane', 'G19': 'plane',
+  'G20': 'units', 'G21': 'units',
+  'G90': 'distanceMode', 'G91': 'distanceMode',
+  'G91.1': 'arcDistanceMode',
+  'G93': 'feedRateMode', 'G94': 'feedRateMode',
+  'G40': 'cutterComp',
+  'G43.1': 'toolLength', 'G49': 'toolLength',
+  'G54': 'wcs', 'G55': 'wcs', 'G56': 'wcs', 'G57': 'wcs', 'G58': 'wcs', 'G59': 'wcs',
+  'G61': 'pathControl',
+}
+
+# M commands by group
+M_COMMANDS = {
+  'M0': 'program', 'M1': 'program', 'M2': 'program', 'M30': 'program',
+  'M3': 'spindle', 'M4': 'spindle', 'M5': 'spindle',
+  'M7': 'coolant', 'M8': 'coolant', 'M9': 'coolant',
+}
+
+# Value words grbl knows about
+VALUE_LETTERS = 'FIJKLNPRSTXYZ'
+
+# Value words that can't be negative
+POSITIVE_LETTERS = 'FNPST'
+
+# Non-modal commands using axis words
+AXIS_COMMANDS = ['G10', 'G28', 'G30', 'G92']
+
+# Simulation results kept by checkFile()'s cache
+RESULTS = ['lines', 'issueCount', 'issues', 'extents', 'machineExtents', 'offsetsUsed', 'relativeStart']
+
+# Non-modal commands making positions depend on the work offsets
+OFFSET_COMMANDS = ['G10', 'G28', 'G30', 'G53', 'G92', 'G92.1']
+
+# Plane: (first axis, second axis, first offset, second offset)
+PLANES = {
+  'G17': (0, 1, 'I', 'J'),
+  'G18': (2, 0, 'K', 'I'),
+  'G19': (1, 2, 'J', 'K'),
+}
+
+# Modal state after power up / reset
+DEFAULT_STATE = {
+  'motion': 'G0',
+  'wcs': 'G54',
+  'plane': 'G17',
+  'units': 'G21',
+  'distanceMode': 'G90',
+  'feedRateMode': 'G94',
+}
+
+# Modal groups restored by program end (M2/M30)
+PROGRAM_END_STATE = {
+  'motion': 'G1',
+  'wcs': 'G54',
+  'plane': 'G17',
+  'distanceMode': 'G90',
+  'feedRateMode': 'G94',
+}
+
+AXES = 'XYZ'
+
+# grbl's line buffer (comments and spaces are not stored)
+LINE_BUFFER_SIZE = 80
+
+# Plain moves: [G0|G1][X][Y][Z][F], in this order (F can't be negative)
+UNSIGNED = r'(?:[0-9]+\.?[0-9]*|\.[0-9]+)'
+SIGNED = r'[-+]?' + UNSIGNED
+fastLineRE = re.compile(r'(?:G0*([01])(?![0-9.]))?(?:X({0}))?(?:Y({0}))?(?:Z({0}))?(?:F({1}))?'.format(SIGNED, UNSIGNED))
+
+# Blocks of plain move lines (see Simulator.checkChunk())
+plainLineRE = re.compile(r'(?:G0*[01](?![0-9.]))?(?:X{0})?(?:Y{0})?(?:Z{0})?(?:F{1})?'.format(SIGNED, UNSIGNED))
+chunkWordRE = {letter: re.compile(letter + r'([-+.0-9]+)') for letter in 'XYZF'}
+chunkMotionRE = re.compile(r'G0*([01])')
+
+# Lines read at once by checkFile()
+CHUNK_SIZE = 1 << 16
+
+# System commands changing settings ($n=, $Nn=, $I=)
+settingLineRE = re.compile(r'\$(N[01]=.*|I=.*|[0-9]+=[-+]?[0-9.]+)')
+
+# Characters removed before parsing
+compactTable = str.maketrans('', '', ' \t\r\n')
+chunkTable = str.maketrans('', '', ' \t\r')
+
+
+# ------------------------------------------------------------------
+# Issue class
+
+class Issue:
+  ''' A line grbl would reject (error:N) or alarm on (ALARM:N) '''
+  __slots__ = ('lineNumber', 'line', 'code', 'desc', 'detail')
+
+  def __init__(self, lineNumber, line, code, detail=''):
+    self.lineNumber = lineNumber
+    self.line = line
+    self.code = code
+    self.detail = detail
+
+    kind, _, number = code.partition(':')
+    self.desc = dict.alarms.get(number, '') if kind == 'ALARM' else dict.errors.get(number, '')
+
+  def __str__(self):
+    detail = ' ({:})'.format(self.detail) if self.detail else ''
+    return 'Line {:d}: [{:}] {:}{:} - {:}'.format(
+      self.lineNumber, self.line, self.code, detail, self.desc)
+
+
+# ------------------------------------------------------------------
+# Simulator class
+
+class Simulator:
+
+  def __init__(self, cfg, mch=None):
+    ''' Construct a Simulator object.
+        mch (optional) provides modal state, offsets, position and limits.
+    '''
+    self.cfg = cfg
+    self.mch = mch
+    self.maxTravel = [cfg['machine']['maxTravel'][axis.lower()] for axis in AXES]
+    self.maxIssues = cfg['job']['checkMaxIssues']
+    self.cacheSize = cfg['job']['checkCacheSize']
+    self.cache = collections.OrderedDict()
+
+    self.reset()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def reset(self):
+    ''' Reset state (from the machine if available) and results '''
+    self.state = DEFAULT_STATE.copy()
+    self.feed = 0.0
+    self.scale = 1.0
+
+    # Work position (mm), None: unknown
+    self.pos = [None, None, None]
+
+    # Work coordinate systems, G92 and tool length offsets (mm, machine coords)
+    self.wcsOffsets = {wcs: [None, None, None] for wcs in dict.modalGroups['wcs']}
+    self.g92Offset = [None, None, None]
+    self.toolLengthOffset = None
+    self.storedPositions = {'G28': [None, None, None], 'G30': [None, None, None]}
+
+    # Machine limits (mm, machine coords), None: unknown
+    self.limits = None
+
+    if self.mch:
+      self.loadMachineState()
+
+    self.updateOffset()
+    self.updateFastPath()
+
+    self.lines = 0
+    self.issueCount = 0
+    self.issues = []
+    self.extents = [[None, None], [None, None], [None, None]]
+    self.machineExtents = [[None, None], [None, None], [None, None]]
+    self.offsetsUsed = False
+    self.startAxes = [True, True, True]
+    self.atStart = True
+    self.relativeStart = False
+    self.spanExceeded = [False, False, False]
+    self.outOfTravel = [False, False, False]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def loadMachineState(self):
+    ''' Get modal state, offsets, position and limits from the machine '''
+    status = self.mch.status
+    settings = status['settings']
+
+    parserState = status['parserState']
+    for group in self.state:
+      if group in parserState:
+        self.state[group] = parserState[group]['val']
+    if 'feed' in parserState:
+      self.feed = float(parserState['feed']['val'])
+    self.scale = 25.4 if self.state['units'] == 'G20' else 1.0
+
+    # Offsets and limits are only known after reading settings ($$) and parameters ($#)
+    if 23 not in settings:
+      return
+
+    # $13: positions reported in inches
+    report = 25.4 if settings.get(13, {}).get('val') == '1' else 1.0
+
+    params = status['GCodeParams']
+    for wcs in self.wcsOffsets:
+      self.wcsOffsets[wcs] = [params[wcs][axis.lower()] * report for axis in AXES]
+    for command in self.storedPositions:
+      self.storedPositions[command] = [params[command][axis.lower()] * report for axis in AXES]
+    self.g92Offset = [params['G92'][axis.lower()] * report for axis in AXES]
+    self.toolLengthOffset = params['TLO'] * report
+
+    if self.mch.getMachineState() == 'Idle':
+      wPos = status['WPos']
+      self.pos = [wPos['x'] * report, wPos['y'] * report, wPos['z'] * report]
+
+    try:
+      self.limits = []
+      for axis in AXES:
+        axis = axis.lower()
+        limits = [self.mch.wpos2mpos(axis, self.mch.getMin(axis)), self.mch.wpos2mpos(axis, self.mch.getMax(axis))]
+        self.limits.append((min(limits), max(limits)))
+    except (KeyError, ValueError):
+      self.limits = None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def updateOffset(self):
+    ''' Update work to machine coordinates offset (None: unknown) '''
+    wcsOffset = self.wcsOffsets[self.state['wcs']]
+    self.offset = [None, None, None]
+
+    for index in range(3):
+      if wcsOffset[index] is None or self.g92Offset[index] is None:
+        continue
+      self.offset[index] = wcsOffset[index] + self.g92Offset[index]
+
+    if self.offset[2] is not None:
+      self.offset[2] = None if self.toolLengthOffset is None else self.offset[2] + self.toolLengthOffset
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def updateFastPath(self):
+    ''' Check if plain moves can go through the fast path '''
+    state = self.state
+    self.fastPath = state['feedRateMode'] == 'G94'
+    self.fastMotion = state['motion'] if state['motion'] in ('G0', 'G1') else None
+    self.incremental = state['distanceMode'] == 'G91'
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def leaveStart(self, axes, relative):
+    ''' Axes (indexes) leaving the start position, relative: from it '''
+    for index in axes:
+      if self.startAxes[index]:
+        self.startAxes[index] = False
+        self.relativeStart = self.relativeStart or relative
+
+    self.atStart = True in self.startAxes
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getMachinePos(self, pos):
+    ''' Translate a work position into machine coordinates (None: unknown) '''
+    offset = self.offset
+    return [None if pos[i] is None or offset[i] is None else pos[i] + offset[i] for i in range(3)]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addIssue(self, line, code, detail=''):
+    ''' Record an issue (only the first maxIssues are kept) '''
+    self.issueCount += 1
+    if len(self.issues) < self.maxIssues:
+      self.issues.append(Issue(self.lines, line, code, detail))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getSummaryStr(self):
+    ''' Get a printable summary of the last check '''
+    extents = []
+    for index, axis in enumerate(AXES):
+      low, high = self.extents[index]
+      if low is not None:
+        extents.append('{:}[{:.3f}..{:.3f}]'.format(axis, low, high))
+
+    return 'Checked {:d} lines: {:d} issues{:}{:}'.format(
+      self.lines,
+      self.issueCount,
+      ' (showing {:d})'.format(len(self.issues)) if self.issueCount > len(self.issues) else '',
+      ' - extents (mm) ' + ' '.join(extents) if extents else '')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkFile(self, fileName):
+    ''' Check a G-code file (line numbers match the file's), call reset() first.
+        Returns True if no issues were found.
+    '''
+    key = (toolpath.hashFile(fileName), repr((self.state, self.feed, self.pos, self.wcsOffsets, self.g92Offset,
+      self.toolLengthOffset, self.storedPositions, self.limits, self.maxIssues)))
+
+    cached = self.cache.get(key)
+    if cached is not None:
+      self.cache.move_to_end(key)
+      for name in RESULTS:
+        setattr(self, name, copy.deepcopy(cached[name]))
+      return self.issueCount == 0
+
+    with open(fileName, 'r', encoding='utf-8', errors='replace') as file:
+      while True:
+        lines = file.readlines(CHUNK_SIZE)
+        if not lines:
+          break
+        if not self.checkChunk(lines):
+          self.checkLines(lines)
+
+    if self.cacheSize:
+      self.cache[key] = {name: copy.deepcopy(getattr(self, name)) for name in RESULTS}
+      while len(self.cache) > self.cacheSize:
+        self.cache.popitem(last=False)
+
+    return self.issueCount == 0
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkChunk(self, lines):
+    ''' Fast path for whole blocks of plain absolute G0/G1 lines with a feed
+        rate set (typical CAM output): validated with a single regex match,
+        travel checked with the block's extents.
+        Returns False (nothing done) if the block needs checkLines().
+    '''
+    if not self.fastPath or self.incremental or not self.fastMotion or not self.feed:
+      return False
+
+    # Raw length, longer than grbl's (spaces) but good enough to take the fast path
+    if max(map(len, lines)) >= LINE_BUFFER_SIZE:
+      return False
+
+    compact = ''.join(lines).translate(chunkTable).upper()
+    if '(' in compact or ';' in compact or not all(map(plainLineRE.fullmatch, compact.split('\n'))):
+      return False
+
+    feeds = chunkWordRE['F'].findall(compact) if 'F' in compact else None
+    if feeds and not all(map(float, feeds)):
+      return False
+
+    # Extents (and travel) for the whole block, per axis
+    scale = self.scale
+    newExtents = []
+    newMachineExtents = [list(extents) for extents in self.machineExtents]
+    newPos = list(self.pos)
+    for index, axis in enumerate(AXES):
+      values = chunkWordRE[axis].findall(compact) if axis in compact else None
+      if not values:
+        newExtents.append(self.extents[index])
+        continue
+
+      values = list(map(float, values))
+      chunkLow, chunkHigh = min(values) * scale, max(values) * scale
+      low, high = chunkLow, chunkHigh
+      if self.extents[index][0] is not None:
+        low, high = min(low, self.extents[index][0]), max(high, self.extents[index][1])
+      if high - low > self.maxTravel[index] and not self.spanExceeded[index]:
+        return False
+      if self.limits and self.offset[index] is not None:
+        limitLow, limitHigh = self.limits[index]
+        if chunkLow + self.offset[index] < limitLow or chunkHigh + self.offset[index] > limitHigh:
+          return False
+
+      newExtents.append([low, high])
+      newPos[index] = values[-1] * scale
+
+      if self.offset[index] is not None:
+        low, high = self.machineExtents[index]
+        chunkLow, chunkHigh = chunkLow + self.offset[index], chunkHigh + self.offset[index]
+        newMachineExtents[index] = [chunkLow, chunkHigh] if low is None else [min(low, chunkLow), max(high, chunkHigh)]
+
+    motions = chunkMotionRE.findall(compact)
+    if motions:
+      self.state['motion'] = self.fastMotion = 'G' + motions[-1]
+    if feeds:
+      self.feed = float(feeds[-1])
+
+    if self.atStart:
+      self.leaveStart([index for index, axis in enumerate(AXES) if axis in compact], False)
+
+    self.outOfTravel = [self.outOfTravel[index] and newPos[index] == self.pos[index] for index in range(3)]
+    self.extents = newExtents
+    self.machineExtents = newMachineExtents
+    self.pos = newPos
+    self.lines += len(lines)
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkLines(self, lines):
+    ''' Check a sequence of lines (raw, comments allowed), call reset() first.
+        Returns True if no issues were found.
+    '''
+    fastMatch = fastLineRE.fullmatch
+
+    for line in lines:
+      self.lines += 1
+
+      if '(' in line or ';' in line:
+        line = stripComments(line)
+      compact = line.translate(compactTable).upper()
+
+      if not compact or compact == '%':
+        continue
+
+      if len(compact) >= LINE_BUFFER_SIZE:
+        self.addIssue(line.strip(), 'error:11', '{:d} characters'.format(len(compact)))
+        continue
+
+      match = fastMatch(compact) if self.fastPath else None
+      if match and (match.group(1) or self.fastMotion):
+        self.checkPlainMove(compact, match.groups())
+      elif compact[0] == '$':
+        self.checkSystemCommand(compact)
+      else:
+        self.checkBlock(compact)
+
+    return self.issueCount == 0
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkPlainMove(self, line, groups):
+    ''' Fast path for [G0|G1][X][Y][Z][F] lines in G94 '''
+    motionWord, x, y, z, f = groups
+    hasAxes = x is not None or y is not None or z is not None
+    motion = 'G' + motionWord if motionWord is not None else self.fastMotion
+    feed = self.feed if f is None else float(f)
+
+    # Rejected lines don't change the modal state
+    if motion == 'G1' and not feed and (hasAxes or motionWord is not None):
+      self.addIssue(line, 'error:22')
+      return
+
+    self.feed = feed
+    self.state['motion'] = self.fastMotion = motion
+
+    if not hasAxes:
+      return
+
+    scale = self.scale
+    target = list(self.pos)
+    for index, value in enumerate((x, y, z)):
+      if value is not None:
+        value = float(value) * scale
+        if self.incremental:
+          if target[index] is not None:
+            target[index] += value
+        else:
+          target[index] = value
+
+    if self.atStart:
+      self.leaveStart([index for index, value in enumerate((x, y, z)) if value is not None], self.incremental)
+
+    self.moveTo(line, target)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def moveTo(self, line, target, arcBox=None):
+    ''' Check a move's target (and arc bounding box) and update position '''
+    points = [target] if arcBox is None else arcBox
+
+    for point in points:
+      if not self.checkTravel(line, point):
+        break
+
+    self.pos = target
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkTravel(self, line, point):
+    ''' Update extents with a (work) point, check it against machine travel.
+        Each axis is reported once until it's back in range.
+    '''
+    extents = self.extents
+    limits = self.limits
+    offset = self.offset
+    startAxes = self.startAxes
+    problems = []
+
+    for index in range(3):
+      value = point[index]
+      if value is None or startAxes[index]:
+        continue
+
+      low, high = extents[index]
+      if low is None:
+        extents[index] = [value, value]
+      elif value < low or value > high:
+        extents[index] = [min(low, value), max(high, value)]
+        low, high = extents[index]
+        if not self.spanExceeded[index] and high - low > self.maxTravel[index]:
+          self.spanExceeded[index] = True
+          problems.append('{:} span {:.3f}mm > maxTravel {:.3f}mm'.format(
+            AXES[index], high - low, self.maxTravel[index]))
+
+      if offset[index] is None:
+        continue
+
+      machineValue = value + offset[index]
+      low, high = self.machineExtents[index]
+      if low is None:
+        self.machineExtents[index] = [machineValue, machineValue]
+      elif machineValue < low or machineValue > high:
+        self.machineExtents[index] = [min(low, machineValue), max(high, machineValue)]
+
+      if limits:
+        low, high = limits[index]
+        if low <= machineValue <= high:
+          self.outOfTravel[index] = False
+        elif not self.outOfTravel[index]:
+          self.outOfTravel[index] = True
+          problems.append('{:} machine {:.3f}mm out of [{:.3f}..{:.3f}]'.format(
+            AXES[index], machineValue, low, high))
+
+    if problems:
+      self.addIssue(line, 'ALARM:2', ', '.join(problems))
+      return False
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkSystemCommand(self, line):
+    ''' Check a $ command (only jogging and homing change the simulation) '''
+    if line[:3] == '$J=':
+      self.checkJog(line)
+    elif line == '$H' or line[:2] == '$H' and line[2:] in AXES:
+      # Homing: position depends on switches
+      self.pos = [None, None, None]
+      self.offsetsUsed = True
+      self.leaveStart(range(3), False)
+    elif line in ('$', '$$', '$#', '$G', '$I', '$N', '$C', '$X', '$SLP') or line[:5] == '$RST=':
+      pass
+    elif settingLineRE.fullmatch(line) is None:
+      self.addIssue(line, 'error:3')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkJog(self, line):
+    ''' Check a jog command ($J=...): allowed words, feed and travel '''
+    words = self.splitWords(line, line[3:])
+    if words is None:
+      return
+
+    scale = self.scale
+    incremental = self.incremental
+    machine = False
+    hasFeed = False
+    target = list(self.pos)
+
+    for letter, number in words:
+      word = letter + number
+      if letter == 'G' and word in ('G20', 'G21', 'G90', 'G91', 'G53'):
+        if word in ('G20', 'G21'):
+          scale = 25.4 if word == 'G20' else 1.0
+        elif word == 'G53':
+          machine = True
+          self.offsetsUsed = True
+        else:
+          incremental = word == 'G91'
+      elif letter == 'F':
+        hasFeed = True
+      elif letter not in AXES:
+        self.addIssue(line, 'error:16')
+        return
+
+    if not hasFeed:
+      self.addIssue(line, 'error:22')
+      return
+
+    for letter, number in words:
+      if letter in AXES:
+        index = AXES.index(letter)
+        value = float(number) * scale
+        if machine:
+          target[index] = None if self.offset[index] is None else value - self.offset[index]
+        elif incremental:
+          target[index] = None if target[index] is None else target[index] + value
+        else:
+          target[index] = value
+
+    # Soft limits reject jogs with an error instead of an alarm
+    machinePos = self.getMachinePos(target)
+    if self.limits:
+      for index in range(3):
+        if machinePos[index] is not None and not self.limits[index][0] <= machinePos[index] <= self.limits[index][1]:
+          self.addIssue(line, 'error:15', '{:} machine {:.3f}mm'.format(AXES[index], machinePos[index]))
+          return
+
+    if self.atStart:
+      self.leaveStart([AXES.index(letter) for letter, _ in words if letter in AXES], incremental and not machine)
+
+    self.pos = target
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def splitWords(self, line, block):
+    ''' Split a block in (letter, number) words, records format errors '''
+    words = dict.blockWordRE.findall(block)
+
+    if sum([len(letter) + len(number) for letter, number in words]) != len(block):
+      # Something that is not a word: find it
+      rest = dict.blockWordRE.sub('', block)
+      self.addIssue(line, 'error:2' if rest[:1] in '0123456789.-+' else 'error:1')
+      return None
+
+    for letter, number in words:
+      if not number or number in ('+', '-', '.', '+.', '-.'):
+        self.addIssue(line, 'error:2', letter)
+        return None
+
+    return words
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getCommand(self, letter, number):
+    ''' Get (command, group) for a G/M word, (None, errorCode) if not supported '''
+    value = float(number)
+    command = '{:}{:g}'.format(letter, value)
+    table = G_COMMANDS if letter == 'G' else M_COMMANDS
+
+    if command in table:
+      return command, table[command]
+    if command in ('G59.1', 'G59.2', 'G59.3'):
+      return None, 'error:29'
+    if value != int(value) and '{:}{:d}'.format(letter, int(value)) in table:
+      return None, 'error:23'
+    return None, 'error:20'
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkBlock(self, line):
+    ''' Check a block with grbl's rules (see gcode.c), update state if valid '''
+    words = self.splitWords(line, line)
+    if words is None:
+      return
+
+    commands = {}
+    values = {}
+
+    # Words and modal group conflicts
+    for letter, number in words:
+      if letter == 'G' or letter == 'M':
+        command, group = self.getCommand(letter, number)
+        if command is None:
+          self.addIssue(line, group, letter + number)
+          return
+        if group in commands:
+          self.addIssue(line, 'error:21', '{:} {:}'.format(commands[group], command))
+          return
+        commands[group] = command
+      elif letter in VALUE_LETTERS:
+        if letter in values:
+          self.addIssue(line, 'error:25', letter)
+          return
+        values[letter] = float(number)
+      else:
+        self.addIssue(line, 'error:20', letter + number)
+        return
+
+    for letter in POSITIVE_LETTERS:
+      if values.get(letter, 0) < 0:
+        self.addIssue(line, 'error:4', letter)
+        return
+
+    if values.get('N', 0) > 9999999:
+      self.addIssue(line, 'error:27')
+      return
+
+    state = self.state
+    nonModal = commands.get('nonModal')
+    motion = commands.get('motion', state['motion'])
+    axisWords = [letter for letter in AXES if letter in values]
+    unused = set(values) - set('FNST') - set(AXES)
+
+    # Axis command (only one command can use axis words)
+    axisCommand = None
+    if nonModal in AXIS_COMMANDS:
+      axisCommand = nonModal
+    if 'toolLength' in commands and commands['toolLength'] == 'G43.1':
+      if axisCommand:
+        self.addIssue(line, 'error:24')
+        return
+      axisCommand = 'G43.1'
+    if 'motion' in commands and commands['motion'] != 'G80':
+      if axisCommand:
+        self.addIssue(line, 'error:24')
+        return
+      axisCommand = 'motion'
+    if axisWords and not axisCommand:
+      axisCommand = 'motion'
+
+    # Feed rate (switching back from G93 forgets the feed rate)
+    feedRateMode = commands.get('feedRateMode', state['feedRateMode'])
+    feed = self.feed
+    if feedRateMode == 'G94' and state['feedRateMode'] == 'G93':
+      feed = 0.0
+    if 'F' in values:
+      feed = values['F']
+
+    scale = 25.4 if commands.get('units', state['units']) == 'G20' else 1.0
+    plane = commands.get('plane', state['plane'])
+    incremental = commands.get('distanceMode', state['distanceMode']) == 'G91'
+
+    # Non-modal commands
+    if nonModal == 'G4':
+      if 'P' not in values:
+        self.addIssue(line, 'error:28', 'P')
+        return
+      unused.discard('P')
+
+    elif nonModal == 'G10':
+      if 'L' not in values or 'P' not in values:
+        self.addIssue(line, 'error:28', 'L/P')
+        return
+      if values['L'] not in (2, 20):
+        self.addIssue(line, 'error:20', 'L{:g}'.format(values['L']))
+        return
+      if values['P'] != int(values['P']) or values['P'] > 6:
+        self.addIssue(line, 'error:29', 'P{:g}'.format(values['P']))
+        return
+      if not axisWords:
+        self.addIssue(line, 'error:26')
+        return
+      unused.discard('L')
+      unused.discard('P')
+
+    elif nonModal == 'G92' and not axisWords:
+      self.addIssue(line, 'error:26')
+      return
+
+    elif nonModal == 'G53' and motion not in ('G0', 'G1'):
+      self.addIssue(line, 'error:30')
+      return
+
+    if axisCommand == 'G43.1' and axisWords != ['Z']:
+      self.addIssue(line, 'error:37')
+      return
+
+    # Motion
+    target = None
+    arcBox = None
+    if axisCommand == 'motion':
+      if motion == 'G80':
+        if axisWords:
+          self.addIssue(line, 'error:31')
+          return
+      else:
+        if motion != 'G0':
+          if feedRateMode == 'G93' and 'F' not in values:
+            self.addIssue(line, 'error:22', 'G93')
+            return
+          if feedRateMode == 'G94' and not feed:
+            self.addIssue(line, 'error:22')
+            return
+
+        target = self.getTarget(values, scale, incremental, nonModal == 'G53')
+
+        if motion in ('G2', 'G3'):
+          arcBox = self.checkArc(line, values, target, plane, motion, scale, unused)
+          if arcBox is False:
+            return
+        elif motion[:3] == 'G38':
+          if not axisWords:
+            self.addIssue(line, 'error:26')
+            return
+          if target == self.pos and None not in target:
+            self.addIssue(line, 'error:33')
+            return
+
+    if unused:
+      self.addIssue(line, 'error:36', ''.join(sorted(unused)))
+      return
+
+    # Valid block: apply it
+    self.applyBlock(line, commands, values, axisCommand, axisWords, feed, scale, incremental, target, arcBox)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getTarget(self, values, scale, incremental, machine=False):
+    ''' Get a move's target (work coords, mm) '''
+    target = list(self.pos)
+
+    for index, axis in enumerate(AXES):
+      if axis not in values:
+        continue
+
+      value = values[axis] * scale
+      if machine:
+        target[index] = None if self.offset[index] is None else value - self.offset[index]
+      elif incremental:
+        target[index] = None if target[index] is None else target[index] + value
+      else:
+        target[index] = value
+
+    return target
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkArc(self, line, values, target, plane, motion, scale, unused):
+    ''' Check an arc (errors 32..35).
+        Returns its bounding box points, None if unknown, False on errors.
+    '''
+    axis0, axis1, offset0, offset1 = PLANES[plane]
+
+    if AXES[axis0] not in values and AXES[axis1] not in values:
+      self.addIssue(line, 'error:32')
+      return False
+
+    start = self.pos
+    known = None not in (start[axis0], start[axis1], target[axis0], target[axis1])
+
+    if 'R' in values:
+      unused.discard('R')
+      if not known:
+        return None
+
+      x = target[axis0] - start[axis0]
+      y = target[axis1] - start[axis1]
+      radius = values['R'] * scale
+      if x == 0 and y == 0:
+        self.addIssue(line, 'error:33')
+        return False
+      hx2d = 4.0 * radius * radius - x * x - y * y
+      if hx2d < 0:
+        self.addIssue(line, 'error:34')
+        return False
+
+      # Center (see grbl's gcode.c)
+      hx2d = -math.sqrt(hx2d) / math.hypot(x, y)
+      if motion == 'G3':
+        hx2d = -hx2d
+      if radius < 0:
+        hx2d = -hx2d
+        radius = -radius
+      centerX = start[axis0] + 0.5 * (x - y * hx2d)
+      centerY = start[axis1] + 0.5 * (y + x * hx2d)
+
+    else:
+      if offset0 not in values and offset1 not in values:
+        self.addIssue(line, 'error:35')
+        return False
+      for letter in 'IJK':
+        unused.discard(letter)
+      if not known:
+        return None
+
+      centerX = start[axis0] + values.get(offset0, 0) * scale
+      centerY = start[axis1] + values.get(offset1, 0) * scale
+      radius = math.hypot(start[axis0] - centerX, start[axis1] - centerY)
+      delta = abs(math.hypot(target[axis0] - centerX, target[axis1] - centerY) - radius)
+      if delta > 0.005 and (delta > 0.5 or delta > 0.001 * radius):
+        self.addIssue(line, 'error:33', 'radius delta {:.4f}mm'.format(delta))
+        return False
+
+    return self.getArcBox(start, target, axis0, axis1, centerX, centerY, radius, motion == 'G2')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getArcBox(self, start, target, axis0, axis1, centerX, centerY, radius, clockwise):
+    ''' Get the points defining an arc's bounding box (end points and crossed quadrants) '''
+    startAngle = math.atan2(start[axis1] - centerY, start[axis0] - centerX)
+    endAngle = math.atan2(target[axis1] - centerY, target[axis0] - centerX)
+    sweep = (startAngle - endAngle) if clockwise else (endAngle - startAngle)
+    sweep %= 2 * math.pi
+    if sweep < 1e-9:
+      sweep = 2 * math.pi
+
+    points = [target]
+    for quadrant in range(4):
+      angle = quadrant * math.pi / 2
+      offset = ((startAngle - angle) if clockwise else (angle - startAngle)) % (2 * math.pi)
+      if offset <= sweep:
+        point = list(target)
+        point[axis0] = centerX + radius * math.cos(angle)
+        point[axis1] = centerY + radius * math.sin(angle)
+        points.append(point)
+
+    return points
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def applyBlock(self, line, commands, values, axisCommand, axisWords, feed, scale, incremental, target, arcBox):
+    ''' Apply a valid block to the simulation state '''
+    state = self.state
+    nonModal = commands.get('nonModal')
+
+    if nonModal in OFFSET_COMMANDS or 'toolLength' in commands or commands.get('wcs', state['wcs']) != state['wcs']:
+      self.offsetsUsed = True
+
+    for group in DEFAULT_STATE:
+      if group in commands:
+        state[group] = commands[group]
+
+    self.feed = feed
+    self.scale = scale
+
+    # Axes set by the block, from the start position for incremental moves,
+    # arcs (center), offsets (G92, G10 L20) and stored positions (G28.1/G30.1)
+    if self.atStart and (axisCommand == 'motion' and axisWords or axisCommand in AXIS_COMMANDS or nonModal in ('G28.1', 'G30.1')):
+      relative = nonModal in ('G10', 'G92', 'G28.1', 'G30.1') \
+        or (axisCommand == 'motion' and state['motion'] in ('G2', 'G3')) \
+        or (incremental and nonModal != 'G53')
+      self.leaveStart([AXES.index(axis) for axis in axisWords] or range(3), relative)
+
+    if commands.get('toolLength') == 'G49':
+      self.toolLengthOffset = 0.0
+    elif axisCommand == 'G43.1':
+      self.toolLengthOffset = values['Z'] * scale
+
+    if nonModal == 'G10':
+      self.setCoordinateSystem(values, axisWords, scale)
+    elif nonModal == 'G92':
+      machinePos = self.getMachinePos(self.pos)
+      wcsOffset = self.wcsOffsets[state['wcs']]
+      for axis in axisWords:
+        index = AXES.index(axis)
+        value = values[axis] * scale
+        known = None not in (machinePos[index], wcsOffset[index])
+        if index == 2:
+          known = known and self.toolLengthOffset is not None
+        self.g92Offset[index] = machinePos[index] - wcsOffset[index] - value - (self.toolLengthOffset if index == 2 else 0) if known else None
+        self.pos[index] = value
+    elif nonModal == 'G92.1':
+      self.g92Offset = [0.0, 0.0, 0.0]
+    elif nonModal in ('G28.1', 'G30.1'):
+      self.storedPositions[nonModal[:3]] = self.getMachinePos(self.pos)
+
+    self.updateOffset()
+
+    if nonModal in ('G28', 'G30'):
+      # Intermediate point, then the stored position
+      if axisWords:
+        self.moveTo(line, self.getTarget(values, scale, incremental))
+      stored = self.storedPositions[nonModal]
+      for index in range(3):
+        if not axisWords or AXES[index] in axisWords:
+          self.pos[index] = None if stored[index] is None or self.offset[index] is None else stored[index] - self.offset[index]
+      self.moveTo(line, list(self.pos))
+
+    elif target is not None:
+      self.moveTo(line, target, arcBox)
+
+      # Probing stops anywhere
+      if state['motion'][:3] == 'G38':
+        for axis in axisWords:
+          self.pos[AXES.index(axis)] = None
+
+    if commands.get('program') in ('M2', 'M30'):
+      state.update(PROGRAM_END_STATE)
+      self.updateOffset()
+
+    self.updateFastPath()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setCoordinateSystem(self, values, axisWords, scale):
+    ''' G10 L2/L20: set a work coordinate system's offsets '''
+    number = int(values['P'])
+    wcs = self.state['wcs'] if number == 0 else 'G{:d}'.format(53 + number)
+    offsets = self.wcsOffsets[wcs]
+    machinePos = self.getMachinePos(self.pos)
+
+    for axis in axisWords:
+      index = AXES.index(axis)
+      value = values[axis] * scale
+
+      if values['L'] == 2:
+        offsets[index] = value
+        continue
+
+      # L20: current position becomes value
+      known = None not in (machinePos[index], self.g92Offset[index])
+      if index == 2:
+        known = known and self.toolLengthOffset is not None
+      offsets[index] = machinePos[index] - self.g92Offset[index] - value - (self.toolLengthOffset if index == 2 else 0) if known else None
+
+      if wcs == self.state['wcs']:
+        self.pos[index] = value
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def stripComments(line):
+  ''' Remove (...) and ; comments '''
+  pos = line.find(';')
+  if pos != -1:
+    line = line[:pos]
+
+  pos = line.find('(')
+  while pos != -1:
+    end = line.find(')', pos)
+    if end == -1:
+      return line[:pos]
+    line = line[:pos] + line[end+1:]
+    pos = line.find('(')
+
+  return line
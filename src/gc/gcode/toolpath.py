@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+'''
+gcode - toolpath
+================
+Parsed toolpaths and their on-disk cache
+
+A Toolpath holds a program's moves as columns (one entry per segment, arcs
+already split like grbl does):
+  - x, y, z: segment end (mm, NaN: unknown), the start is the previous end.
+    Each axis is relative to the toolpath's start position (0 at the start)
+    before its startRows segment, in work coordinates from it on (the
+    start position can change when reading it back unless startUsed: arcs
+    or G93 moves needed it to get there)
+  - feed: mm/min (effective feed for G93 moves)
+  - line: line number
+  - motion: 0 (G0), 1 (G1), 2 (G2), 3 (G3), 4 (G38.x), 5 (none: position
+    changed without moving, e.g. G92 or an unknown position after G28)
+  - sync: 1 if the machine stops before the segment (dwell, spindle...)
+plus its sections (comment lines), dwell time and whether it touches the
+work offsets (G10, G28, G30, G53, G92, coordinate system or tool length
+changes, homing): if it doesn't, getBox() plus the start offset is its
+machine bounding box.
+
+Cached toolpaths are written in a compact binary form:
+  'GCTP' version(u16) headerSize(u32) header(JSON) column... column
+with every column 8-byte aligned, and memory-mapped when read back (columns
+are memoryviews on the file, nothing is parsed).
+
+The cache keeps the most recently used files (mtime) up to a total size.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import array
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Column names and array typecodes
+COLUMNS = (('x', 'd'), ('y', 'd'), ('z', 'd'), ('feed', 'd'), ('line', 'I'), ('motion', 'B'), ('sync', 'B'))
+
+# Motion codes
+MOTIONS = {'G0': 0, 'G1': 1, 'G2': 2, 'G3': 3, 'G38': 4, 'NONE': 5}
+
+MAGIC = b'GCTP'
+VERSION = 4
+PREFIX = struct.Struct('<4sHI')
+ALIGNMENT = 8
+FILE_EXTENSION = '.gctp'
+
+# Bytes read at once when hashing files
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# ------------------------------------------------------------------
+# Toolpath class
+
+class Toolpath:
+  ''' A program's moves (see module docs), columns are array.array,
+      NumPy arrays or memoryviews (mapped from a cache file).
+  '''
+
+  def __init__(self, columns, start, sections, dwellTime, lines, offsetsUsed=False, startRows=(None, None, None),
+    startUsed=False):
+    self.columns = columns
+    self.start = start
+    self.startRows = list(startRows)
+    self.startUsed = startUsed
+    self.sections = sections
+    self.dwellTime = dwellTime
+    self.lines = lines
+    self.offsetsUsed = offsetsUsed
+    self.count = len(columns['x'])
+    self.map = None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getSegment(self, index):
+    ''' Get (start, end, feed, motion, line) for a segment '''
+    columns = self.columns
+    return self.getPoint(index - 1), self.getPoint(index), columns['feed'][index], columns['motion'][index], \
+      columns['line'][index]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getPoint(self, index):
+    ''' Get a segment end in work coordinates (index -1: the start position, None: unknown) '''
+    point = []
+    for axis, start, row in zip('xyz', self.start, self.startRows):
+      value = 0.0 if index < 0 else self.columns[axis][index]
+      if row is None or index < row:
+        value = None if start is None else value + start
+      elif math.isnan(value):
+        value = None
+      point.append(value)
+    return point
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getBox(self):
+    ''' Get the bounding box of the start position and segment ends
+        ([[low, high]] per axis in work coordinates, None: unknown)
+    '''
+    box = []
+    for axis, start, row in zip('xyz', self.start, self.startRows):
+      column = self.columns[axis]
+      end = self.count if row is None else row
+      if numpy is not None:
+        values = numpy.asarray(column)
+        values = numpy.concatenate((values[end:], values[:end] + start)) if start is not None else values[end:]
+        values = values[~numpy.isnan(values)]
+        low, high = (float(values.min()), float(values.max())) if len(values) else (None, None)
+      else:
+        values = [value for value in column[end:] if not math.isnan(value)]
+        if start is not None:
+          values.extend(value + start for value in column[:end])
+        low, high = (min(values), max(values)) if values else (None, None)
+
+      if start is not None:
+        low, high = (start, start) if low is None else (min(low, start), max(high, start))
+      box.append([low, high])
+
+    return box
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def save(self, fileName):
+    ''' Write to a binary file '''
+    header = json.dumps({
+      'count': self.count,
+      'start': self.start,
+      'sections': self.sections,
+      'dwellTime': self.dwellTime,
+      'lines': self.lines,
+      'offsetsUsed': self.offsetsUsed,
+      'startRows': self.startRows,
+      'startUsed': self.startUsed,
+      'columns': COLUMNS,
+    }).encode('utf-8')
+
+    with open(fileName, 'wb') as file:
+      file.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+      file.write(header)
+      position = PREFIX.size + len(header)
+
+      for name, typecode in COLUMNS:
+        position += file.write(b'\0' * (-position % ALIGNMENT))
+        data = memoryview(self.columns[name])
+        if data.format != typecode or not data.contiguous:
+          data = memoryview(array.array(typecode, data.tolist() if typecode == 'd' else map(int, data.tolist())))
+        position += file.write(data)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def close(self):
+    ''' Release the file mapping (if columns are no longer in use) '''
+    if self.map is None:
+      return
+
+    self.columns = {}
+    try:
+      self.map.close()
+    except BufferError:
+      pass
+    self.map = None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def load(fileName):
+  ''' Map a binary toolpath file, returns a Toolpath (None if not valid) '''
+  with open(fileName, 'rb') as file:
+    try:
+      fileMap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      return None
+
+  view = memoryview(fileMap)
+  try:
+    magic, version, headerSize = PREFIX.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+      raise ValueError('Unsupported toolpath file')
+
+    position = PREFIX.size + headerSize
+    header = json.loads(bytes(view[PREFIX.size:position]).decode('utf-8'))
+    if [tuple(column) for column in header['columns']] != list(COLUMNS):
+      raise ValueError('Unsupported toolpath columns')
+
+    count = header['count']
+    columns = {}
+    for name, typecode in COLUMNS:
+      position += -position % ALIGNMENT
+      size = count * array.array(typecode).itemsize
+      if position + size > len(view):
+        raise ValueError('Truncated toolpath file')
+      columns[name] = view[position:position + size].cast(typecode)
+      position += size
+  except (ValueError, KeyError, struct.error):
+    view.release()
+    fileMap.close()
+    return None
+
+  toolpath = Toolpath(columns, header['start'], header['sections'], header['dwellTime'], header['lines'],
+    header['offsetsUsed'], header['startRows'], header['startUsed'])
+  toolpath.map = fileMap
+  return toolpath
+
+
+# ------------------------------------------------------------------
+# ToolpathCache class
+
+class ToolpathCache:
+
+  def __init__(self, cfg):
+    ''' Construct a ToolpathCache object.
+    '''
+    self.cfg = cfg
+    self.folder = cfg['job']['toolpathCacheFolder']
+    self.maxSize = cfg['job']['toolpathCacheSize'] * 1024 * 1024
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getFileName(self, key):
+    ''' Get the cache file for a key '''
+    return os.path.join(self.folder, key + FILE_EXTENSION)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def get(self, key):
+    ''' Get a cached Toolpath (None if not cached) '''
+    fileName = self.getFileName(key)
+
+    try:
+      toolpath = load(fileName)
+      if toolpath is not None:
+        os.utime(fileName)
+    except OSError:
+      return None
+
+    return toolpath
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def put(self, key, toolpath):
+    ''' Store a Toolpath, then evict the least recently used ones over maxSize.
+        Returns False if it could not be written.
+    '''
+    fileName = self.getFileName(key)
+    tempName = fileName + '.tmp'
+
+    try:
+      os.makedirs(self.folder, exist_ok=True)
+      toolpath.save(tempName)
+      os.replace(tempName, fileName)
+    except OSError:
+      return False
+
+    self.evict()
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def evict(self):
+    ''' Remove the least recently used files until the cache fits in maxSize '''
+    try:
+      entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith(FILE_EXTENSION)]
+      files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+    except OSError:
+      return
+
+    totalSize = 0
+    for _, size, path in files:
+      totalSize += size
+      if totalSize > self.maxSize:
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def hashFile(fileName):
+  ''' Get a file's content hash '''
+  digest = hashlib.sha1()
+
+  with open(fileName, 'rb') as file:
+    while True:
+      block = file.read(HASH_BLOCK_SIZE)
+      if not block:
+        break
+      digest.update(block)
+
+  return digest.hexdigest()
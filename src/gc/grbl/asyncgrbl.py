@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+'''
+grbl - asyncgrbl
+================
+asyncio front-end for the Grbl class
+
+Usage example:
+
+  async def main():
+    amch = asyncgrbl.AsyncGrbl(cfg, ui)
+    await amch.start()
+    await amch.send('G0 X10')
+    await amch.waitForMachineIdle()
+    async for status in amch.statusReports():
+      ...
+
+Synchronous code sharing a started Grbl can run coroutines from its own
+event loop (AsyncGrbl only parses serial lines while the loop runs):
+
+  amch = asyncgrbl.AsyncGrbl(cfg, ui, mch)
+  loop.run_until_complete(amch.attach())
+  amch.run(amch.waitForMachineIdle())
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import time
+import asyncio
+
+from . import grbl
+
+# ------------------------------------------------------------------
+# AsyncGrbl class
+
+class AsyncGrbl:
+
+  def __init__(self, cfg, ui, mch=None):
+    ''' Construct an AsyncGrbl object.
+        An existing Grbl object can be provided to share its status.
+    '''
+    self.cfg = cfg
+    self.ui = ui
+    self.spCfg = cfg['serial']
+
+    self.mch = mch if mch else grbl.Grbl(cfg, ui)
+    self.sp = self.mch.sp
+
+    self.loop = None
+    self.tasks = []
+    self.lineEvent = None
+    self.bufferEvent = None
+    self.statusEvent = None
+    self.pollEvent = None
+
+    self.statusListeners = []
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def start(self):
+    ''' Start connection with grblShield and the background tasks '''
+    # Startup sequence is a one-off, let the sync Grbl do it in a worker thread
+    await asyncio.get_running_loop().run_in_executor(None, self.mch.start)
+
+    await self.attach()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def attach(self):
+    ''' Start the background tasks on an already started Grbl '''
+    self.loop = asyncio.get_running_loop()
+    self.lineEvent = asyncio.Event()
+    self.bufferEvent = asyncio.Event()
+    self.statusEvent = asyncio.Event()
+    self.pollEvent = asyncio.Event()
+
+    self.sp.onLineReceived.append(self.onLineReceived)
+
+    self.tasks = [
+      self.loop.create_task(self.readLoop()),
+      self.loop.create_task(self.statusQueryLoop()),
+    ]
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def stop(self):
+    ''' Stop background tasks and connection with grblShield '''
+    await self.detach()
+
+    self.mch.stop()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def detach(self):
+    ''' Stop the background tasks (Grbl stays connected) '''
+    if self.onLineReceived in self.sp.onLineReceived:
+      self.sp.onLineReceived.remove(self.onLineReceived)
+
+    for task in self.tasks:
+      task.cancel()
+
+    await asyncio.gather(*self.tasks, return_exceptions=True)
+    self.tasks = []
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def run(self, coroutine):
+    ''' Run a coroutine from synchronous code (see attach()).
+        Returns the coroutine's result.
+        attach() must have run first on the loop used here.
+    '''
+    if not self.loop:
+      coroutine.close()
+      raise RuntimeError('AsyncGrbl not attached, run attach() on an event loop first')
+
+    # Lines queued while the loop was stopped
+    self.lineEvent.set()
+
+    return self.loop.run_until_complete(coroutine)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def onLineReceived(self):
+    ''' Serial reader thread listener, wakes up readLoop() '''
+    # Lines received while the loop is stopped are left for the sync Grbl
+    # (or picked up by run())
+    if self.loop.is_running():
+      self.loop.call_soon_threadsafe(self.lineEvent.set)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def readLoop(self):
+    ''' Parse serial lines as they arrive '''
+    while True:
+      await self.lineEvent.wait()
+      self.lineEvent.clear()
+
+      line = self.sp.readline()
+      while line:
+        self.parse(line)
+        line = self.sp.readline()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parse(self, line):
+    ''' Parse a line (bytes), Grbl resolves the pending tickets '''
+    pendingTickets = len(self.mch.pendingTickets)
+
+    self.mch.parse(line)
+
+    # Responses/alarms/resets free RX buffer space
+    if len(self.mch.pendingTickets) != pendingTickets:
+      self.bufferEvent.set()
+
+    if line[:1] == b'<':
+      self.statusEvent.set()
+      self.statusEvent = asyncio.Event()
+      for listener in self.statusListeners:
+        listener.put_nowait(self.mch.status)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def statusQueryLoop(self):
+    ''' Automatic periodic machine status queries (see Grbl.poller) '''
+    while True:
+      if self.mch.poller.isQueryDue(self.mch.getMachineState()):
+        self.mch.queryMachineStatus()
+
+      delay = self.mch.getNextStatusQueryDelay()
+      delay = self.mch.WAITIDLE_SLEEP if delay is None else max(delay, 0)
+
+      # send() wakes us up for immediate queries
+      self.pollEvent.clear()
+      try:
+        await asyncio.wait_for(self.pollEvent.wait(), delay)
+      except asyncio.TimeoutError:
+        pass
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def send(self, command, responseTimeout=None, verbose='BASIC'):
+    ''' Send a command (character counting) and wait for its response.
+        Several send() calls can be awaited concurrently, their lines are
+        pipelined into grbl's RX buffer.
+        Returns the response lines (data lines + ok/error:N).
+    '''
+    if not responseTimeout and self.mch.stripCommand(command).upper() == self.mch.GRBL_HOMING_CYCLE:
+      responseTimeout = float(self.mch.mchCfg['homingTimeout'])
+
+    ticket = await self.sendNoWait(command, verbose=verbose)
+    if not ticket:
+      return []
+
+    await self.waitForTicket(ticket, responseTimeout=responseTimeout)
+
+    return ticket.getResponse()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def sendNoWait(self, command, verbose='BASIC'):
+    ''' Send a command, waiting only for room in grbl's RX buffer.
+        Returns the command's Ticket (see Grbl.writeLine()), None if the
+        line could not be sent.
+    '''
+    command = self.mch.minimizer.minimize(self.mch.stripCommand(command))
+    if not command:
+      return None
+
+    if command.upper() == self.mch.GRBL_QUERY_GCODE_PARSER_STATE:
+      self.mch.showNextParserState = True
+
+    lineLen = len(command) + 1
+
+    # Same check as Grbl.waitForRoom(), it would never fit
+    if lineLen > self.mch.GRBL_RX_BUFFER_SIZE:
+      self.ui.log('ERROR: line too long for grbl RX buffer ({:d} chars) [{:}]'.format(lineLen, command),
+        c='ui.errorMsg', v='ERROR')
+      self.mch.minimizer.rollback()
+      return None
+
+    # Same timeout as Grbl.waitForRoom() (no timeout while the machine is busy)
+    while self.mch.streamBufferUsed + lineLen > self.mch.GRBL_RX_BUFFER_SIZE:
+      self.bufferEvent.clear()
+      try:
+        await asyncio.wait_for(self.bufferEvent.wait(), self.spCfg['responseTimeout'])
+      except asyncio.TimeoutError:
+        if self.mch.isBusy():
+          continue
+        self.ui.log('ERROR: TIMEOUT Waiting for room in grbl RX buffer [{:}]'.format(command),
+          c='ui.errorMsg', v='ERROR')
+        self.mch.resyncTickets()
+        self.mch.minimizer.rollback()
+        return None
+
+    if not self.mch.streaming:
+      self.mch.startStream()
+
+    ticket = self.mch.writeLine(command, streamed=True, showResponse=False, verbose=verbose)
+    self.mch.streamTicket(ticket)
+
+    if self.mch.poller.immediate:
+      self.pollEvent.set()
+
+    return ticket
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def waitForTicket(self, ticket, responseTimeout=None):
+    ''' Wait for a command's response (tickets are resolved by readLoop()).
+        On timeout the in-flight tickets are cancelled (see Grbl.resyncTickets()).
+    '''
+    if responseTimeout is None:
+      responseTimeout = self.spCfg['responseTimeout']
+
+    if not ticket.isDone():
+      future = self.loop.create_future()
+
+      def onResolved(ticket):
+        if not future.done():
+          future.set_result(ticket)
+
+      ticket.addCallback(onResolved)
+      try:
+        await asyncio.wait_for(future, responseTimeout)
+      except asyncio.TimeoutError:
+        self.ui.log('waitForTicket() - TIMEOUT Waiting for response from serial', c='ui.errorMsg', v='ERROR')
+        self.mch.resyncTickets()
+        return ticket
+
+    if not self.mch.pendingTickets:
+      self.mch.waitForStreamEnd()
+
+    return ticket
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def getMachineStatus(self, timeout=None):
+    ''' Query machine status and wait for the report '''
+    if timeout is None:
+      timeout = self.spCfg['responseTimeout']
+
+    statusEvent = self.statusEvent
+    self.mch.queryMachineStatus()
+
+    try:
+      await asyncio.wait_for(statusEvent.wait(), timeout)
+    except asyncio.TimeoutError:
+      self.ui.log('TIMEOUT Waiting for machine status', v='WARNING')
+
+    return self.mch.status
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def waitForMachineIdle(self, timeout=None):
+    ''' Wait for machine operation to finish.
+        Returns False on timeout.
+    '''
+    self.ui.log('Waiting for machine operation to finish...', v='SUPER')
+    startTime = time.time()
+
+    await self.getMachineStatus()
+
+    while self.mch.isRunning():
+      if timeout is not None and (time.time() - startTime) > timeout:
+        self.ui.log('TIMEOUT Waiting for machine operation to finish', v='WARNING')
+        return False
+
+      await asyncio.sleep(self.mch.WAITIDLE_SLEEP)
+      await self.getMachineStatus()
+
+    self.ui.log('Machine operation finished', v='SUPER')
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def sendWait(self, command, verbose='BASIC'):
+    ''' Send a command and wait for machine to be idle '''
+    response = await self.send(command, verbose=verbose)
+    await self.waitForMachineIdle()
+    return response
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  async def statusReports(self):
+    ''' Async iterator over machine status reports
+        (yields the shared Grbl status object after each report)
+    '''
+    listener = asyncio.Queue()
+    self.statusListeners.append(listener)
+
+    try:
+      while True:
+        yield await listener.get()
+    finally:
+      self.statusListeners.remove(listener)
@@ -8,6 +8,9 @@ grbl dictionary
 if __name__ == '__main__':
   print('This file is a module, it should not be executed directly')
 
+import re
+import types
+
 # See: https://github.com/gnea/grbl/blob/master/doc/csv/error_codes_en_US.csv
 errors = {
    '1': 'G-code words consist of a letter and a value. Letter was not found.',
@@ -193,6 +196,19 @@ modalGroups = {
 }
 
 
+# Reverse index for modal lookups (read-only, built once)
+#   'G1' => ('motion', 'linear')
+#   'F'  => ('feed', 'feedRate')   (value words are indexed by letter)
+modalIndex = types.MappingProxyType({
+  word: (groupName, name)
+    for groupName, group in modalGroups.items()
+      for word, name in group.items()
+})
+
+# Block word splitter ('G1X10.5F800' => [('G','1'), ('X','10.5'), ('F','800')])
+blockWordRE = re.compile(r'([A-Z])\s*([-+]?[0-9]*\.?[0-9]*)')
+
+
 # See: https://github.com/gnea/grbl/wiki/Grbl-v1.1-Interface
 # <...|Pn:XYZPDHRS|...>
 inputPinStates = {
@@ -220,27 +236,63 @@ class Dict:
     self.settings = settings
     self.options = options
     self.modalGroups = modalGroups
+    self.modalIndex = modalIndex
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def lookupModalWord(self, word):
+    ''' Get (group, name, value) for a modal word ('G1', 'G01', 'M3', 'F800'...)
+        Returns None for non-modal words.
+          - G/M words: value is the normalized word ('G01' => 'G1')
+          - Value words (F/S/T): value is the number ('F800' => '800')
+    '''
+    entry = modalIndex.get(word)
+    if entry:
+      return entry + (word,)
+
+    letter = word[:1]
+    value = word[1:]
+
+    if letter == 'G' or letter == 'M':
+      # Leading zeros ('G01', 'M03')
+      normalized = letter + (value.lstrip('0') or '0')
+      if normalized[1:2] == '.':
+        normalized = letter + '0' + normalized[1:]
+      entry = modalIndex.get(normalized)
+      return entry + (normalized,) if entry else None
+
+    entry = modalIndex.get(letter)
+    return entry + (value,) if entry else None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def classifyBlock(self, block):
+    ''' Get modal words in a gcode block (comments must be removed)
+        Returns a list of (group, name, value, original) tuples,
+        the same data parserState keeps for each modal group.
+    '''
+    result = []
+
+    for letter, number in blockWordRE.findall(block.upper()):
+      original = letter + number
+      entry = self.lookupModalWord(original)
+      if entry:
+        result.append(entry + (original,))
+
+    return result
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getModalGroup(self, command):
     ''' Get modal group name for gcode command
     '''
-    for groupName in self.modalGroups:
-      group = self.modalGroups[groupName]
-      if command in group:
-        return groupName
-
-    return ''
+    entry = modalIndex.get(command)
+    return entry[0] if entry else ''
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getModalCommandName(self, command):
     ''' Get modal group name for gcode command
     '''
-    for groupName in self.modalGroups:
-      group = self.modalGroups[groupName]
-      if command in group:
-        return group[command]
-
-    return ''
+    entry = modalIndex.get(command)
+    return entry[1] if entry else ''
@@ -9,9 +9,16 @@ if __name__ == '__main__':
   print('This file is a module, it should not be executed directly')
 
 import time
+import collections
+import threading
 
 from . import serialport
 from . import dict
+from . import status as machineStatus
+from . import modal
+from . import poller
+from . import ticket as grblTicket
+from . import minimizer
 
 # ------------------------------------------------------------------
 # Grbl class
@@ -21,10 +28,12 @@ class Grbl:
   def __init__(self, cfg, ui):
     ''' Construct a Grbl object. '''
     self.initConstants()
+    self.initLineParsers()
 
     self.cfg = cfg
     self.ui = ui
     self.spCfg = cfg['serial']
+    self.parserStateCheckInterval = self.spCfg['parserStateCheckInterval']
     self.mchCfg = cfg['machine']
     self.mcrCfg = cfg['macro']
     self.uiCfg = cfg['ui']
@@ -32,43 +41,28 @@ class Grbl:
     self.dct = dict.Dict()
 
     self.waitingStartup = True
-    self.waitingResponse = False
-    self.response = []
-    self.lastMachineStatusQuery = 0
     self.lastParserStateQuery = 0
     self.lastParserStateStr = ''
+    self.lastLiveStatus = 0
     self.onParserStateChanged = []
+    self.onMachineStateChanged = []
+    self.machineStateChanged = threading.Event()
     self.statusQuerySent = False
     self.waitingMachineStatus = False
     self.showNextMachineStatus = False
     self.showNextParserState = True
-    self.ignoreNextLine = False
     self.lastMessage = ''
     self.alarm = ''
-    self.status = {
-      'str': '',
-      'MPos': {'desc':'machinePos', 'x':0.000, 'y':0.000, 'z':0.000},
-      'WPos': {'desc':'workPos', 'x':0.000, 'y':0.000, 'z':0.000},
-      'WCO': {'desc':'workCoords', 'x':0.000, 'y':0.000, 'z':0.000},
-      'settings': {},
-      'parserState': {
-        'str': '',
-      },
-      'GCodeParams': {
-        'G54': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G55': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G56': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G57': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G58': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G59': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G28': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G30': {'x':0.000, 'y':0.000, 'z':0.000},
-        'G92': {'x':0.000, 'y':0.000, 'z':0.000},
-        'PRB': {'x':0.000, 'y':0.000, 'z':0.000, 'success': False},
-        'TLO': 0.000,
-      },
-      'inputPinState': self.parseInputPinState('')
-    }
+    self.streaming = False
+    self.pendingTickets = collections.deque()
+    self.streamBufferUsed = 0
+    self.lostTickets = collections.deque()
+    self.resyncQueryPending = False
+    self.streamStats = self.getEmptyStreamStats()
+    self.status = machineStatus.MachineStatus()
+    self.modal = modal.ModalTracker(self.dct, self.status['parserState'])
+    self.poller = poller.StatusPoller(cfg)
+    self.minimizer = minimizer.Minimizer(cfg, self)
 
     self.sp = serialport.SerialPort(self.cfg, self.ui)
 
@@ -77,6 +71,26 @@ class Grbl:
   def initConstants(self):
     ''' Provide constants '''
     self.GRBL_SOFT_RESET = '%c' % 24
+    self.GRBL_RT_FEED_HOLD = '!'
+    self.GRBL_RT_CYCLE_START = '~'
+    self.GRBL_RT_SAFETY_DOOR = '%c' % 0x84
+    self.GRBL_RT_JOG_CANCEL = '%c' % 0x85
+    self.GRBL_RT_FEED_OVR_RESET = '%c' % 0x90
+    self.GRBL_RT_FEED_OVR_PLUS_10 = '%c' % 0x91
+    self.GRBL_RT_FEED_OVR_MINUS_10 = '%c' % 0x92
+    self.GRBL_RT_FEED_OVR_PLUS_1 = '%c' % 0x93
+    self.GRBL_RT_FEED_OVR_MINUS_1 = '%c' % 0x94
+    self.GRBL_RT_RAPID_OVR_RESET = '%c' % 0x95
+    self.GRBL_RT_RAPID_OVR_50 = '%c' % 0x96
+    self.GRBL_RT_RAPID_OVR_25 = '%c' % 0x97
+    self.GRBL_RT_SPINDLE_OVR_RESET = '%c' % 0x99
+    self.GRBL_RT_SPINDLE_OVR_PLUS_10 = '%c' % 0x9A
+    self.GRBL_RT_SPINDLE_OVR_MINUS_10 = '%c' % 0x9B
+    self.GRBL_RT_SPINDLE_OVR_PLUS_1 = '%c' % 0x9C
+    self.GRBL_RT_SPINDLE_OVR_MINUS_1 = '%c' % 0x9D
+    self.GRBL_RT_SPINDLE_STOP = '%c' % 0x9E
+    self.GRBL_RT_FLOOD_COOLANT = '%c' % 0xA0
+    self.GRBL_RT_MIST_COOLANT = '%c' % 0xA1
     self.GRBL_QUERY_MACHINE_STATUS = '?'
     self.GRBL_QUERY_GCODE_PARSER_STATE = '$G'
     self.GRBL_HOMING_CYCLE = '$H'
@@ -87,7 +101,10 @@ class Grbl:
     self.GRBL_ENABLE_SLEEP_MODE = '$SLP'
     self.GCODE_RESET_WCO_PREFIX = 'G10L2P0'
 
+    self.GRBL_RX_BUFFER_SIZE = 128
+
     self.PERIODIC_QUERY_INTERVAL = 0.5
+    self.LIVE_STATUS_INTERVAL = 0.1
     self.PROCESS_SLEEP = 0.05
     self.WAITIDLE_SLEEP = 0.15
     self.WAITSTARTUP_TIME = 2
@@ -136,10 +153,39 @@ class Grbl:
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def softReset(self):
     ''' grblShield soft reset '''
-    self.sp.write(self.GRBL_SOFT_RESET)
+    self.sendRealTime(self.GRBL_SOFT_RESET)
+    self.clearTickets()
     self.waitForStartup()
 
 
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def sendRealTime(self, command, verbose='DETAIL'):
+    ''' Send a real-time command.
+        Real-time commands are single bytes picked by grbl as soon as they
+        arrive, they don't use the RX buffer and get no response.
+    '''
+    self.ui.log('>>>>> RT[0x{:02X}]'.format(ord(command)), c='comms.send', v=verbose)
+    self.sp.writeRealTime(command)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def feedHold(self):
+    ''' Real-time feed hold '''
+    self.sendRealTime(self.GRBL_RT_FEED_HOLD)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def cycleStart(self):
+    ''' Real-time cycle start / resume '''
+    self.sendRealTime(self.GRBL_RT_CYCLE_START)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def jogCancel(self):
+    ''' Real-time jog cancel '''
+    self.sendRealTime(self.GRBL_RT_JOG_CANCEL)
+
+
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def sleep(self, seconds):
     ''' grbl-aware sleep '''
@@ -153,20 +199,25 @@ class Grbl:
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def process(self):
-    ''' Call this method frequently to give Grbl some processing time '''
+  def process(self, timeout=None):
+    ''' Call this method frequently to give Grbl some processing time
+        (blocks up to timeout seconds waiting for serial data)
+    '''
+    if timeout is None:
+      timeout = self.PROCESS_SLEEP
 
     # Read all available serial lines
-    line = self.sp.readline()
+    # (wait a bit for the first one, so callers looping here don't spin)
+    line = self.sp.readline(timeout=timeout)
     while line:
       self.parse(line)
       line = self.sp.readline()
 
     # Manage alarm state
-    if self.alarm and (self.waitingResponse or self.waitingMachineStatus):
+    if self.alarm and (self.waitingMachineStatus or self.pendingTickets):
       self.ui.log('Alarm detected, resetting wait flags', c='ui.msg', v='DETAIL')
-      self.waitingResponse = False
       self.waitingMachineStatus = False
+      self.clearTickets()
 
     # Automatic periodic machine status queries
     sendStatusQuery = False
@@ -174,25 +225,33 @@ class Grbl:
     if self.waitingMachineStatus and not self.statusQuerySent:
       sendStatusQuery = True
 
-    if (time.time() - self.lastMachineStatusQuery) > self.PERIODIC_QUERY_INTERVAL:
+    if self.poller.isQueryDue(self.getMachineState()):
       sendStatusQuery = True
 
     if sendStatusQuery:
       self.queryMachineStatus()
       self.showNextMachineStatus = False
 
-    # Automatic periodic parser status queries
+    # Parser state queries
+    # Parser state is tracked from sent lines (see trackSentLine()), $G is
+    # only needed to resync (reset/alarm/errors) or for the optional check.
+    # (not while streaming, and only if it fits in grbl's RX buffer)
     sendParserStateQuery = False
+    parserStateQueryElapsed = time.time() - self.lastParserStateQuery
+
+    if self.modal.needsSync and parserStateQueryElapsed > self.PERIODIC_QUERY_INTERVAL:
+      sendParserStateQuery = True
 
-    if (time.time() - self.lastParserStateQuery) > self.PERIODIC_QUERY_INTERVAL:
+    if self.parserStateCheckInterval and parserStateQueryElapsed > self.parserStateCheckInterval:
       sendParserStateQuery = True
 
-    if sendParserStateQuery:
+    if sendParserStateQuery and not self.streaming and self.streamHasRoom(self.GRBL_QUERY_GCODE_PARSER_STATE):
       self.queryGCodeParserState()
       self.showNextParserState = False
 
     # Show 'live' machine status if running
-    if self.isRunning():
+    if self.isRunning() and (time.time() - self.lastLiveStatus) > self.LIVE_STATUS_INTERVAL:
+      self.lastLiveStatus = time.time()
       self.ui.clearLine()
       self.ui.log('\r{:}'.format(self.getSimpleMachineStatusStr()), end='')
 
@@ -214,61 +273,372 @@ class Grbl:
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def send(self, command, responseTimeout=None, verbose='BASIC'):
-    ''' Send a command '''
+    ''' Send a command and wait for its response.
+        Returns the response lines (data lines + ok/error:N).
+    '''
     if not command:
       return
 
     command = self.stripCommand(command)
     upperCommand = command.upper()
 
-    if upperCommand == self.GRBL_QUERY_GCODE_PARSER_STATE:
-      self.showNextParserState = True
-    elif upperCommand == self.GRBL_QUERY_MACHINE_STATUS:
+    # '?' is a real-time command, it gets a status report instead of an ok
+    if upperCommand == self.GRBL_QUERY_MACHINE_STATUS:
       self.showNextMachineStatus = True
-    elif upperCommand == self.GRBL_HOMING_CYCLE:
+      self.getMachineStatus()
+      return [self.status['str']]
+
+    if upperCommand == self.GRBL_HOMING_CYCLE:
       if not responseTimeout:
         responseTimeout = float(self.mchCfg['homingTimeout'])
 
-    self.ui.log('>>>>> {:}'.format(command), c='comms.send' ,v=verbose)
+    ticket = self.sendNoWait(command, verbose=verbose)
+    if not ticket:
+      return []
+
+    self.waitForTicket(ticket, responseTimeout=responseTimeout)
+
+    return ticket.getResponse()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def sendNoWait(self, command, verbose='BASIC'):
+    ''' Send a command without waiting for its response
+        (blocks only while grbl's RX buffer has no room for the line).
+        Several commands can be pipelined, returns the command's Ticket
+        (None if the line could not be sent).
+    '''
+    command = self.minimizer.minimize(self.stripCommand(command))
+    if not command:
+      return None
+
+    if command.upper() == self.GRBL_QUERY_GCODE_PARSER_STATE:
+      self.showNextParserState = True
+
+    if not self.waitForRoom(command):
+      self.minimizer.rollback()
+      return None
+
+    return self.writeLine(command, verbose=verbose)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def writeLine(self, command, streamed=False, showResponse=True, verbose='BASIC'):
+    ''' Write a (stripped) line and queue its Ticket.
+        Callers must check there's room in grbl's RX buffer first.
+    '''
+    self.ui.log('>>>>> {:}'.format(command), c='comms.send', v=verbose)
     self.sp.write(command+'\n')
 
-    return self.readResponse(responseTimeout=responseTimeout,verbose=verbose)
+    ticket = grblTicket.Ticket(command, streamed=streamed, showResponse=showResponse)
+    self.pendingTickets.append(ticket)
+    self.streamBufferUsed += ticket.lineLen
+
+    self.trackSentLine(command)
+
+    return ticket
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def isRunning(self):
-    ''' Check if the machine is running '''
-    if 'machineState' not in self.status:
+  def waitForRoom(self, command):
+    ''' Wait for grbl's RX buffer to have room for a (stripped) line.
+        Returns False if the line can't be sent.
+    '''
+    lineLen = len(command) + 1
+
+    if lineLen > self.GRBL_RX_BUFFER_SIZE:
+      self.ui.log('ERROR: line too long for grbl RX buffer ({:d} chars) [{:}]'.format(lineLen, command),
+        c='ui.errorMsg', v='ERROR')
       return False
 
-    machineState = self.status['machineState']
-    return machineState == 'Run' or machineState == 'Home' or machineState == 'Jog'
+    # Wait for the oldest lines to be acknowledged
+    # (no timeout while they are, or while the machine is busy with them)
+    startTime = time.time()
+    bufferUsed = self.streamBufferUsed
+    while self.streamBufferUsed + lineLen > self.GRBL_RX_BUFFER_SIZE:
+      if self.alarm:
+        return False
+
+      if self.streamBufferUsed != bufferUsed or self.isBusy():
+        startTime = time.time()
+        bufferUsed = self.streamBufferUsed
+      elif (time.time() - startTime) >= self.spCfg['responseTimeout']:
+        self.ui.log('ERROR: TIMEOUT Waiting for room in grbl RX buffer [{:}]'.format(command),
+          c='ui.errorMsg', v='ERROR')
+        self.resyncTickets()
+        return False
+
+      self.process()
+
+    return not self.alarm
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def readResponse(self,responseTimeout=None, verbose='BASIC'):
-    ''' Read a command's response '''
+  def waitForTicket(self, ticket, responseTimeout=None, verbose='BASIC'):
+    ''' Wait for a command's response.
+        Returns False on timeout (the in-flight tickets are cancelled, see resyncTickets()).
+    '''
     if responseTimeout is None:
       responseTimeout = self.spCfg['responseTimeout']
 
-    self.ui.log('readResponse() - Waiting for response from serial...', v='SUPER')
+    self.ui.log('waitForTicket() - Waiting for response from serial...', v='SUPER')
 
     startTime = time.time()
-    self.response = []
-    self.waitingResponse = True
 
-    while self.waitingResponse and (time.time() - startTime) < responseTimeout:
+    while not ticket.isDone() and (time.time() - startTime) < responseTimeout:
       self.process()
 
-    if not self.waitingResponse:
-      self.ui.log(  'readResponse() - Successfully received {:d} data lines from serial'.format(
-        len(self.response)), v='SUPER')
-    else:
-      self.ui.log('readResponse() - TIMEOUT Waiting for response from serial', c='ui.errorMsg', v='ERROR')
-      self.response = []
-      self.waitingResponse = False
+    if not ticket.isDone():
+      self.ui.log('waitForTicket() - TIMEOUT Waiting for response from serial', c='ui.errorMsg', v='ERROR')
+      self.resyncTickets()
+      return False
+
+    self.ui.log('waitForTicket() - Received {:} ({:d} data lines) in {:.1f}ms'.format(
+      ticket.result if ticket.result else 'no response (cancelled)',
+      len(ticket.lines),
+      ticket.getLatency() * 1000), v='SUPER')
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getEmptyStreamStats(self):
+    ''' Get an empty streaming statistics object '''
+    return {
+      'startTime': 0,
+      'endTime': 0,
+      'linesSent': 0,
+      'linesAcked': 0,
+      'bytesSent': 0,
+      'errors': 0,
+      'latencyTotal': 0,
+      'latencyMax': 0,
+    }
+
 
-    return self.response
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def startStream(self):
+    ''' Start a character-counting streaming session
+        See: https://github.com/gnea/grbl/wiki/Grbl-v1.1-Interface#streaming-protocol-character-counting-recommended-with-reservation
+    '''
+    if self.pendingTickets:
+      self.waitForStreamEnd()
+
+    self.streamStats = self.getEmptyStreamStats()
+    self.streamStats['startTime'] = time.time()
+    self.streaming = True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def streamLine(self, command, verbose='DETAIL'):
+    ''' Send a line without waiting for its response.
+        Blocks only while grbl's RX buffer has no room for the line.
+        Returns False if the line could not be sent.
+    '''
+    command = self.minimizer.minimize(self.stripCommand(command))
+    if not command:
+      return True
+
+    if not self.streaming:
+      self.startStream()
+
+    if not self.waitForRoom(command):
+      self.minimizer.rollback()
+      return False
+
+    self.streamTicket(self.writeLine(command, streamed=True, showResponse=False, verbose=verbose))
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def streamTicket(self, ticket):
+    ''' Account a sent line in the streaming statistics '''
+    self.streamStats['linesSent'] += 1
+    self.streamStats['bytesSent'] += ticket.lineLen
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def streamHasRoom(self, command):
+    ''' Check if grbl's RX buffer has room for a line
+        (lines that would never fit are left to streamLine() to report)
+    '''
+    lineLen = len(self.stripCommand(command)) + 1
+    if lineLen > self.GRBL_RX_BUFFER_SIZE:
+      return True
+
+    return self.streamBufferUsed + lineLen <= self.GRBL_RX_BUFFER_SIZE
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def resolveTicket(self, result):
+    ''' Resolve the oldest pending ticket with its response (ok/error:N)
+        and free the RX buffer space used by its line.
+        Returns the ticket.
+    '''
+    ticket = self.pendingTickets.popleft()
+    self.streamBufferUsed -= ticket.lineLen
+    ticket.resolve(result)
+
+    if ticket.streamed:
+      stats = self.streamStats
+      latency = ticket.getLatency()
+      stats['linesAcked'] += 1
+      stats['latencyTotal'] += latency
+      if latency > stats['latencyMax']:
+        stats['latencyMax'] = latency
+      if ticket.isError():
+        stats['errors'] += 1
+
+    return ticket
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def clearTickets(self):
+    ''' Cancel in-flight lines (grbl flushes its RX buffer on reset/alarm) '''
+    while self.pendingTickets:
+      self.pendingTickets.popleft().cancel()
+    self.streamBufferUsed = 0
+    self.lostTickets.clear()
+    self.resyncQueryPending = False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def resyncTickets(self):
+    ''' Give up on the in-flight lines (response timeout): their tickets are
+        cancelled, but they stay in lostTickets (using RX buffer space) until
+        their late responses come, so these can't resolve newer tickets.
+        A $G is sent after them: once it's answered, lines still lost never
+        reached grbl. Lines lost in a previous resync are dropped right away.
+    '''
+    self.ui.log('Resyncing with grbl...', c='ui.msg', v='DETAIL')
+    self.dropLostTickets()
+
+    while self.pendingTickets:
+      ticket = self.pendingTickets.popleft()
+      ticket.cancel()
+      self.lostTickets.append(ticket)
+
+    self.modal.needsSync = True
+    self.resyncQueryPending = True
+    self.sendResyncQuery()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def sendResyncQuery(self):
+    ''' Send the $G of resyncTickets() as soon as it fits in grbl's RX buffer '''
+    if self.resyncQueryPending and self.streamHasRoom(self.GRBL_QUERY_GCODE_PARSER_STATE):
+      self.resyncQueryPending = False
+      self.queryGCodeParserState()
+      self.showNextParserState = False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def dropLostTickets(self):
+    ''' Forget lost lines that will never be answered, freeing their RX buffer space '''
+    while self.lostTickets:
+      self.streamBufferUsed -= self.lostTickets.popleft().lineLen
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def waitForStreamEnd(self):
+    ''' Wait for all streamed lines to be acknowledged '''
+    while self.pendingTickets and not self.alarm:
+      self.process()
+
+    if self.alarm:
+      self.clearTickets()
+
+    if self.streaming:
+      self.streaming = False
+      self.streamStats['endTime'] = time.time()
+
+    return self.streamStats
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stream(self, commands, verbose='DETAIL'):
+    ''' Stream a list (or any other iterable) of commands '''
+    self.startStream()
+
+    for command in commands:
+      if not self.streamLine(command, verbose=verbose):
+        break
+
+    self.waitForStreamEnd()
+    self.ui.log(self.getStreamStatsStr(), c='ui.msg', v='DETAIL')
+
+    return self.streamStats
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStreamElapsedTime(self):
+    ''' Get elapsed time for current/last streaming session '''
+    if not self.streamStats['startTime']:
+      return 0
+
+    endTime = self.streamStats['endTime'] if self.streamStats['endTime'] else time.time()
+    return endTime - self.streamStats['startTime']
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStreamLinesPerSecond(self):
+    ''' Get throughput (acknowledged lines per second) for current/last streaming session '''
+    elapsed = self.getStreamElapsedTime()
+    if not elapsed:
+      return 0
+
+    return self.streamStats['linesAcked'] / elapsed
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStreamProgressStr(self):
+    ''' Get a short version of the streaming statistics (for live status) '''
+    return 'L[{:d}/{:d}] B[{:d}]'.format(
+      self.streamStats['linesAcked'],
+      self.streamStats['linesSent'],
+      self.streamStats['bytesSent'])
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStreamLatency(self):
+    ''' Get average line round-trip time (seconds) for current/last streaming session '''
+    if not self.streamStats['linesAcked']:
+      return 0
+
+    return self.streamStats['latencyTotal'] / self.streamStats['linesAcked']
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStreamStatsStr(self):
+    ''' Get a printable version of the streaming statistics '''
+    stats = self.streamStats
+    return 'Streamed {:d}/{:d} lines ({:d} bytes, {:d} errors) in {:.2f}s - {:.1f} lines/s - latency avg {:.1f}ms max {:.1f}ms'.format(
+      stats['linesAcked'],
+      stats['linesSent'],
+      stats['bytesSent'],
+      stats['errors'],
+      self.getStreamElapsedTime(),
+      self.getStreamLinesPerSecond(),
+      self.getStreamLatency() * 1000,
+      stats['latencyMax'] * 1000)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isRunning(self):
+    ''' Check if the machine is running '''
+    if 'machineState' not in self.status:
+      return False
+
+    machineState = self.status['machineState']
+    return machineState == 'Run' or machineState == 'Home' or machineState == 'Jog'
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isBusy(self):
+    ''' Check if the machine is running or holding (sent lines can wait a while) '''
+    # machineState keeps grbl's substates (Hold:0, Door:1...)
+    return self.getMachineState().split(':')[0] in ('Run', 'Home', 'Hold', 'Jog')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -291,148 +661,284 @@ class Grbl:
       self.ui.log()
 
 
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def initLineParsers(self):
+    ''' Provide line parser dispatch tables
+        Lines are routed by first char, '[...]' lines by tag.
+        Each parser returns True if the line should be shown.
+    '''
+    self.lineParsers = {
+      'o': self.parseOkLine,
+      'e': self.parseErrorLine,
+      'A': self.parseAlarmLine,
+      '<': self.parseStatusLine,
+      '[': self.parseBracketLine,
+      '$': self.parseDollarLine,
+      'G': self.parseStartupLine,
+    }
+
+    self.bracketLineParsers = {
+      'MSG': self.parseMessageLine,
+      'VER': self.parseVersionLine,
+      'OPT': self.parseBuildOptionsLine,
+      'GC': self.parseParserStateLine,
+    }
+
+    # Lines that are part of a command's response (unknown lines included)
+    self.dataLineParsers = [
+      None,
+      self.parseBracketLine,
+      self.parseDollarLine,
+    ]
+
+
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def parse(self, line):
-    ''' Parse a text line '''
-    if line:
-      if self.ignoreNextLine:
-        self.ignoreNextLine = False
+    ''' Parse a line (bytes as read from the serial port, or text) '''
+    if not line:
+      return
+
+    if type(line) is bytes:
+      # Fast path for the highest-volume lines (no decoding)
+      if line == b'ok':
+        if self.parseResponse('ok'):
+          self.logReceivedLine('ok')
         return
 
-      originalLine = line
-
-      if self.waitingResponse:
-        self.response.append(line)
-
-      showLine = True
-      isResponse = False
-      isStatus = False
-      isAlarm = False
-      errorCode = ''
-
-      if self.waitingStartup:
-        if line[:5] == 'Grbl ' and line[-15:] == " ['$' for help]":
-          self.waitingStartup = False
-
-      if line == 'ok':
-        isResponse = True
-      elif line[:6] == 'error:':
-        errorCode = line[6:]
-        isResponse = True
-      elif line[:6] == 'ALARM:':
-        self.alarm = line[6:]
-        self.status['machineState'] = 'Alarm'
-        isAlarm = True
-      elif line[:1] == '>' and line[-3:] == ':ok':
-        line = line[:-3]
-      elif line[:1] == '>' and line[-8:-1] == ':error:':
-        line = line[:-8]
-      elif line[:1] == '>' and line[-9:-2] == ':error:':
-        line = line[:-9]
-
-      # Status
-      if line[:1] == '<' and line[-1:] == '>':
-        isStatus = True
-        if not self.showNextMachineStatus:
-          showLine = False
-        try:
-          self.parseMachineStatus(line)
-          self.status['str'] = line
-          # self.lastMachineStatusReceptionTimestamp
-          self.waitingMachineStatus = False
-          self.statusQuerySent = False
-        except:
-          self.ui.log('UNKNOWN machine data [{:}]'.format(line), c='ui.errorMsg', v='ERROR')
-
-      # Messages
-      elif line[:5] == '[MSG:':
-        self.lastMessage = line[5:-1]
-
-      # Version info
-      elif line[:5] == '[VER:':
-        self.status['version'] = line[5:-1]
-
-      # Build options
-      elif line[:5] == '[OPT:':
-        self.status['buildOptions'] = line[5:-1]
-
-      # gcode parser state
-      elif line[:4] == '[GC:':
-        if not self.showNextParserState:
-          self.showNextParserState = True
-          showLine = False
-          self.ignoreNextLine = True
-        parserState = line[4:-1]
-        self.status['parserState']['str'] = parserState
-        self.parseParserState(parserState)
-        # Check for changes!
-        if self.lastParserStateStr and self.lastParserStateStr != parserState:
-          for event in self.onParserStateChanged:
-            event()
-        self.lastParserStateStr = parserState
+      if line[:1] == b'<' and line[-1:] == b'>':
+        if self.parseStatusReport(line):
+          self.logReceivedLine(line.decode('utf-8', errors='replace'))
+        return
+
+      line = line.decode('utf-8', errors='replace')
+
+    parser = self.lineParsers.get(line[0])
+
+    # Data lines belong to the oldest command waiting for its response
+    if self.pendingTickets and not self.lostTickets and parser in self.dataLineParsers:
+      self.pendingTickets[0].lines.append(line)
+
+    if parser is None or parser(line):
+      self.logReceivedLine(line)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def logReceivedLine(self, line):
+    ''' Show a line received from grbl '''
+    if self.isRunning():
+      self.ui.log()
+    self.ui.log('<<<<< {:}'.format(line), c='comms.recv')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseResponse(self, result):
+    ''' Manage a command response (ok/error:N).
+        Returns True if the response should be shown.
+    '''
+    if self.lostTickets:
+      ticket = self.lostTickets.popleft()
+      self.streamBufferUsed -= ticket.lineLen
+      self.ui.log('Late response to a lost line ({:}): {:}'.format(ticket.command, result), c='ui.msg', v='DETAIL')
+      self.sendResyncQuery()
+      return False
+
+    if not self.pendingTickets:
+      self.ui.log('[WARNING] Unexpected machine response',c='ui.msg',v='DETAIL')
+      return True
 
+    ticket = self.resolveTicket(result)
+    return ticket.showResponse or ticket.isError()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseOkLine(self, line):
+    ''' ok '''
+    if line != 'ok':
+      return True
+
+    return self.parseResponse(line)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseErrorLine(self, line):
+    ''' error:n '''
+    if not line.startswith('error:'):
+      return True
+
+    errorCode = line[6:]
+
+    # Tracked parser state may include the failed line
+    self.modal.needsSync = True
+
+    if self.parseResponse(line):
+      self.logReceivedLine(line)
+
+    self.ui.log('ERROR [{:}]: {:}'.format(errorCode, self.dct.errors[errorCode]), c='ui.errorMsg')
+    return False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseAlarmLine(self, line):
+    ''' ALARM:n '''
+    if not line.startswith('ALARM:'):
+      return True
+
+    self.alarm = line[6:]
+    self.status['machineState'] = 'Alarm'
+    self.modal.needsSync = True
+
+    self.logReceivedLine(line)
+    self.ui.log('ALARM [{:}]: {:}'.format(self.alarm, self.getAlarmStr()), c='ui.errorMsg')
+
+    self.clearTickets()
+    return False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseStatusLine(self, line):
+    ''' <machine status> '''
+    if line[-1] != '>':
+      return True
+
+    return self.parseStatusReport(line)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseStatusReport(self, line):
+    ''' Parse a complete status report (bytes or text) '''
+    self.poller.reportReceived()
+
+    try:
+      lastMachineState = self.getMachineState()
+      self.parseMachineStatus(line)
+      # self.lastMachineStatusReceptionTimestamp
+      self.waitingMachineStatus = False
+      self.statusQuerySent = False
+      if self.status.machineState != lastMachineState:
+        self.machineStateChanged.set()
+        for event in self.onMachineStateChanged:
+          event()
+    except:
+      if type(line) is bytes:
+        line = line.decode('utf-8', errors='replace')
+      self.ui.log('UNKNOWN machine data [{:}]'.format(line), c='ui.errorMsg', v='ERROR')
+
+    return self.showNextMachineStatus
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseBracketLine(self, line):
+    ''' [TAG:...] (dispatched by tag) '''
+    parser = self.bracketLineParsers.get(line[1:line.find(':')])
+
+    if parser is None:
       # gcode parameters
-      elif line[:1] == '[':
-        parserParam = line[1:-1]
-        self.parseGCodeParam(parserParam)
+      self.parseGCodeParam(line[1:-1])
+      return True
+
+    return parser(line)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseMessageLine(self, line):
+    ''' [MSG:...] '''
+    self.lastMessage = line[5:-1]
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseVersionLine(self, line):
+    ''' [VER:...] '''
+    self.status['version'] = line[5:-1]
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseBuildOptionsLine(self, line):
+    ''' [OPT:...] '''
+    self.status['buildOptions'] = line[5:-1]
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseParserStateLine(self, line):
+    ''' [GC:...] (gcode parser state) '''
+    showLine = True
+
+    if not self.showNextParserState:
+      self.showNextParserState = True
+      showLine = False
+
+    # Answer to a $G sent after the lost lines (see resyncTickets())
+    if self.lostTickets and self.lostTickets[0].command.upper() != self.GRBL_QUERY_GCODE_PARSER_STATE:
+      self.dropLostTickets()
+
+    parserState = line[4:-1]
+    self.parseParserState(parserState)
+    self.modal.needsSync = False
+    self.setParserStateStr(parserState)
+
+    return showLine
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setParserStateStr(self, parserState):
+    ''' Save parser state string, firing onParserStateChanged on changes '''
+    self.status['parserState']['str'] = parserState
 
-      # User-defined startup line
-      elif line[:2] == '$N':
-        pass
+    # Check for changes!
+    if self.lastParserStateStr and self.lastParserStateStr != parserState:
+      for event in self.onParserStateChanged:
+        event()
+    self.lastParserStateStr = parserState
 
-      # Settings
-      elif line[:1] == '$':
-        settingStr = line[1:]
-        self.parseSetting(settingStr)
-        showLine = False
 
-      # Display
-      if isResponse:
-        if self.waitingResponse:
-          self.waitingResponse = False
-        else:
-          self.ui.log('[WARNING] Unexpected machine response',c='ui.msg',v='DETAIL')
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def trackSentLine(self, command):
+    ''' Update parser state from a line sent to grbl
+        (motion commands on a stopped machine ask for a status query)
+    '''
+    if self.modal.track(command):
+      self.setParserStateStr(self.modal.getStateStr())
 
-      if showLine:
-        if self.isRunning():
-          self.ui.log()
-        self.ui.log('<<<<< {:}'.format(originalLine), c='comms.recv')
+    if not self.isRunning() and self.isMotionCommand(command):
+      self.poller.queryNow()
 
-      if errorCode:
-        self.ui.log('ERROR [{:}]: {:}'.format(errorCode, self.dct.errors[errorCode]), c='ui.errorMsg')
 
-      if isAlarm:
-        self.ui.log('ALARM [{:}]: {:}'.format(self.alarm, self.getAlarmStr()), c='ui.errorMsg')
-        if self.waitingResponse:
-          self.waitingResponse = False
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseDollarLine(self, line):
+    ''' $n=value (settings) / $Nn=line (user-defined startup lines) '''
+    if line[1:2] == 'N':
+      return True
+
+    self.parseSetting(line[1:])
+    return False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def parseStartupLine(self, line):
+    ''' Grbl X.Xx ['$' for help] '''
+    if line.startswith('Grbl ') and line.endswith(" ['$' for help]"):
+      # grbl has been reset, parser state is back to defaults + startup lines
+      # (and lines in its RX buffer are gone)
+      self.modal.needsSync = True
+      self.waitingStartup = False
+      self.clearTickets()
+
+    return True
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def parseParserState(self,state):
     ''' Update self.status from parser state string '''
-    # Split modal commands
-    commands = state.split(' ')
+    parserState = self.status['parserState']
 
-    for command in commands:
-      modalGroup = self.dct.getModalGroup(command)
-      if modalGroup:
-        original = command
-        commandName = self.dct.getModalCommandName(command)
-        self.status['parserState'][modalGroup] = {}
-        self.status['parserState'][modalGroup]['val'] = command
-        self.status['parserState'][modalGroup]['original'] = original
-        self.status['parserState'][modalGroup]['desc'] = commandName
-      else:
-        original = command
-        value = command[1:]
-        command = command[:1]
-        modalGroup = self.dct.getModalGroup(command)
-        if modalGroup:
-          commandName = self.dct.getModalCommandName(command)
-          self.status['parserState'][modalGroup] = {}
-          self.status['parserState'][modalGroup]['val'] = value
-          self.status['parserState'][modalGroup]['original'] = original
-          self.status['parserState'][modalGroup]['desc'] = commandName
+    for modalGroup, commandName, value, original in self.dct.classifyBlock(state):
+      parserState[modalGroup] = {
+        'val': value,
+        'original': original,
+        'desc': commandName,
+      }
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -470,134 +976,10 @@ class Grbl:
       self.status['GCodeParams']['TLO'] = float(value)
 
 
-  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def parseInputPinState(self,pinState):
-    ''' Parses a pin state string and returns an object '''
-    state = {}
-
-    for item in dict.inputPinStates:
-      state[item] = {
-        'desc': dict.inputPinStates[item],
-        'val': item in pinState
-      }
-
-    return state
-
-
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def parseMachineStatus(self,status):
-    ''' Parse machine status string and update self.status '''
-    # Remove chevrons
-    status = status[1:-1]
-
-    # Split parameter groups
-    params = status.split('|')
-
-    # Initialize input pin state variable
-    inputPinState = ''
-
-    # Status is always the first field
-    self.status['machineState'] = params.pop(0)
-
-    # Get the rest of fields
-    while len(params):
-      param = params.pop(0).split(':')
-      paramName = param[0]
-      paramValue = param[1]
-
-      if paramName == 'MPos' or paramName == 'WPos' or paramName == 'WCO':
-        coords = paramValue.split(',')
-        x = float(coords[0])
-        y = float(coords[1])
-        z = float(coords[2])
-
-        self.status[paramName]['x'] = x
-        self.status[paramName]['y'] = y
-        self.status[paramName]['z'] = z
-
-        # From: https://github.com/gnea/grbl/wiki/Grbl-v1.1-Interface
-        #  If WPos: is given, use MPos = WPos + WCO.
-        #  If MPos: is given, use WPos = MPos - WCO.
-        if paramName == 'MPos':
-          self.status['WPos']['x'] = x - self.status['WCO']['x']
-          self.status['WPos']['y'] = y - self.status['WCO']['y']
-          self.status['WPos']['z'] = z - self.status['WCO']['z']
-        elif paramName == 'WPos':
-          self.status['MPos']['x'] = x + self.status['WCO']['x']
-          self.status['MPos']['y'] = y + self.status['WCO']['y']
-          self.status['MPos']['z'] = z + self.status['WCO']['z']
-
-      elif paramName == 'Bf':
-        blocks = paramValue.split(',')
-        planeBufferBlocks = int(blocks[0])
-        serialRXBufferBlocks = int(blocks[1])
-        self.status[paramName] = {
-          'desc': 'buffer',
-          'planeBufferBlocks': planeBufferBlocks,
-          'serialRXBufferBlocks': serialRXBufferBlocks
-        }
-
-      elif paramName == 'Ln':
-        self.status[paramName] = {
-          'desc': 'lineNumber',
-          'val': paramValue
-        }
-
-      elif paramName == 'F':
-        self.status[paramName] = {
-          'desc': 'feed',
-          'val': int(paramValue)
-        }
-
-      elif paramName == 'FS':
-        values = paramValue.split(',')
-        feed = int(values[0])
-        speed = int(values[1])
-
-        self.status['F'] = {
-          'desc': 'feed',
-          'val': int(feed)
-        }
-
-        self.status['S'] = {
-          'desc': 'speed',
-          'val': int(speed)
-        }
-
-      elif paramName == 'Pn':
-        inputPinState = paramValue
-
-      elif paramName == 'Ov':
-        values = paramValue.split(',')
-        feed = values[0]
-        rapid = values[1]
-        speed = values[2]
-        self.status[paramName] = {
-          'desc': 'override',
-          'feed': int(feed),
-          'rapid': int(rapid),
-          'speed': int(speed)
-        }
-
-      elif paramName == 'A':
-        self.status[paramName] = {
-          'desc': 'accesoryState',
-          'val': paramValue
-        }
-
-      else:
-        self.status[paramName] = {
-          'desc': 'UNKNOWN',
-          'val': paramValue
-        }
-
-    # ALWAYS save&parse input pin state (if none comes, it's empty!)
-    self.status['Pn'] = {
-      'desc': 'inputPinState',
-      'val': inputPinState
-    }
-
-    self.status['inputPinState'] = self.parseInputPinState(inputPinState)
+    ''' Parse machine status report (bytes or text) and update self.status (in place) '''
+    self.status.update(status)
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -629,10 +1011,10 @@ class Grbl:
   def queryMachineStatus(self):
     ''' TODO: Comment '''
     self.ui.log('Querying machine status...', v='DEBUG')
-    self.sp.write(self.GRBL_QUERY_MACHINE_STATUS)
+    self.sp.writeRealTime(self.GRBL_QUERY_MACHINE_STATUS)
     self.statusQuerySent = True
     self.waitingMachineStatus = True
-    self.lastMachineStatusQuery = time.time()
+    self.poller.querySent()
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -643,7 +1025,7 @@ class Grbl:
     self.send(self.GRBL_QUERY_MACHINE_STATUS)
     self.statusQuerySent = True
     self.waitingMachineStatus = True
-    self.lastMachineStatusQuery = time.time()
+    self.poller.querySent()
     self.ui.log()
 
 
@@ -784,6 +1166,12 @@ class Grbl:
         self.getMachinePosStr(),
         self.status['F']['val']
         )
+      if 'Ov' in self.status:
+        ov = self.status['Ov']
+        if ov['feed'] != 100 or ov['rapid'] != 100 or ov['speed'] != 100:
+          content += ' Ov[{:}/{:}/{:}]'.format(ov['feed'], ov['rapid'], ov['speed'])
+      if self.streaming:
+        content += ' ' + self.getStreamProgressStr()
       content = self.ui.color(content, 'ui.onlineMachinePos')
 
     # Suffix
@@ -876,10 +1264,10 @@ class Grbl:
     ''' Helpers to get pin states '''
     stateStr = ''
 
-    pins = self.status['inputPinState']
-    for pin in pins:
-      if pins[pin]['val']:
-        stateStr += '[{:} ({:})] '.format(self.ui.color(pin, 'machineState.Alarm'),pins[pin]['desc'])
+    pins = self.status.inputPinState
+    for pin in dict.inputPinStates:
+      if pins.isSet(pin):
+        stateStr += '[{:} ({:})] '.format(self.ui.color(pin, 'machineState.Alarm'),dict.inputPinStates[pin])
 
     return stateStr.rstrip()
 
@@ -887,51 +1275,119 @@ class Grbl:
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getLimitSwitchState(self,axis):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState'][axis]['val']
+    return self.status.inputPinState.isSet(axis)
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getProbeState(self):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState']['P']['val']
+    return self.status.inputPinState.isSet('P')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getDoorState(self):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState']['D']['val']
+    return self.status.inputPinState.isSet('D')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getHoldState(self):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState']['H']['val']
+    return self.status.inputPinState.isSet('H')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getSoftResetState(self):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState']['R']['val']
+    return self.status.inputPinState.isSet('R')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def getCycleStartState(self):
     ''' Helpers to get pin states '''
-    return self.status['inputPinState']['S']['val']
+    return self.status.inputPinState.isSet('S')
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def waitForMachineIdle(self,verbose='WARNING'):
-    ''' TODO: comment '''
+  def getMachineState(self):
+    ''' Get last reported machine state ('' if unknown) '''
+    return getattr(self.status, 'machineState', '')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getNextStatusQueryDelay(self):
+    ''' Get time left for the next periodic machine status query
+        (None if there's no polling in the current machine state)
+    '''
+    return self.poller.getNextQueryDelay(self.getMachineState())
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStatusPollRateStr(self):
+    ''' Get a printable version of the effective status polling rate '''
+    return self.poller.getRateStr(self.getMachineState())
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isMotionCommand(self, command):
+    ''' Check if a command will (probably) move the machine '''
+    upperCommand = command.upper()
+
+    if upperCommand[:1] == '$':
+      return upperCommand[:3] == '$J=' or upperCommand == self.GRBL_HOMING_CYCLE
+
+    return 'X' in upperCommand or 'Y' in upperCommand or 'Z' in upperCommand
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def waitForMachineStateChange(self, timeout=None):
+    ''' Wait for a status report with a different machine state.
+        Sleeps on the serial line queue, only waking up for incoming data
+        or when the next periodic status query is due.
+        Returns False on timeout.
+    '''
+    startTime = time.time()
+    self.machineStateChanged.clear()
+
+    while not self.machineStateChanged.is_set():
+      wait = self.getNextStatusQueryDelay()
+      wait = self.WAITIDLE_SLEEP if wait is None else max(wait, 0)
+
+      if timeout is not None:
+        remaining = timeout - (time.time() - startTime)
+        if remaining <= 0:
+          return False
+        wait = min(wait, remaining)
+
+      self.process(timeout=wait)
+
+      if self.alarm:
+        break
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def waitForMachineIdle(self, timeout=None, verbose='WARNING'):
+    ''' Wait for machine operation to finish.
+        Returns False on timeout.
+    '''
     self.ui.log('Waiting for machine operation to finish...', v='SUPER')
+    startTime = time.time()
     self.getMachineStatus()
 
     while self.isRunning():
-      self.process()
-      self.getMachineStatus()
+      remaining = None
+      if timeout is not None:
+        remaining = timeout - (time.time() - startTime)
+
+      if not self.waitForMachineStateChange(timeout=remaining):
+        self.ui.log('TIMEOUT Waiting for machine operation to finish', v=verbose)
+        return False
 
     self.ui.log('Machine operation finished', v='SUPER')
     self.ui.log()
+    return True
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -946,7 +1402,7 @@ class Grbl:
   def queryGCodeParserState(self):
     ''' TODO: comment '''
     self.ui.log('Querying gcode parser state...', v='DEBUG')
-    self.sp.write(self.GRBL_QUERY_GCODE_PARSER_STATE + '\n')
+    self.writeLine(self.GRBL_QUERY_GCODE_PARSER_STATE, showResponse=False, verbose='DEBUG')
     self.lastParserStateQuery = time.time()
 
 
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+'''
+grbl - jogger
+=============
+Continuous jogging (joystick)
+
+See: https://github.com/gnea/grbl/wiki/Grbl-v1.1-Jogging#joystick-implementation
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import math
+
+# ------------------------------------------------------------------
+# Jogger class
+
+class Jogger:
+
+  def __init__(self, cfg, ui, mch):
+    ''' Construct a Jogger object.
+    '''
+    self.cfg = cfg
+    self.ui = ui
+    self.mch = mch
+    self.joyCfg = cfg['joystick']
+
+    self.PLANNER_BLOCKS = 15
+    self.MIN_STEP_TIME = 0.01
+    self.MIN_STEP = 0.001
+
+    self.axes = ['x', 'y', 'z']
+    self.direction = (0, 0, 0)
+    self.jogging = False
+    self.feed = 0
+    self.step = 0
+    self.unit = {}
+    self.target = {}
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getSetting(self, setting):
+    ''' Get a numeric grbl setting '''
+    return float(self.mch.status['settings'][setting]['val'])
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def calcJogParams(self):
+    ''' Calculate feed and step length for current direction.
+        dt = v^2 / (2 * a * (N-1)) keeps the planned distance close to the
+        stopping distance, so jog cancel is fast.
+    '''
+    norm = math.sqrt(sum([d*d for d in self.direction]))
+    feed = None
+    accel = None
+
+    self.unit = {}
+    for index, axis in enumerate(self.axes):
+      component = abs(self.direction[index]) / norm
+      self.unit[axis] = self.direction[index] / norm
+
+      if not component:
+        continue
+
+      # $110..$112: max rate (mm/min), $120..$122: acceleration (mm/sec^2)
+      axisFeed = min(self.joyCfg['jogFeed'][axis], self.getSetting(110 + index)) / component
+      axisAccel = self.getSetting(120 + index) / component
+
+      feed = axisFeed if feed is None else min(feed, axisFeed)
+      accel = axisAccel if accel is None else min(accel, axisAccel)
+
+    speed = feed / 60
+    dt = (speed * speed) / (2 * accel * (self.PLANNER_BLOCKS - 1))
+    dt = max(dt, self.MIN_STEP_TIME)
+
+    self.feed = feed
+    self.step = speed * dt
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def update(self, x=0, y=0, z=0):
+    ''' Call this method frequently with current jog direction
+        (-1/0/+1 for each axis, all 0 to stop jogging).
+        Returns True if the direction changed.
+    '''
+    direction = (x, y, z)
+    changed = direction != self.direction
+
+    if changed:
+      if self.jogging:
+        self.stop()
+
+      self.direction = direction
+      if any(direction):
+        self.start()
+
+    if self.jogging:
+      self.fill()
+
+    return changed
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def start(self):
+    ''' Start jogging in current direction '''
+    try:
+      self.calcJogParams()
+    except (KeyError, ValueError):
+      self.ui.log('ERROR: grbl settings not available, can\'t jog', c='ui.errorMsg', v='ERROR')
+      return
+
+    self.mch.getMachineStatus()
+    wpos = self.mch.status['WPos']
+    self.target = {axis: wpos[axis] for axis in self.axes}
+
+    self.ui.log('Jog start: F{:.0f} step {:.3f}'.format(self.feed, self.step), v='DETAIL')
+    self.jogging = True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stop(self):
+    ''' Stop jogging (jog cancel) '''
+    self.jogging = False
+    self.mch.jogCancel()
+    self.mch.waitForStreamEnd()
+    self.ui.log('Jog stop', v='DETAIL')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getNextJogStr(self):
+    ''' Get next jog increment command (clamped to machine limits) '''
+    cmd = ''
+
+    for axis in self.axes:
+      if not self.unit[axis]:
+        continue
+
+      target = self.target[axis] + self.step * self.unit[axis]
+      target = max(self.mch.getMin(axis), min(self.mch.getMax(axis), target))
+      increment = target - self.target[axis]
+
+      if abs(increment) >= self.MIN_STEP:
+        self.target[axis] = target
+        cmd += '{:}{:.3f}'.format(axis.upper(), increment)
+
+    if not cmd:
+      return ''
+
+    return '$J=G91G21{:}F{:.0f}'.format(cmd, self.feed)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def fill(self):
+    ''' Keep grbl's planner fed with small jog increments.
+        Only one increment is sent at a time: its 'ok' comes back as soon
+        as it's planned, so nothing is left in the RX buffer on jog cancel.
+    '''
+    if self.mch.pendingTickets:
+      return
+
+    cmd = self.getNextJogStr()
+    if cmd and not self.mch.streamLine(cmd, verbose='DEBUG'):
+      self.jogging = False
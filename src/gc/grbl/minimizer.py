@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+'''
+grbl - minimizer
+================
+G-code line minimizer (fewer bytes on the serial line)
+
+Lines are rewritten right before being sent:
+  - Comments and whitespace are removed, words are uppercased
+  - Numbers lose redundant characters ('G01' => 'G1', '10.500' => '10.5')
+  - Modal words repeating the current state are dropped ('G1', 'F', ...)
+  - X/Y/Z are rounded to the machine's real resolution ($100..$102)
+
+Rules are conservative: lines with non-modal commands (G10, G28, G92...)
+are only cleaned, arcs and incremental moves are not rounded, and nothing
+is dropped until the modal state is known (see ModalTracker.needsSync).
+F is forgotten on units changes (the same number is a different feed).
+
+Lines that end up not being sent must be rolled back (see rollback()).
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import math
+
+from . import dict
+
+# ------------------------------------------------------------------
+# Minimizer class
+
+class Minimizer:
+
+  # Modal groups whose repeated words can be dropped
+  DROP_GROUPS = [
+    'motion', 'wcs', 'plane', 'units', 'distanceMode', 'feedRateMode',
+    'spindle', 'coolant', 'feed', 'speed',
+  ]
+
+  # Only plain motions are dropped (probing and G80 are always sent)
+  DROP_MOTIONS = ['G0', 'G1', 'G2', 'G3']
+
+  # Value words (number compared, not text)
+  VALUE_GROUPS = ['feed', 'speed']
+
+  # Program end resets several modal groups
+  RESET_WORDS = ['M2', 'M30']
+
+  # Axis words rounded to the machine's resolution ($100..$102: steps/mm)
+  AXES = {'X': 100, 'Y': 101, 'Z': 102}
+
+  def __init__(self, cfg, mch):
+    ''' Construct a Minimizer object.
+    '''
+    self.cfg = cfg
+    self.mch = mch
+    self.dct = mch.dct
+    self.enabled = cfg['serial']['minimizeLines']
+
+    # Modal state of the lines already minimized (normalized words, values as float)
+    self.state = {}
+    self.seeded = False
+
+    # State and counters before the last minimize() (see rollback())
+    self.saved = None
+
+    self.resetStats()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def resetStats(self):
+    ''' Reset line/byte counters (e.g. at the start of a job) '''
+    self.lines = 0
+    self.bytesIn = 0
+    self.bytesOut = 0
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStatsStr(self):
+    ''' Get a printable version of the minimizer statistics '''
+    saved = self.bytesIn - self.bytesOut
+    percent = (saved * 100 / self.bytesIn) if self.bytesIn else 0
+    return 'Minimized {:d} lines: {:d} -> {:d} bytes ({:d} saved, {:.1f}%)'.format(
+      self.lines, self.bytesIn, self.bytesOut, saved, percent)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def syncState(self):
+    ''' Forget the local state when grbl's can't be trusted,
+        seed it from the (tracked) parser state once it can.
+    '''
+    if self.mch.modal.needsSync:
+      self.state = {}
+      self.seeded = False
+      return False
+
+    if not self.seeded:
+      parserState = self.mch.status['parserState']
+      for group in self.DROP_GROUPS:
+        if group in parserState and group not in self.VALUE_GROUPS:
+          self.state[group] = parserState[group]['val']
+      self.seeded = True
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getResolutions(self):
+    ''' Get rounding decimals for each axis (None: unknown) '''
+    settings = self.mch.status['settings']
+    inches = self.state.get('units') == 'G20'
+    decimals = {}
+
+    for axis, setting in self.AXES.items():
+      try:
+        stepsPerUnit = float(settings[setting]['val'])
+      except (KeyError, ValueError):
+        return None
+
+      if stepsPerUnit <= 0:
+        return None
+
+      if inches:
+        stepsPerUnit *= 25.4
+
+      # Rounding error (half a digit) must stay under half a step
+      decimals[axis] = max(0, math.ceil(math.log10(stepsPerUnit)))
+
+    return decimals
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def formatNumber(self, number):
+    ''' Remove redundant characters from a number ('+010.500' => '10.5', '0.5' => '.5') '''
+    sign = ''
+    if number[:1] in ('+', '-'):
+      sign = number[0] if number[0] == '-' else ''
+      number = number[1:]
+
+    intPart, _, fracPart = number.partition('.')
+    intPart = intPart.lstrip('0')
+    fracPart = fracPart.rstrip('0')
+
+    number = intPart + '.' + fracPart if fracPart else (intPart or '0')
+    if number == '0':
+      sign = ''
+
+    return sign + number
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def roundNumber(self, number, decimals):
+    ''' Round a number to a given number of decimals (minimal format) '''
+    return self.formatNumber('{:.{:d}f}'.format(float(number), decimals))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def minimize(self, line):
+    ''' Get the minimized version of a (stripped) line.
+        Lines must be sent in the same order they are minimized.
+    '''
+    if not self.enabled or not line or line[0] == '$':
+      return line
+
+    self.saved = (self.state.copy(), self.seeded, self.lines, self.bytesIn, self.bytesOut)
+    minimized = self.minimizeWords(line)
+
+    # A comment-only line can't be dropped here, send it as is
+    if not minimized:
+      minimized = line
+
+    self.lines += 1
+    self.bytesIn += len(line) + 1
+    self.bytesOut += len(minimized) + 1
+
+    return minimized
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def rollback(self):
+    ''' Undo the last minimize() (its line was not sent) '''
+    if self.saved is None:
+      return
+
+    state, self.seeded, self.lines, self.bytesIn, self.bytesOut = self.saved
+    self.state = state
+    self.saved = None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def minimizeWords(self, line):
+    ''' Rewrite a line word by word (see minimize()) '''
+    # Strip comments and whitespace
+    if '(' in line or ';' in line:
+      line = self.mch.modal.stripComments(line)
+    compact = ''.join(line.split()).upper()
+    if not compact:
+      return ''
+
+    words = dict.blockWordRE.findall(compact)
+
+    # Unknown syntax (checksums, expressions...), send it as is
+    if sum([len(letter) + len(number) for letter, number in words]) != len(compact):
+      return compact
+
+    canDrop = self.syncState()
+    result = []
+    entries = []
+    nonModal = False
+
+    for letter, number in words:
+      if letter == 'G' or letter == 'M':
+        number = self.formatNumber(number)
+        entry = self.dct.lookupModalWord(letter + number)
+        if entry is None and letter == 'G':
+          nonModal = True
+      elif letter == 'N' or not number:
+        entry = None
+      else:
+        number = self.formatNumber(number)
+        entry = self.dct.lookupModalWord(letter + number)
+
+      result.append([letter, number])
+      entries.append(entry)
+
+    # F is in the block's units, a units change makes the current one unknown
+    units = [entry[2] for entry in entries if entry is not None and entry[0] == 'units']
+    if units and units[-1] != self.state.get('units'):
+      self.state.pop('feed', None)
+
+    # Check which modal words are repeated and update local state
+    newState = {}
+    keep = [True] * len(result)
+
+    for index, entry in enumerate(entries):
+      if entry is None:
+        continue
+
+      group, _, value = entry
+      if group not in self.DROP_GROUPS:
+        if value in self.RESET_WORDS:
+          self.state = {}
+          self.seeded = False
+          canDrop = False
+        continue
+
+      if group in self.VALUE_GROUPS:
+        value = float(value)
+
+      repeated = self.state.get(group) == value
+      newState[group] = value
+
+      if not canDrop or nonModal or not repeated:
+        continue
+      if group == 'motion' and value not in self.DROP_MOTIONS:
+        continue
+      # Inverse time mode needs F on every line
+      if group == 'feed' and 'G93' in (self.state.get('feedRateMode'), newState.get('feedRateMode')):
+        continue
+
+      keep[index] = False
+
+    self.state.update(newState)
+
+    # Round axis words for straight absolute moves
+    if not nonModal and self.state.get('motion') in ('G0', 'G1') and self.state.get('distanceMode') == 'G90':
+      decimals = self.getResolutions()
+      if decimals:
+        for word in result:
+          if word[0] in decimals and word[1]:
+            word[1] = self.roundNumber(word[1], decimals[word[0]])
+
+    minimized = ''.join([letter + number for index, (letter, number) in enumerate(result) if keep[index]])
+
+    # A line made only of repeated words was probably sent on purpose
+    if not minimized:
+      minimized = ''.join([letter + number for letter, number in result])
+
+    return minimized
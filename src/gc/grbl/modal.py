@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+'''
+grbl - modal
+============
+Local gcode modal state tracker
+
+Keeps a parserState dict (same format as the one built from [GC:...]
+reports) up to date from the lines sent to grbl, so grbl doesn't need
+to be polled with $G.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+# ------------------------------------------------------------------
+# ModalTracker class
+
+class ModalTracker:
+
+  # Modal groups in [GC:...] report order
+  REPORT_GROUPS = [
+    'motion', 'wcs', 'plane', 'units', 'distanceMode', 'feedRateMode',
+    'spindle', 'coolant', 'tool', 'feed', 'speed',
+  ]
+
+  # Value words (letter + number)
+  VALUE_GROUPS = {
+    'tool': 'T',
+    'feed': 'F',
+    'speed': 'S',
+  }
+
+  # Program end resets several modal groups, let grbl tell us how
+  RESYNC_WORDS = ['M2', 'M30']
+
+  def __init__(self, dct, parserState):
+    ''' Construct a ModalTracker object.
+        parserState is updated in place.
+    '''
+    self.dct = dct
+    self.parserState = parserState
+
+    # True when the tracked state can't be trusted (grbl must be queried)
+    self.needsSync = True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stripComments(self, line):
+    ''' Remove (...) and ; comments '''
+    pos = line.find(';')
+    if pos != -1:
+      line = line[:pos]
+
+    pos = line.find('(')
+    while pos != -1:
+      end = line.find(')', pos)
+      if end == -1:
+        return line[:pos]
+      line = line[:pos] + line[end+1:]
+      pos = line.find('(')
+
+    return line
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def formatValue(self, group, value):
+    ''' Format F/S/T values the way grbl reports them '''
+    try:
+      number = float(value)
+    except ValueError:
+      return value
+
+    if group == 'feed' and self.parserState.get('units', {}).get('val') == 'G20':
+      return '{:.1f}'.format(number)
+
+    return '{:.0f}'.format(number)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def track(self, line):
+    ''' Update parser state from a line sent to grbl.
+        Returns True if the parser state changed.
+    '''
+    # System commands ($J= jogs included) don't change the parser state
+    if not line or line[0] == '$':
+      return False
+
+    if '(' in line or ';' in line:
+      line = self.stripComments(line)
+
+    changed = False
+
+    for group, name, value, original in self.dct.classifyBlock(line):
+      if group == 'program':
+        if value in self.RESYNC_WORDS:
+          self.needsSync = True
+        continue
+
+      if group in self.VALUE_GROUPS:
+        value = self.formatValue(group, value)
+        original = self.VALUE_GROUPS[group] + value
+      else:
+        original = value
+
+      current = self.parserState.get(group)
+      if current and current['val'] == value:
+        continue
+
+      self.parserState[group] = {
+        'val': value,
+        'original': original,
+        'desc': name,
+      }
+      changed = True
+
+    return changed
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStateStr(self):
+    ''' Get tracked state as a [GC:...] report string '''
+    words = []
+
+    for group in self.REPORT_GROUPS:
+      if group in self.parserState:
+        words.append(self.parserState[group]['original'])
+
+    return ' '.join(words)
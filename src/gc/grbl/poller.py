@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+'''
+grbl - poller
+=============
+Machine status (?) polling scheduler
+
+The query interval depends on the machine state (fast while moving,
+slow/none while idle), with an immediate query when a motion command
+is queued on an idle machine.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import time
+import collections
+
+# ------------------------------------------------------------------
+# StatusPoller class
+
+class StatusPoller:
+
+  def __init__(self, cfg):
+    ''' Construct a StatusPoller object.
+    '''
+    self.spCfg = cfg['serial']
+    self.intervals = self.spCfg['statusPollIntervals']
+    self.minInterval = self.spCfg['statusPollMinInterval']
+
+    self.RATE_WINDOW = 5
+
+    self.lastQuery = 0
+    self.immediate = False
+    self.queryTimes = collections.deque()
+    self.reportTimes = collections.deque()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getInterval(self, machineState):
+    ''' Get poll interval for a machine state (None: no polling) '''
+    # Hold:0, Door:1...
+    state = machineState.split(':')[0]
+
+    interval = self.intervals.get(state, self.intervals['default'])
+    if not interval:
+      return None
+
+    return max(interval, self.minInterval)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def queryNow(self):
+    ''' Ask for a query as soon as allowed (minInterval) '''
+    self.immediate = True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getNextQueryDelay(self, machineState):
+    ''' Get time left for the next query (None: no polling) '''
+    interval = self.minInterval if self.immediate else self.getInterval(machineState)
+    if interval is None:
+      return None
+
+    return self.lastQuery + interval - time.time()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isQueryDue(self, machineState):
+    ''' Check if it's time for a new query '''
+    delay = self.getNextQueryDelay(machineState)
+    return delay is not None and delay <= 0
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addTime(self, times):
+    ''' Save current time in a rate window '''
+    now = time.time()
+    times.append(now)
+
+    while now - times[0] > self.RATE_WINDOW:
+      times.popleft()
+
+    return now
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def querySent(self):
+    ''' Call this method after sending a query '''
+    self.lastQuery = self.addTime(self.queryTimes)
+    self.immediate = False
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def reportReceived(self):
+    ''' Call this method after receiving a status report '''
+    self.addTime(self.reportTimes)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getRate(self, times):
+    ''' Get events per second in the rate window '''
+    now = time.time()
+    count = len([t for t in times if now - t <= self.RATE_WINDOW])
+    return count / self.RATE_WINDOW
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getRateStr(self, machineState):
+    ''' Get a printable version of the effective polling rate '''
+    interval = self.getInterval(machineState)
+
+    return '{:.1f} queries/s, {:.1f} reports/s (last {:d}s) - {:} interval: {:}'.format(
+      self.getRate(self.queryTimes),
+      self.getRate(self.reportTimes),
+      self.RATE_WINDOW,
+      machineState,
+      '{:.2f}s'.format(interval) if interval else 'no polling')
@@ -10,8 +10,91 @@ if __name__ == '__main__':
 
 import os
 import time
+import threading
+import queue
 import serial
 
+# ------------------------------------------------------------------
+# SerialReaderThread class
+
+class SerialReaderThread(threading.Thread):
+  ''' Serial port reader thread
+      Reads bytes as soon as they arrive, splits them in lines
+      and pushes them into a queue.
+      Lines are queued as bytes (grbl talks ASCII), it's up to the
+      parser to decode the ones it needs as text.
+  '''
+
+  READ_SIZE = 4096
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def __init__(self, serial, outQueue, ui, onLineReceived):
+    super().__init__()
+    self.serial = serial
+    self.outQueue = outQueue
+    self.ui = ui
+    self.onLineReceived = onLineReceived
+    self._stopEvent = threading.Event()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stop(self):
+    self._stopEvent.set()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stopped(self):
+    return self._stopEvent.is_set()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def run(self):
+    # Reusable read buffer, bytes are moved to pending until a line is complete
+    readBuffer = bytearray(self.READ_SIZE)
+    readView = memoryview(readBuffer)
+    pending = bytearray()
+
+    while not self.stopped():
+      try:
+        # Blocks (up to serial timeout) until at least one byte arrives,
+        # then reads everything available in one call
+        readSize = min(max(self.serial.in_waiting, 1), self.READ_SIZE)
+        readLen = self.serial.readinto(readView[:readSize])
+      except Exception as e:
+        if not self.stopped():
+          self.ui.log('EXCEPTION reading serial port: {:}'.format(str(e)), c='ui.errorMsg', v='ERROR')
+        return
+
+      if not readLen:
+        continue
+
+      pending += readView[:readLen]
+
+      # Split complete lines, keep the partial one for the next read
+      start = 0
+      linesQueued = False
+      end = pending.find(b'\n')
+
+      while end != -1:
+        lineEnd = end
+        if lineEnd > start and pending[lineEnd - 1] == 13:  # \r
+          lineEnd -= 1
+
+        if lineEnd > start:
+          self.outQueue.put(bytes(pending[start:lineEnd]))
+          linesQueued = True
+
+        start = end + 1
+        end = pending.find(b'\n', start)
+
+      if start:
+        del pending[:start]
+
+      if linesQueued:
+        for event in self.onLineReceived:
+          event()
+
+
 # ------------------------------------------------------------------
 # SerialPort class
 
@@ -38,12 +121,30 @@ class SerialPort:
       self.serial.port = self.spCfg['portLinux']
       self.portName = self.serial.port
 
+    # Writes can come from different threads (real-time commands)
+    self.writeLock = threading.Lock()
+
+    # Setup reader thread queue
+    self.lineQueue = queue.Queue()
+    self.reader = None
+
+    # Listeners called (FROM THE READER THREAD) when a new line is queued
+    self.onLineReceived = []
+
+    self.DEBUG_LEVEL = self.ui.getVerboseLevelIndex('DEBUG')
+
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def close(self):
     ''' Close the serial port
     '''
     self.ui.log('Closing serial port {:s}...'.format(self.portName))
+
+    if self.reader:
+      self.reader.stop()
+      self.reader.join()
+      self.reader = None
+
     return self.serial.close()
 
 
@@ -68,18 +169,28 @@ class SerialPort:
     except:
       pass
 
+    if self.serial.isOpen():
+      # Discard lines from previous connections
+      self.lineQueue = queue.Queue()
+      self.reader = SerialReaderThread(self.serial, self.lineQueue, self.ui, self.onLineReceived)
+      self.reader.start()
+
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def readline(self):
-    ''' Read a text line
+  def readline(self, timeout=0):
+    ''' Read a line (bytes, no line terminator) from the reader thread queue
+        Waits up to timeout seconds for a line, returns b'' if none available
     '''
-    line = self.serial.readline()
-
-    if line:
-      line = line.decode('utf-8')
-      line = line.strip('\r\n')
+    try:
+      if timeout:
+        line = self.lineQueue.get(timeout=timeout)
+      else:
+        line = self.lineQueue.get_nowait()
+    except queue.Empty:
+      return b''
 
-      self.ui.log('Read line: [{:}]'.format(line), v='DEBUG')
+    if self.ui.getVerboseLevel() >= self.DEBUG_LEVEL:
+      self.ui.log('Read line: [{:}]'.format(line.decode('utf-8', errors='replace')), v='DEBUG')
 
     return line
 
@@ -88,5 +199,15 @@ class SerialPort:
   def write(self,data):
     ''' Write data
     '''
-    return self.serial.write(bytes(data, 'UTF-8'))
+    with self.writeLock:
+      return self.serial.write(bytes(data, 'UTF-8'))
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def writeRealTime(self,command):
+    ''' Write a single-byte real-time command right away
+        (latin-1 keeps extended ASCII commands as one byte)
+    '''
+    with self.writeLock:
+      return self.serial.write(bytes(command, 'latin-1'))
 
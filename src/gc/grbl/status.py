@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+'''
+grbl - status
+=============
+Machine status model
+
+Status reports (<...>) arrive several times per second, so all records
+here use __slots__ and are updated in place (no new objects per report).
+Dict-style access (status['MPos']['x'], 'Ov' in status, ...) is kept
+for existing code.
+
+Reports are parsed straight from the bytes read from the serial port
+(grbl talks ASCII), text is only decoded for the few fields kept as str.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+from . import dict
+
+# Input pin bit masks ('X' => 0x01, 'Y' => 0x02, ...)
+PIN_BITS = {pin: 1 << index for index, pin in enumerate(dict.inputPinStates)}
+
+# Same masks, by byte value (iterating bytes gives ints)
+PIN_CODES = {ord(pin): bit for pin, bit in PIN_BITS.items()}
+
+
+# ------------------------------------------------------------------
+# Record class
+
+class Record:
+  ''' Base class for __slots__ records with dict-style access.
+      Unset slots are reported as missing keys.
+  '''
+  __slots__ = ()
+
+  def __getitem__(self, key):
+    try:
+      return getattr(self, key)
+    except (AttributeError, TypeError):
+      raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    setattr(self, key, value)
+
+  def __contains__(self, key):
+    return key in self.__slots__ and hasattr(self, key)
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def get(self, key, default=None):
+    return getattr(self, key, default) if key in self.__slots__ else default
+
+  def keys(self):
+    return [key for key in self.__slots__ if hasattr(self, key)]
+
+  def asDict(self):
+    ''' Get a plain dict copy (nested records included) '''
+    result = {}
+    for key in self.keys():
+      value = self[key]
+      result[key] = value.asDict() if isinstance(value, Record) else value
+    return result
+
+  def __repr__(self):
+    return '{:}({:})'.format(type(self).__name__, self.asDict())
+
+
+# ------------------------------------------------------------------
+# Small records
+
+class Coords(Record):
+  __slots__ = ('desc', 'x', 'y', 'z')
+
+  def __init__(self, desc):
+    self.desc = desc
+    self.x = 0.000
+    self.y = 0.000
+    self.z = 0.000
+
+
+class Value(Record):
+  __slots__ = ('desc', 'val')
+
+  def __init__(self, desc, val=None):
+    self.desc = desc
+    self.val = val
+
+
+class Buffer(Record):
+  __slots__ = ('desc', 'planeBufferBlocks', 'serialRXBufferBlocks')
+
+  def __init__(self):
+    self.desc = 'buffer'
+    self.planeBufferBlocks = 0
+    self.serialRXBufferBlocks = 0
+
+
+class Override(Record):
+  __slots__ = ('desc', 'feed', 'rapid', 'speed')
+
+  def __init__(self):
+    self.desc = 'override'
+    self.feed = 100
+    self.rapid = 100
+    self.speed = 100
+
+
+# ------------------------------------------------------------------
+# InputPinState class
+
+class InputPinState(Record):
+  ''' Input pin state, kept as a bit mask.
+      status['inputPinState']['P'] still returns {'desc':..., 'val':...}
+  '''
+  __slots__ = ('mask',)
+
+  def __init__(self):
+    self.mask = 0
+
+  def update(self, pinBytes):
+    mask = 0
+    for pin in pinBytes:
+      mask |= PIN_CODES.get(pin, 0)
+    self.mask = mask
+
+  def isSet(self, pin):
+    return bool(self.mask & PIN_BITS[pin])
+
+  def __getitem__(self, pin):
+    return {'desc': dict.inputPinStates[pin], 'val': self.isSet(pin)}
+
+  def __contains__(self, pin):
+    return pin in PIN_BITS
+
+  def keys(self):
+    return list(PIN_BITS)
+
+  def asDict(self):
+    return {pin: self[pin] for pin in PIN_BITS}
+
+
+# ------------------------------------------------------------------
+# MachineStatus class
+
+class MachineStatus(Record):
+  ''' Complete machine status (status reports, settings, parser state...) '''
+  __slots__ = (
+    '_raw', 'machineState',
+    'MPos', 'WPos', 'WCO',
+    'Bf', 'Ln', 'F', 'S', 'Ov', 'A', 'Pn',
+    'inputPinState',
+    'settings', 'parserState', 'GCodeParams',
+    'version', 'buildOptions',
+    'unknown',
+    '_fieldParsers', '_stateNames',
+  )
+
+  def __init__(self):
+    self._raw = b''
+    self.MPos = Coords('machinePos')
+    self.WPos = Coords('workPos')
+    self.WCO = Coords('workCoords')
+    self.Pn = Value('inputPinState', '')
+    self.inputPinState = InputPinState()
+    self.settings = {}
+    self.parserState = {
+      'str': '',
+    }
+    self.GCodeParams = {
+      'G54': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G55': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G56': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G57': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G58': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G59': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G28': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G30': {'x':0.000, 'y':0.000, 'z':0.000},
+      'G92': {'x':0.000, 'y':0.000, 'z':0.000},
+      'PRB': {'x':0.000, 'y':0.000, 'z':0.000, 'success': False},
+      'TLO': 0.000,
+    }
+    self.unknown = {}
+
+    self._fieldParsers = {
+      b'MPos': self.parseMPos,
+      b'WPos': self.parseWPos,
+      b'WCO': self.parseWCO,
+      b'Bf': self.parseBf,
+      b'Ln': self.parseLn,
+      b'F': self.parseF,
+      b'FS': self.parseFS,
+      b'Ov': self.parseOv,
+      b'A': self.parseA,
+    }
+
+    # Decoded machine state names (b'Run' => 'Run'), filled on demand
+    self._stateNames = {}
+
+  @property
+  def str(self):
+    ''' Last status report (decoded on demand) '''
+    return self._raw.decode('utf-8', errors='replace')
+
+  @str.setter
+  def str(self, value):
+    self._raw = value.encode('utf-8') if isinstance(value, str) else value
+
+  def __getitem__(self, key):
+    if key in self.unknown:
+      return self.unknown[key]
+    return super().__getitem__(key)
+
+  def __contains__(self, key):
+    return key == 'str' or key in self.unknown or super().__contains__(key)
+
+  def get(self, key, default=None):
+    return self.str if key == 'str' else super().get(key, default)
+
+  def keys(self):
+    keys = ['str' if key == '_raw' else key for key in super().keys()
+      if key not in ('unknown', '_fieldParsers', '_stateNames')]
+    return keys + list(self.unknown)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getStateName(self, state):
+    ''' Get (cached) str version of a machine state '''
+    name = self._stateNames.get(state)
+    if name is None:
+      name = self._stateNames[state] = state.decode('utf-8', errors='replace')
+    return name
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def update(self, report):
+    ''' Update from a status report (b'<State|Field:value|...>', str accepted) '''
+    if type(report) is not bytes:
+      report = report.encode('utf-8')
+
+    self._raw = report
+    fields = report[1:-1].split(b'|')
+    fieldParsers = self._fieldParsers
+    pinBytes = b''
+
+    # Status is always the first field
+    state = fields[0]
+    self.machineState = self._stateNames.get(state) or self.getStateName(state)
+
+    for field in fields[1:]:
+      name, _, value = field.partition(b':')
+
+      parser = fieldParsers.get(name)
+      if parser:
+        parser(value)
+      elif name == b'Pn':
+        pinBytes = value
+      else:
+        self.unknown[name.decode('utf-8', errors='replace')] = {
+          'desc': 'UNKNOWN',
+          'val': value.decode('utf-8', errors='replace'),
+        }
+
+    # ALWAYS save&parse input pin state (if none comes, it's empty!)
+    if pinBytes:
+      self.Pn.val = pinBytes.decode('ascii', errors='replace')
+      self.inputPinState.update(pinBytes)
+    else:
+      self.Pn.val = ''
+      self.inputPinState.mask = 0
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  # float()/int() accept ASCII bytes directly
+  def setCoords(self, coords, value):
+    coords.x, coords.y, coords.z = map(float, value.split(b','))
+
+  # From: https://github.com/gnea/grbl/wiki/Grbl-v1.1-Interface
+  #  If WPos: is given, use MPos = WPos + WCO.
+  #  If MPos: is given, use WPos = MPos - WCO.
+  def parseMPos(self, value):
+    mPos, wPos, wco = self.MPos, self.WPos, self.WCO
+    self.setCoords(mPos, value)
+    wPos.x = mPos.x - wco.x
+    wPos.y = mPos.y - wco.y
+    wPos.z = mPos.z - wco.z
+
+  def parseWPos(self, value):
+    mPos, wPos, wco = self.MPos, self.WPos, self.WCO
+    self.setCoords(wPos, value)
+    mPos.x = wPos.x + wco.x
+    mPos.y = wPos.y + wco.y
+    mPos.z = wPos.z + wco.z
+
+  def parseWCO(self, value):
+    self.setCoords(self.WCO, value)
+
+  def parseBf(self, value):
+    if not hasattr(self, 'Bf'):
+      self.Bf = Buffer()
+    planeBufferBlocks, serialRXBufferBlocks = value.split(b',')
+    self.Bf.planeBufferBlocks = int(planeBufferBlocks)
+    self.Bf.serialRXBufferBlocks = int(serialRXBufferBlocks)
+
+  def parseLn(self, value):
+    if not hasattr(self, 'Ln'):
+      self.Ln = Value('lineNumber')
+    self.Ln.val = value.decode('ascii', errors='replace')
+
+  def parseF(self, value):
+    if not hasattr(self, 'F'):
+      self.F = Value('feed')
+    self.F.val = int(float(value))
+
+  def parseFS(self, value):
+    feed, speed = value.split(b',')
+    self.parseF(feed)
+    if not hasattr(self, 'S'):
+      self.S = Value('speed')
+    self.S.val = int(float(speed))
+
+  def parseOv(self, value):
+    if not hasattr(self, 'Ov'):
+      self.Ov = Override()
+    feed, rapid, speed = value.split(b',')
+    self.Ov.feed = int(feed)
+    self.Ov.rapid = int(rapid)
+    self.Ov.speed = int(speed)
+
+  def parseA(self, value):
+    if not hasattr(self, 'A'):
+      self.A = Value('accesoryState')
+    self.A.val = value.decode('ascii', errors='replace')
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+'''
+grbl - ticket
+=============
+Sent line tracking
+
+Every line sent to grbl gets a Ticket, queued in send order. grbl answers
+lines in the same order, so each ok/error:N resolves the oldest pending
+ticket, along with the data lines ([...], $n=...) received before it.
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import time
+
+# ------------------------------------------------------------------
+# Ticket class
+
+class Ticket:
+  ''' A line sent to grbl, waiting for (or resolved with) its response.
+      result is None while pending, 'ok'/'error:N' when resolved,
+      '' if cancelled (reset/alarm: grbl flushed its RX buffer).
+  '''
+  __slots__ = (
+    'command', 'lineLen', 'sentTime', 'doneTime',
+    'lines', 'result', 'streamed', 'showResponse', 'callbacks',
+  )
+
+  def __init__(self, command, streamed=False, showResponse=True):
+    self.command = command
+    self.lineLen = len(command) + 1
+    self.sentTime = time.time()
+    self.doneTime = 0
+    self.lines = []
+    self.result = None
+    self.streamed = streamed
+    self.showResponse = showResponse
+    self.callbacks = []
+
+  def __repr__(self):
+    return 'Ticket({:}, {:})'.format(self.command, self.result)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def isDone(self):
+    return self.result is not None
+
+  def isOk(self):
+    return self.result == 'ok'
+
+  def isError(self):
+    return bool(self.result) and self.result != 'ok'
+
+  def isCancelled(self):
+    return self.result == ''
+
+  def getErrorCode(self):
+    ''' Get error code ('' if not an error) '''
+    return self.result[6:] if self.isError() else ''
+
+  def getLatency(self):
+    ''' Get round-trip time (seconds, 0 if still pending) '''
+    return self.doneTime - self.sentTime if self.doneTime else 0
+
+  def getResponse(self):
+    ''' Get all response lines (data lines + ok/error:N) '''
+    if self.result:
+      return self.lines + [self.result]
+    return list(self.lines)
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def addCallback(self, callback):
+    ''' Call callback(ticket) when resolved (right away if already done) '''
+    if self.isDone():
+      callback(self)
+    else:
+      self.callbacks.append(callback)
+
+  def resolve(self, result):
+    ''' Set the response (ok/error:N, '' to cancel) and fire callbacks '''
+    self.result = result
+    self.doneTime = time.time()
+
+    callbacks = self.callbacks
+    self.callbacks = []
+    for callback in callbacks:
+      callback(self)
+
+  def cancel(self):
+    self.resolve('')
@@ -0,0 +1,482 @@
+#!/usr/bin/python3
+'''
+grblCommander - job
+===================
+G-code file job runner
+
+Files are never loaded in memory, lines go through a generator pipeline:
+  readLines() -> cleanLines() -> optimizer.optimizeLines() -> sendLines()
+
+Stopped jobs (alarm, or <ESC>: feed hold and soft reset) can be resumed
+from any line: the file is indexed by line (see gcode/lineindex.py), the
+modal state at that line is rebuilt (see gcode/resume.py) and streaming
+restarts there after a safe Z retract. The line suggested is the oldest one
+grbl may not have finished (the last acknowledged motion lines still in its
+planner), or the one grbl was running if it reports line numbers (Ln: in
+status reports, N words in the file).
+'''
+
+if __name__ == '__main__':
+  print('This file is a module, it should not be executed directly')
+
+import collections
+import os
+import re
+import time
+
+from .gcode import extents
+from .gcode import lineindex
+from .gcode import optimizer
+from .gcode import parallel
+from .gcode import resume
+from .gcode import simulator
+from .gcode import toolpath
+
+lineNumberRE = re.compile(r'^\s*N\s*([0-9]+)', re.I)
+
+# Max wait for a feed hold to stop the machine on cancel (seconds)
+HOLD_TIMEOUT = 10
+
+# ------------------------------------------------------------------
+# Job class
+
+class Job:
+
+  def __init__(self, cfg, kb, ui, mch):
+    ''' Construct a Job object.
+    '''
+    self.mch = mch
+    self.kb = kb
+    self.ui = ui
+    self.cfg = cfg
+
+    self.fileName = ''
+    self.fileSize = 0
+    self.bytesRead = 0
+    self.linesRead = 0
+    self.cancelled = False
+
+    self.optimizer = optimizer.Optimizer(cfg, mch)
+    self.simulator = simulator.Simulator(cfg, mch)
+    toolpathCache = toolpath.ToolpathCache(cfg) if cfg['job']['toolpathCacheSize'] else None
+    self.estimator = parallel.ParallelEstimator(cfg, mch, toolpathCache)
+    self.extents = extents.ExtentsAnalyzer(cfg, mch, self.estimator)
+
+    # Sent lines (source line number, motion) waiting for grbl's response
+    self.sentLines = collections.deque()
+    self.ackedLine = 0
+    self.ackedMotionLines = collections.deque(maxlen=cfg['job']['plannerBlocks'])
+    self.reportedLine = None
+
+    # Where the last stopped job can be resumed (file, line, start state)
+    self.resumeInfo = None
+
+    # Menu used to process keys while running (real-time commands)
+    self.realTimeMenu = None
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getConfig(self):
+    ''' Get working configuration
+    '''
+    return self.cfg
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def readLines(self, fileName, offset=0):
+    ''' Lazily read a G-code file, one line at a time (from a byte offset)
+    '''
+    with open(fileName, 'rb') as file:
+      file.seek(offset)
+      for line in file:
+        self.bytesRead += len(line)
+        self.linesRead += 1
+        yield line.decode('utf-8', errors='replace')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def cleanLines(self, lines):
+    ''' Remove comments, blank lines and program delimiters
+    '''
+    for line in lines:
+      # ; comments
+      pos = line.find(';')
+      if pos != -1:
+        line = line[:pos]
+
+      # (...) comments
+      pos = line.find('(')
+      while pos != -1:
+        end = line.find(')', pos)
+        if end == -1:
+          line = line[:pos]
+          break
+        line = line[:pos] + line[end+1:]
+        pos = line.find('(')
+
+      line = line.strip()
+
+      if not line or line == '%':
+        continue
+
+      yield line
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def processKeys(self):
+    ''' Process pending keys (ESC cancels, other keys go to realTimeMenu)
+        Returns False if the job has been cancelled
+    '''
+    while self.kb.keyPressed():
+      key = self.kb.getKey()
+      if key.n == 'ESC':
+        self.cancelled = True
+        self.stopMachine()
+        return False
+      elif self.realTimeMenu:
+        self.realTimeMenu.parseKey(key)
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stopMachine(self):
+    ''' Stop the lines already sent on cancel: feed hold (decelerates keeping
+        the position), then soft reset (flushes grbl's RX buffer and planner)
+    '''
+    self.ui.log('Cancelling job: feed hold + soft reset', c='ui.msg')
+    self.mch.feedHold()
+
+    startTime = time.time()
+    self.mch.getMachineStatus()
+    while self.mch.getMachineState() in ('Run', 'Jog', 'Hold:1') and not self.mch.alarm:
+      remaining = HOLD_TIMEOUT - (time.time() - startTime)
+      if remaining <= 0 or not self.mch.waitForMachineStateChange(timeout=remaining):
+        break
+
+    self.mch.softReset()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def sendLines(self, lines):
+    ''' Stream lines to the machine
+    '''
+    for line in lines:
+      if not self.processKeys():
+        return False
+
+      # Keep processing keys while grbl's RX buffer is full (e.g. on feed hold)
+      while not self.mch.streamHasRoom(line):
+        if self.mch.alarm or not self.processKeys():
+          return False
+        self.mch.process()
+
+      linesSent = self.mch.streamStats['linesSent']
+      if not self.mch.streamLine(line):
+        return False
+      if self.mch.streamStats['linesSent'] != linesSent:
+        self.sentLines.append((self.linesRead, self.mch.isMotionCommand(line)))
+      self.trackAcks()
+
+    return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def trackAcks(self):
+    ''' Follow acknowledged lines (source line numbers) and the line grbl reports (Ln:)
+    '''
+    stats = self.mch.streamStats
+    while len(self.sentLines) > stats['linesSent'] - stats['linesAcked']:
+      self.ackedLine, motion = self.sentLines.popleft()
+      if motion:
+        self.ackedMotionLines.append(self.ackedLine)
+
+    lineNumber = getattr(self.mch.status, 'Ln', None)
+    if lineNumber is not None:
+      self.reportedLine = lineNumber.val
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def waitForStreamEnd(self):
+    ''' Wait for all streamed lines to be acknowledged (keys are still processed)
+    '''
+    while self.mch.pendingTickets and not self.mch.alarm:
+      if not self.processKeys():
+        break
+      self.mch.process()
+      self.trackAcks()
+
+    self.mch.waitForStreamEnd()
+    self.trackAcks()
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getProgressStr(self):
+    ''' Get a printable version of the job progress
+    '''
+    percent = (self.bytesRead * 100 / self.fileSize) if self.fileSize else 0
+    return 'Read {:d} lines ({:d}/{:d} bytes, {:.1f}%)'.format(
+      self.linesRead,
+      self.bytesRead,
+      self.fileSize,
+      percent)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def check(self, fileName):
+    ''' Simulate a G-code file (no machine motion), show the issues found
+        Returns True if no issues were found
+    '''
+    if not os.path.isfile(fileName):
+      self.ui.log('ERROR: File [{:}] does not exist.'.format(fileName), c='ui.errorMsg')
+      return False
+
+    self.ui.log('Checking [{:}]...'.format(fileName), c='ui.msg')
+    self.simulator.reset()
+    success = self.simulator.checkFile(fileName)
+
+    for issue in self.simulator.issues:
+      self.ui.log(str(issue), c='ui.errorMsg')
+    self.ui.log(self.simulator.getSummaryStr(), c='ui.msg' if success else 'ui.errorMsg')
+
+    return success
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def checkExtents(self, fileName, checked=None):
+    ''' Check a G-code file's extents against machine travel (cached by content)
+        checked (optional) is a Simulator that just checked the file (see check())
+        Returns True if the program fits
+    '''
+    if not os.path.isfile(fileName):
+      self.ui.log('ERROR: File [{:}] does not exist.'.format(fileName), c='ui.errorMsg')
+      return False
+
+    result = self.extents.analyzeFile(fileName, checked)
+
+    self.ui.log(result.getSummaryStr(), c='ui.msg')
+    for problem in result.problems:
+      self.ui.log('Out of travel: {:}'.format(problem), c='ui.errorMsg')
+
+    return not result.problems
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def estimate(self, fileName):
+    ''' Estimate how long a G-code file takes to run (as written, not optimized)
+        Returns an Estimate (None if the file does not exist)
+    '''
+    if not os.path.isfile(fileName):
+      self.ui.log('ERROR: File [{:}] does not exist.'.format(fileName), c='ui.errorMsg')
+      return None
+
+    self.estimator.reset()
+    result = self.estimator.estimateFile(fileName)
+
+    self.ui.log(result.getSummaryStr(), c='ui.msg')
+    if len(result.sections) > 1:
+      for line in result.getSectionStrs(self.cfg['job']['estimateMaxSections']):
+        self.ui.log(line, c='ui.msg')
+    if result.motionTime:
+      self.ui.log(result.getProfileStr(), c='ui.msg')
+
+    return result
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def run(self, fileName, silent=False):
+    ''' Run a G-code file
+    '''
+    if not os.path.isfile(fileName):
+      self.ui.log('ERROR: File [{:}] does not exist.'.format(fileName), c='ui.errorMsg')
+      return False
+
+    self.fileName = fileName
+    self.fileSize = os.path.getsize(fileName)
+    self.bytesRead = 0
+    self.linesRead = 0
+    self.cancelled = False
+
+    if not silent:
+      self.ui.logTitle('Job [{:}] ({:d} bytes)'.format(fileName, self.fileSize))
+
+    # Problems found by the simulator need confirmation (silent jobs are cancelled)
+    success = True
+    checked = None
+    if self.cfg['job']['check']:
+      success = self.check(fileName)
+      checked = self.simulator
+    if self.cfg['job']['extents']:
+      success = self.checkExtents(fileName, checked) and success
+
+    if not success:
+      if silent:
+        self.ui.logBlock('JOB [{:}] CANCELLED'.format(fileName), c='ui.cancelMsg')
+        return False
+      self.ui.log('WARNING: grbl will probably reject some lines or stop with an alarm', c='ui.errorMsg')
+
+    if not silent:
+      if self.cfg['job']['estimate']:
+        self.estimate(fileName)
+
+      self.ui.inputMsg('Press y/Y to execute, any other key to cancel...')
+      key = self.kb.getKey()
+
+      if not key._in('yY'):
+        self.ui.logBlock('JOB [{:}] CANCELLED'.format(fileName), c='ui.cancelMsg')
+        return False
+
+    self.ui.logTitle('Running job [{:}] (<ESC> to cancel)'.format(fileName))
+
+    self.estimator.reset()
+    startState = self.estimator.getParseState()
+    return self.stream(fileName, startState)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def stream(self, fileName, startState, firstLine=1, offset=0, motion=None):
+    ''' Stream a G-code file (from a line and its byte offset), keeping track
+        of where it can be resumed if it stops. motion (G2/G3) is added to
+        the first line relying on it (see resume.prependMotion()).
+        Returns True if the job finished
+    '''
+    self.bytesRead = offset
+    self.linesRead = firstLine - 1
+    self.sentLines.clear()
+    self.ackedLine = 0
+    self.ackedMotionLines.clear()
+    self.reportedLine = None
+
+    self.mch.startStream()
+    self.mch.minimizer.resetStats()
+    self.optimizer.reset()
+    lines = self.optimizer.optimizeLines(self.cleanLines(self.readLines(fileName, offset)))
+    if motion:
+      lines = resume.prependMotion(lines, motion)
+    success = self.sendLines(lines)
+    self.waitForStreamEnd()
+    self.mch.waitForMachineIdle()
+    success = success and not self.cancelled
+
+    self.ui.log(self.getProgressStr(), c='ui.msg')
+    self.ui.log(self.mch.getStreamStatsStr(), c='ui.msg')
+    if self.optimizer.enabled:
+      self.ui.log(self.optimizer.getStatsStr(), c='ui.msg')
+    if self.mch.minimizer.enabled:
+      self.ui.log(self.mch.minimizer.getStatsStr(), c='ui.msg')
+
+    if success:
+      self.resumeInfo = None
+      self.ui.logBlock('JOB [{:}] FINISHED'.format(fileName), c='ui.finishedMsg')
+    else:
+      self.ui.logBlock('JOB [{:}] CANCELLED'.format(fileName), c='ui.cancelMsg')
+      self.setResumeInfo(fileName, startState, firstLine)
+
+    return success
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def setResumeInfo(self, fileName, startState, firstLine):
+    ''' Find (and show) the line a stopped job should be resumed from
+    '''
+    if not self.ackedLine:
+      self.resumeInfo = {'fileName': fileName, 'line': firstLine, 'startState': startState}
+      self.ui.log('Nothing was acknowledged by grbl, resume from line {:d}'.format(firstLine), c='ui.msg')
+      return
+
+    # Without an alarm or a cancel (soft reset) grbl finished every line it
+    # acknowledged (the optimizer may have read one line more than it sent)
+    flushed = self.mch.alarm or self.cancelled
+    if not flushed:
+      line = self.ackedLine if self.optimizer.enabled else self.ackedLine + 1
+    else:
+      line = self.ackedMotionLines[0] if self.ackedMotionLines else self.ackedLine
+
+    index = lineindex.LineIndex(self.cfg, fileName)
+    line = min(line, index.count)
+    detail = 'last acknowledged line {:d}'.format(self.ackedLine)
+
+    # Cross-check with the line number grbl was running (N words)
+    if self.reportedLine:
+      detail += ', grbl reported N{:}'.format(self.reportedLine)
+    if self.reportedLine and flushed:
+      for number in range(self.ackedLine, max(line, firstLine) - 1, -1):
+        match = lineNumberRE.match(index.getLine(number))
+        if match and match.group(1).lstrip('0') == self.reportedLine.lstrip('0'):
+          line = number
+          detail += ' (line {:d})'.format(number)
+          break
+      else:
+        detail += ' (not found in lines {:d}..{:d})'.format(line, self.ackedLine)
+    index.close()
+
+    self.resumeInfo = {'fileName': fileName, 'line': line, 'startState': startState}
+    self.ui.log('Job stopped: {:}. It can be resumed from line {:d}'.format(detail, line), c='ui.msg')
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def resume(self, fileName, lineNumber):
+    ''' Resume a G-code file from a line: rebuild the modal state the
+        program had there, retract to a safe Z and restart streaming
+        Returns True if the job finished
+    '''
+    if not os.path.isfile(fileName):
+      self.ui.log('ERROR: File [{:}] does not exist.'.format(fileName), c='ui.errorMsg')
+      return False
+
+    if self.mch.alarm or self.mch.getMachineState() == 'Alarm':
+      self.ui.log('ERROR: Clear the alarm first (soft reset, then unlock or home the machine).', c='ui.errorMsg')
+      return False
+
+    index = lineindex.LineIndex(self.cfg, fileName)
+    if not 1 <= lineNumber <= index.count:
+      self.ui.log('ERROR: Line {:d} out of range (1..{:d}).'.format(lineNumber, index.count), c='ui.errorMsg')
+      index.close()
+      return False
+
+    self.fileName = fileName
+    self.fileSize = os.path.getsize(fileName)
+    self.cancelled = False
+
+    # The job's start state if it's the one that stopped (grbl's defaults if not)
+    startState = None
+    if self.resumeInfo and self.resumeInfo['fileName'] == fileName:
+      startState = self.resumeInfo['startState']
+
+    self.ui.logTitle('Resume job [{:}] from line {:d}'.format(fileName, lineNumber))
+    parseState = resume.ResumeParser(self.cfg, startState).parseUntil(index, lineNumber)
+    offset = index.getOffset(lineNumber)
+    firstLine = index.getLine(lineNumber)
+    index.close()
+
+    try:
+      preamble = resume.getPreamble(parseState, self.cfg['job']['resumeZFeed'], self.cfg['job']['resumeSpindleDelay'])
+    except ValueError as error:
+      self.ui.log('ERROR: Can\'t resume from line {:d}: {:}'.format(lineNumber, error), c='ui.errorMsg')
+      return False
+
+    self.ui.log('Line {:d}: {:}'.format(lineNumber, firstLine.strip()), c='ui.msg')
+    self.ui.log('Safe Z retract, then:', c='ui.msg')
+    for line in preamble:
+      self.ui.log('  ' + line, c='ui.msg')
+
+    self.ui.inputMsg('Press y/Y to execute, any other key to cancel...')
+    key = self.kb.getKey()
+
+    if not key._in('yY'):
+      self.ui.logBlock('JOB [{:}] CANCELLED'.format(fileName), c='ui.cancelMsg')
+      return False
+
+    self.ui.logTitle('Running job [{:}] from line {:d} (<ESC> to cancel)'.format(fileName, lineNumber))
+
+    self.mch.sendWait('G21 G90')
+    self.mch.goToMachineHome_Z()
+    for line in preamble:
+      response = self.mch.send(line)
+      if not response or response[-1] != 'ok':
+        self.ui.logBlock('JOB [{:}] CANCELLED'.format(fileName), c='ui.cancelMsg')
+        return False
+    self.mch.waitForMachineIdle()
+
+    motion = parseState['state']['motion']
+    return self.stream(fileName, startState, lineNumber, offset, motion if motion in ('G2', 'G3') else None)
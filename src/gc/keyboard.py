@@ -28,6 +28,7 @@ import sys
 import os
 import threading
 import queue
+import codecs
 
 # Windows
 if os.name == 'nt':
@@ -105,17 +106,22 @@ class Key:
 # KBThread class
 
 class KBThread(threading.Thread):
-  ''' Keyboard watcher thread '''
+  ''' Keyboard watcher thread.
+      Sleeps in select() until stdin has data and puts complete keys
+      (single chars or whole escape sequences) in outQueue.
+  '''
 
-  SLEEP_TIME = 0.0005
-  outQueue = None    # Queue for char output
-  lastTime = 0
+  POLL_TIME = 0.1    # Max time blocked in select() (to check pause/stop)
+  MBTIME = 0.01      # Max wait for the rest of a multibyte sequence
+  outQueue = None    # Queue for key output
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def __init__(self, fd, outQueue):
     super().__init__()
     self.fd = fd
     self.outQueue = outQueue
+    self.buffer = ''
+    self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
     self._stopEvent = threading.Event()
     self._runningEvent = threading.Event()
     self.resume()
@@ -150,40 +156,100 @@ class KBThread(threading.Thread):
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def run(self):
     while True:
+      self._runningEvent.wait()
+      if self.stopped():
+        return
 
-      c = None
-      while not c:
-        self._runningEvent.wait()
-        if self.stopped():
-          return
-        c = self._getch()
-        if not c:
-          time.sleep(self.SLEEP_TIME)
+      if not self.buffer and not self._read(self.POLL_TIME):
+        continue
 
-      curTime = time.time()
-      elapsed = curTime - self.lastTime
-      self.lastTime = curTime
+      # Paused while waiting, leave data for input()
+      if self.paused():
+        continue
 
-      self.outQueue.put((c, elapsed,))
+      self.outQueue.put(self._getKeyStr())
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def _getch(self):
-    ''' Returns a keyboard character. '''
+  def _read(self, timeout):
+    ''' Wait up to timeout seconds for keyboard data and add it to the buffer.
+        Returns False if nothing was read.
+    '''
     try:
       if os.name == 'nt':
-        return msvcrt.getch().decode('utf-8')
+        endTime = time.time() + timeout
+        while not msvcrt.kbhit():
+          if time.time() >= endTime or self.paused():
+            return False
+          time.sleep(self.MBTIME)
+        self.buffer += msvcrt.getch().decode('utf-8')
+        return True
 
       else:
-        os.set_blocking(self.fd, False)
-        char = sys.stdin.read(1)
-        os.set_blocking(self.fd, True)
-        return char
+        ready, _, _ = select([self.fd], [], [], timeout)
+        if not ready or self.paused():
+          return False
+        self.buffer += self.decoder.decode(os.read(self.fd, 64))
+        return True
 
     except Exception as e:
       print(
         'keyboard.py: EXCEPTION reading keyboard: {:}'.format(str(e)))
-      return '\0'
+      self.buffer += '\0'
+      return True
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _nextChar(self):
+    ''' Pop next char from the buffer, waiting a bit for it if needed
+        (used to complete multibyte sequences).
+        Returns None if no char arrives.
+    '''
+    if not self.buffer and not self._read(self.MBTIME):
+      return None
+
+    if not self.buffer:
+      return None
+
+    char = self.buffer[0]
+    self.buffer = self.buffer[1:]
+    return char
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def _getKeyStr(self):
+    ''' Get a complete key from the buffer.
+        Escape sequences are assembled here:
+          - <ESC>[ (CSI) / <ESC>O (SS3) + params + final letter (or ~)
+          - <ESC> + char (ALT + char)
+          - <ESC> alone
+    '''
+    keyStr = self._nextChar()
+    if keyStr != '\x1b':
+      return keyStr
+
+    char = self._nextChar()
+    if char is None:
+      return keyStr
+
+    # Another <ESC>, leave it for the next key
+    if char == '\x1b':
+      self.buffer = char + self.buffer
+      return keyStr
+
+    keyStr += char
+    if char not in '[O':
+      return keyStr
+
+    while True:
+      char = self._nextChar()
+      if char is None:
+        return keyStr
+
+      keyStr += char
+
+      if not (char.isdigit() or char == ';'):
+        return keyStr
 
 
 # ------------------------------------------------------------------
@@ -191,16 +257,13 @@ class KBThread(threading.Thread):
 
 class Keyboard:
 
-  MBTIME = 0.001 # MultiByte threshold time
-  nextChar = None
-
   def __init__(self):
     ''' Construct a Keyboard object. '''
     self.initKeyValueConstants()
 
     # Setup keyboard
     if os.name == 'nt':
-      pass
+      self.fd = None
     else:
       # Save the terminal settings
       self.fd = sys.stdin.fileno()
@@ -217,8 +280,8 @@ class Keyboard:
       atexit.register(self.resetTerm)
 
     # Setup listener thread
-    self.charQueue = queue.Queue()
-    self.listener = KBThread(self.fd, self.charQueue)
+    self.keyQueue = queue.Queue()
+    self.listener = KBThread(self.fd, self.keyQueue)
     self.listener.start()
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -228,72 +291,31 @@ class Keyboard:
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def keyPressed(self):
     ''' Returns True if keyboard character was hit, False otherwise. '''
-    return not self.charQueue.empty()
+    return not self.keyQueue.empty()
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def getKey(self, wait=True):
-    ''' Returns a Key object. '''
-
-    if not wait:
-      if not self.keyPressed() and not self.nextChar:
-        return None
-
-    # Wait for a key !!!!
-    while not self.keyPressed() and not self.nextChar:
-      pass
-
-    if self.nextChar:
-      char, elapsed = self.nextChar, 0
-      self.nextChar = None
-    else:
-      char, elapsed = self.charQueue.get_nowait()
-
-    charVal = ord(char)
-
-    cmd = ''
-
-    if charVal == 27:
-      time.sleep(self.MBTIME)
-      if self.keyPressed():
-        cmd += char
-        cmdLen = self.charQueue.qsize()
-        for i in range(cmdLen):
-          char, elapsed = self.charQueue.get_nowait()
-          if elapsed < self.MBTIME:
-            cmd += char
-          else:
-            self.nextChar = char
-            break
-
-    if cmd == '':
-      cmd = None
-
-    key = None
-
-    for name in self.keyList:
-      k = self.keyList[name]
+  def getKey(self, wait=True, timeout=None):
+    ''' Returns a Key object.
+        Blocks (without using CPU) until a key is pressed or timeout
+        seconds have passed (None is returned then).
+    '''
+    try:
+      keyStr = self.keyQueue.get(block=wait, timeout=timeout)
+    except queue.Empty:
+      return None
 
-      if not cmd and type(k.k) is int:
-        if k.k == charVal:
-          key = k
-          break
-      elif type(k.k) is str:
-        if k.k == cmd:
-          key = k
-          break
-      else:
-        pass
+    key = self.keyMap.get(keyStr)
 
     if not key:
-      if cmd:
+      if len(keyStr) > 1:
         arrStr = '['
-        for c in cmd:
+        for c in keyStr:
           arrStr += '{:}, '.format(ord(c))
         arrStr += ']'
 
-        key = Key(n='UNKNOWN_KEY: <ESC>{:} ({:})'.format(cmd[1:], arrStr), k=cmd)
+        key = Key(n='UNKNOWN_KEY: <ESC>{:} ({:})'.format(keyStr[1:], arrStr), k=keyStr)
       else:
-        key = Key(c=char, k=charVal)
+        key = Key(c=keyStr, k=ord(keyStr))
 
     return key
 
@@ -360,6 +382,16 @@ class Keyboard:
     for k in KEY_LIST:
       self.keyList[k] = Key(n=k, **KEY_LIST[k])
 
+    # Key lookup by the string received from the keyboard
+    # (first name wins on duplicates, as in KEY_LIST order)
+    self.keyMap = {}
+
+    for name in self.keyList:
+      k = self.keyList[name]
+      keyStr = chr(k.k) if type(k.k) is int else k.k
+      if keyStr not in self.keyMap:
+        self.keyMap[keyStr] = k
+
 
 # ------------------------------------------------------------------
 # Key list
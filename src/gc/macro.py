@@ -8,10 +8,20 @@ grblCommander macro manager
 if __name__ == '__main__':
   print('This file is a module, it should not be executed directly')
 
+import ast
 import importlib
+import importlib.util
+import sys
 import time
 from pathlib import Path, PurePath
 
+from .gcode import estimator
+from .gcode import extents
+from .gcode import simulator
+
+MACROS_FOLDER = 'src/macros'
+MACROS_PACKAGE = 'src.macros'
+
 # ------------------------------------------------------------------
 # Macro class
 
@@ -28,6 +38,15 @@ class Macro:
 
     self.macros = {}
     self.supportFiles = {}
+    self.failedFiles = set()
+
+    # Loaded files: module name -> (mtime, size) and the macro files each one imports
+    self.fileIndex = {}
+    self.imports = {}
+
+    self.simulator = simulator.Simulator(cfg, mch)
+    self.estimator = estimator.Estimator(cfg, mch)
+    self.extents = extents.ExtentsAnalyzer(cfg, mch)
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -38,30 +57,64 @@ class Macro:
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def load(self, silent=False):
-    ''' TODO: comment
+  def load(self, silent=False, force=False):
+    ''' Load macros, only (re)loading the files changed since the last load
+        (mtime/size) and the files importing them (support files first).
+        force: reload every file
     '''
-    self.macros = {}
-
-    # Reload support files before macros
-    for index in self.supportFiles:
-      try:
-        importlib.reload(self.supportFiles[index])
-      except:
-        pass
-    self.supportFiles = {}
-
-    self.loadFolder('src/macros', silent=silent)
+    files = self.findFiles(MACROS_FOLDER)
+    if force:
+      self.fileIndex = {}
+
+    changed = {name for name, (path, key) in files.items() if self.fileIndex.get(name) != key}
+    removed = set(self.fileIndex) - set(files)
+
+    for name in removed:
+      self.forgetFile(name)
+    for name in changed:
+      self.imports[name] = getImports(name, files[name][0])
+
+    # Files importing changed (or removed) files have to run again
+    dirty = changed | removed
+    while True:
+      importers = {name for name in files if name not in dirty and self.imports.get(name, set()) & dirty}
+      if not importers:
+        break
+      dirty |= importers
+
+    # Imported files first
+    ordered = []
+    visited = set()
+    def addFile(name):
+      if name in visited or name not in dirty or name not in files:
+        return
+      visited.add(name)
+      for importName in sorted(self.imports.get(name, set())):
+        addFile(importName)
+      ordered.append(name)
+
+    for name in files:
+      addFile(name)
+
+    for name in ordered:
+      self.loadFile(name, files[name][1])
 
     if not silent:
+      for name in files:
+        shortName = name[len(MACROS_PACKAGE) + 1:]
+        if shortName in self.macros:
+          self.ui.log('[{:}]'.format(shortName), end=' ')
+        elif name in self.failedFiles:
+          self.ui.log('[{:}]'.format(shortName), c='ui.errorMsg', end=' ')
       self.ui.log()
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-  def loadFolder(self, folder='', silent=False):
-    ''' TODO: comment
+  def findFiles(self, folder):
+    ''' Find macro (and support) files in a folder and its subfolders
+        Returns {moduleName: (path, (mtime, size))} (black listed files skipped)
     '''
-    dotBasePath = 'src.macros.'
+    files = {}
 
     if folder[-1] != '/':
       folder += '/'
@@ -77,7 +130,7 @@ class Macro:
           continue
 
         macroName = dotPath + fileName
-        macroShortName = macroName.replace(dotBasePath,'')
+        macroShortName = macroName[len(MACROS_PACKAGE) + 1:]
 
         blackListed = False
         for item in self.mcrCfg['blackList']:
@@ -89,30 +142,54 @@ class Macro:
           continue
 
         try:
-          tmpModule = __import__(macroName, fromlist=[''])
-          importlib.reload(tmpModule)
-
-          try:
-            tmpMacro = tmpModule.macro
-          except AttributeError:
-            self.supportFiles[macroName] = tmpModule
-            continue
-
-          if 'title' in tmpMacro and 'commands' in tmpMacro:
-            self.macros[macroShortName] = tmpMacro
-            if not silent:
-              self.ui.log('[{:}]'.format(macroShortName), end=' ')
-          else:
-            if not silent:
-              self.ui.log('[{:}]'.format(macroShortName), c='ui.errorMsg', end=' ')
-        except:
-          if not silent:
-            self.ui.log('[{:}]'.format(macroShortName), c='ui.errorMsg', end=' ')
+          fileStat = item.stat()
+        except OSError:
+          continue
+        files[macroName] = (str(item), (fileStat.st_mtime_ns, fileStat.st_size))
 
     for item in Path(folder).glob('*'):
       if item.is_dir():
         folderName = PurePath(item).as_posix()
-        self.loadFolder(folderName, silent=silent)
+        files.update(self.findFiles(folderName))
+
+    return files
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def loadFile(self, macroName, key):
+    ''' (Re)load a macro or support file '''
+    self.forgetFile(macroName)
+    self.fileIndex[macroName] = key
+    macroShortName = macroName[len(MACROS_PACKAGE) + 1:]
+
+    try:
+      tmpModule = sys.modules.get(macroName)
+      if tmpModule is None:
+        tmpModule = importlib.import_module(macroName)
+      else:
+        tmpModule = importlib.reload(tmpModule)
+
+      try:
+        tmpMacro = tmpModule.macro
+      except AttributeError:
+        self.supportFiles[macroName] = tmpModule
+        return
+
+      if 'title' in tmpMacro and 'commands' in tmpMacro:
+        self.macros[macroShortName] = tmpMacro
+      else:
+        self.failedFiles.add(macroName)
+    except:
+      self.failedFiles.add(macroName)
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def forgetFile(self, macroName):
+    ''' Remove a file from the loaded macros (and the file index) '''
+    self.macros.pop(macroName[len(MACROS_PACKAGE) + 1:], None)
+    self.supportFiles.pop(macroName, None)
+    self.failedFiles.discard(macroName)
+    self.fileIndex.pop(macroName, None)
 
 
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -281,6 +358,56 @@ class Macro:
     return True
 
 
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def getCommands(self, name, callStack=None, comments=False):
+    ''' Get the G-code commands a macro sends (subcalls expanded, reserved names skipped)
+        comments: also get header comments (as ; comment lines)
+    '''
+    callStack = (callStack or []) + [name.lower()]
+
+    for command in self.getMacro(name)['commands']:
+      cmdName = command[0] if len(command) > 0 else ''
+
+      if cmdName.lower() == 'startup':
+        cmdName = self.mcrCfg['startup']
+      elif cmdName.lower().split(' ')[0] in self.mcrCfg['reservedNames']:
+        continue
+
+      if not cmdName:
+        if comments and len(command) > 1 and command[1]:
+          yield '; ' + command[1]
+        continue
+
+      if self.isMacro(cmdName):
+        if cmdName.lower() not in callStack:
+          yield from self.getCommands(cmdName, callStack, comments)
+      else:
+        yield cmdName
+
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  def check(self, name):
+    ''' Simulate a macro (no machine motion), show the issues found
+        (line numbers are command numbers, subcalls expanded)
+    '''
+    if self.mcrCfg['autoReload']:
+      self.load(silent=True)
+
+    if not self.getMacro(name):
+      self.ui.log('ERROR: Macro [{:}] does not exist, check config file.'.format(name),
+        c='ui.errorMsg')
+      return False
+
+    self.simulator.reset()
+    success = self.simulator.checkLines(self.getCommands(name))
+
+    for issue in self.simulator.issues:
+      self.ui.log(str(issue), c='ui.errorMsg')
+    self.ui.log(self.simulator.getSummaryStr(), c='ui.msg' if success else 'ui.errorMsg')
+
+    return success
+
+
   # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
   def show(self, name, avoidReload=False):
     ''' TODO: comment
@@ -328,4 +455,44 @@ class Macro:
         self.ui.color(cmdName.ljust(maxCommandLen), cmdColor),
         self.ui.color(cmdComment, commentColor) )
 
+    if self.cfg['job']['extents']:
+      result = self.extents.analyzeLines(self.getCommands(name))
+      block += '\n' + self.ui.color(result.getSummaryStr(), 'ui.msg')
+      for problem in result.problems:
+        block += '\n' + self.ui.color('Out of travel: {:}'.format(problem), 'ui.errorMsg')
+      block += '\n'
+
+    if self.cfg['job']['estimate']:
+      self.estimator.reset()
+      result = self.estimator.estimateLines(self.getCommands(name, comments=True))
+      block += '\n' + self.ui.color(result.getSummaryStr(), 'ui.msg') + '\n'
+
     self.ui.logBlock(block)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+def getImports(macroName, path):
+  ''' Get the macro package modules a file imports (from its source) '''
+  try:
+    tree = ast.parse(Path(path).read_bytes())
+  except (OSError, SyntaxError, ValueError):
+    return set()
+
+  package = macroName.rpartition('.')[0]
+  imports = set()
+
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      names = [alias.name for alias in node.names]
+    elif isinstance(node, ast.ImportFrom):
+      try:
+        base = importlib.util.resolve_name('.' * node.level + (node.module or ''), package)
+      except (ImportError, ValueError):
+        continue
+      names = [base] + [base + '.' + alias.name for alias in node.names]
+    else:
+      continue
+
+    imports.update(name for name in names if name.startswith(MACROS_PACKAGE + '.'))
+
+  return imports